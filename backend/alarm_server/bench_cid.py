@@ -0,0 +1,80 @@
+"""Microbenchmark del decodificador Contact ID.
+
+Compara el decodificador por tablas de alarm_server.cid con una versión
+ingenua que compila la regex y recorre los dígitos en cada llamada.
+
+Uso (desde backend/):
+    python -m alarm_server.bench_cid --messages 200000
+"""
+import argparse
+import random
+import re
+import time
+
+from alarm_server import cid
+
+
+def naive_decode(message: str) -> dict:
+    """Decodificación por regex compilada en cada llamada (referencia)"""
+    text = message.replace(' ', '').strip().upper()
+    match = re.compile(r'^([0-9B-F]{4})(18|98)([136])([0-9B-F]{3})([0-9B-F]{2})([0-9B-F]{3})([0-9B-F])?$').match(text)
+    if not match:
+        raise ValueError(message)
+    if match.group(7):
+        total = sum(10 if c == '0' else int(c, 16) for c in text)
+        if total % 15:
+            raise ValueError(message)
+    return {
+        'account': match.group(1),
+        'qualifier': match.group(3),
+        'event_code': match.group(4),
+        'partition': match.group(5),
+        'zone_user': match.group(6),
+    }
+
+
+def build_messages(count: int) -> list:
+    rnd = random.Random(42)
+    codes = ['130', '110', '301', '384', '401', '602']
+    messages = []
+    for _ in range(count):
+        message = cid.encode(
+            f'{rnd.randint(1000, 9999)}', rnd.choice('136'), rnd.choice(codes),
+            f'{rnd.randint(1, 8):02d}', f'{rnd.randint(1, 999):03d}'
+        )
+        messages.append(message if rnd.random() < 0.5 else f'{message[:4]} {message[4:6]} '
+                        f'{message[6:10]} {message[10:12]} {message[12:15]} {message[15]}')
+    return messages
+
+
+def measure(decode, messages: list, rounds: int) -> float:
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for message in messages:
+            decode(message)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(messages) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmark del decodificador Contact ID')
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    messages = build_messages(args.messages)
+    for message in messages[:1000]:
+        event = cid.decode(message)
+        assert naive_decode(message)['zone_user'] == event.zone_user
+
+    naive = measure(naive_decode, messages, args.rounds)
+    table = measure(cid.decode, messages, args.rounds)
+    print(f'mensajes:      {args.messages}')
+    print(f'regex:         {naive:,.0f} msg/s')
+    print(f'tablas:        {table:,.0f} msg/s ({table / naive:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Benchmark de throughput del decodificador de tramas (tramas/segundo).
+
+Uso (desde backend/):
+    python -m alarm_server.bench_framing --frames 200000 --chunk 1460
+"""
+import argparse
+import random
+import time
+
+from alarm_server.framing import FrameDecoder, build_ack, crc16
+
+
+def build_stream(count: int) -> bytes:
+    """Genera un flujo mixto de tramas SIA legacy, DC-09 y Contact ID"""
+    rnd = random.Random(42)
+    parts = []
+    for i in range(count):
+        account = f'{rnd.randint(1000, 9999)}'
+        kind = i % 3
+        if kind == 0:
+            parts.append(f'["{account}"]120000,101826|BA|{rnd.randint(1, 8)}\n'.encode())
+        elif kind == 1:
+            body = f'"SIA-DCS"{i % 10000:04d}L0#{account}[#{account}|NFA{rnd.randint(1, 99):02d}]'.encode()
+            parts.append(b'\n' + f'{crc16(body):04X}0{len(body):03X}'.encode() + body + b'\r')
+        else:
+            parts.append(f'{account} 18 1130 01 {rnd.randint(1, 999):03d}\r\n'.encode())
+    return b''.join(parts)
+
+
+def run(stream: bytes, chunk: int) -> int:
+    decoder = FrameDecoder()
+    total = 0
+    for start in range(0, len(stream), chunk):
+        for frame in decoder.feed(stream[start:start + chunk]):
+            build_ack(frame)
+            total += 1
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del framing de la receptora')
+    parser.add_argument('--frames', type=int, default=200000)
+    parser.add_argument('--chunk', type=int, default=1460, help='Tamaño de segmento TCP simulado')
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    stream = build_stream(args.frames)
+    best = None
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        parsed = run(stream, args.chunk)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        assert parsed == args.frames, f'Se esperaban {args.frames} tramas, se parsearon {parsed}'
+
+    print(f'tramas:        {args.frames}')
+    print(f'bytes:         {len(stream)}')
+    print(f'segmento:      {args.chunk} bytes')
+    print(f'tiempo:        {best:.3f} s')
+    print(f'throughput:    {args.frames / best:,.0f} tramas/s')
+
+
+if __name__ == '__main__':
+    main()
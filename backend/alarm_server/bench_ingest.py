@@ -0,0 +1,146 @@
+"""Benchmark de ingesta: inserción fila a fila vs lotes con group commit.
+
+Simula N paneles concurrentes que envían eventos y miden la latencia hasta
+el ACK (evento confirmado en la base). Necesita una base accesible con la
+configuración de app.config.database y al menos un panel en alarm_panels.
+Los eventos generados se marcan con raw_message 'BENCH ...' y se borran al
+terminar.
+
+Uso (desde backend/):
+    python -m alarm_server.bench_ingest --events 5000 --producers 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime
+
+from app.config.database import get_db_connection
+from alarm_server.db import AsyncDBPool
+from alarm_server.ingest import EventBatcher, IngestEvent, insert_events
+
+BENCH_TAG = 'BENCH'
+
+
+def make_event(panel_id: int, i: int) -> IngestEvent:
+    return IngestEvent(
+        panel_id=panel_id, event_type='SIA', raw_message=f'{BENCH_TAG} {i}',
+        code='BA', qualifier='B', zone_user=str(i % 8 + 1), timestamp=datetime.now()
+    )
+
+
+def insert_per_row(panel_id: int, i: int):
+    """Ruta anterior: conexión, INSERT, commit y cierre por cada trama"""
+    conn = get_db_connection()
+    try:
+        insert_events(conn, [make_event(panel_id, i)])
+    finally:
+        conn.close()
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_producers(events: int, producers: int, send) -> dict:
+    latencies = []
+    counter = iter(range(events))
+
+    async def producer():
+        for i in counter:
+            start = time.perf_counter()
+            await send(i)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(producer() for _ in range(producers)))
+    elapsed = time.perf_counter() - start
+    return {
+        'events_per_sec': events / elapsed,
+        'p50_ack_ms': statistics.median(latencies),
+        'p99_ack_ms': percentile(latencies, 99),
+    }
+
+
+async def bench_per_row(panel_id: int, events: int, producers: int) -> dict:
+    loop = asyncio.get_running_loop()
+
+    async def send(i):
+        await loop.run_in_executor(None, insert_per_row, panel_id, i)
+
+    return await run_producers(events, producers, send)
+
+
+async def bench_batched(panel_id: int, events: int, producers: int, max_batch: int, max_delay: float) -> dict:
+    db = AsyncDBPool()
+    db.open()
+    batcher = EventBatcher(db, max_batch=max_batch, max_delay=max_delay)
+    task = asyncio.create_task(batcher.run())
+
+    async def send(i):
+        await batcher.submit(make_event(panel_id, i))
+
+    try:
+        result = await run_producers(events, producers, send)
+    finally:
+        task.cancel()
+        db.close()
+    result['avg_batch'] = batcher.stats['events'] / max(batcher.stats['batches'], 1)
+    return result
+
+
+def cleanup():
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM events WHERE raw_message LIKE %s", (f'{BENCH_TAG} %',))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def first_panel_id() -> int:
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM alarm_panels ORDER BY id LIMIT 1")
+            row = cur.fetchone()
+    finally:
+        conn.close()
+    if not row:
+        raise SystemExit("No hay paneles en alarm_panels; cree uno antes de correr el benchmark")
+    return row[0]
+
+
+def report(name: str, result: dict):
+    line = (f"{name:<10} {result['events_per_sec']:>10,.0f} ev/s   "
+            f"p50 {result['p50_ack_ms']:>8.2f} ms   p99 {result['p99_ack_ms']:>8.2f} ms")
+    if 'avg_batch' in result:
+        line += f"   lote medio {result['avg_batch']:.1f}"
+    print(line)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Benchmark de ingesta de eventos')
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--producers', type=int, default=200, help='Paneles concurrentes')
+    parser.add_argument('--max-batch', type=int, default=500)
+    parser.add_argument('--max-delay', type=float, default=0.005)
+    parser.add_argument('--skip-per-row', action='store_true')
+    args = parser.parse_args()
+
+    panel_id = first_panel_id()
+    try:
+        if not args.skip_per_row:
+            report('fila', await bench_per_row(panel_id, args.events, args.producers))
+        report('lotes', await bench_batched(
+            panel_id, args.events, args.producers, args.max_batch, args.max_delay
+        ))
+    finally:
+        cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
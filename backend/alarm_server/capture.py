@@ -0,0 +1,148 @@
+"""Captura binaria del tráfico crudo que recibe la receptora.
+
+Registra, por conexión, los bytes tal como llegaron del socket con su
+instante relativo al inicio de la captura, para poder reproducir incidentes
+con alarm_server.replay.
+
+Formato de archivo (.alcap):
+    encabezado:  MAGIC (8 bytes) | inicio en epoch (f64)
+    registro:    tipo (u8) | conexión (u32) | segundos desde el inicio (f64) | longitud (u32) | datos
+Tipos: OPEN (datos = "transporte ip:puerto"), DATA (bytes recibidos), CLOSE.
+Los datagramas UDP se registran como DATA de una conexión por origen.
+
+Los archivos rotan al superar max_file_bytes. Para inspeccionar uno:
+    python -m alarm_server.capture captures/capture-20240101-120000.alcap
+"""
+import argparse
+import logging
+import os
+import struct
+import time
+from datetime import datetime
+from typing import Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'ALRMCAP1'
+FILE_HEADER = struct.Struct('<8sd')
+RECORD = struct.Struct('<BIdI')
+OPEN, DATA, CLOSE = 1, 2, 3
+SUFFIX = '.alcap'
+
+
+class TrafficCapture:
+    def __init__(self, directory: str, max_file_bytes: int = 256 * 1024 * 1024,
+                 flush_interval: float = 1.0):
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        self.flush_interval = flush_interval
+        self.file = None
+        self.path: Optional[str] = None
+        self.start = 0.0
+        self.size = 0
+        self.next_conn = 1
+        self.udp_conns: Dict[Tuple, int] = {}
+        self.open_conns: Dict[int, bytes] = {}
+        self._last_flush = 0.0
+        self.closed = False
+        self.stats = {'records': 0, 'bytes': 0, 'files': 0}
+
+    def _rotate(self):
+        if self.file:
+            self.file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f"capture-{datetime.now():%Y%m%d-%H%M%S-%f}{SUFFIX}")
+        self.file = open(self.path, 'wb', buffering=1024 * 1024)
+        self.start = time.monotonic()
+        self.file.write(FILE_HEADER.pack(MAGIC, time.time()))
+        self.size = FILE_HEADER.size
+        self.stats['files'] += 1
+        logger.info(f"Capturando tráfico en {self.path}")
+        # Las conexiones abiertas se vuelven a declarar en el archivo nuevo
+        for conn_id, peer in self.open_conns.items():
+            self._write(OPEN, conn_id, peer)
+
+    def _write(self, kind: int, conn_id: int, data: bytes = b''):
+        if self.closed:
+            return
+        if self.file is None or self.size >= self.max_file_bytes:
+            self._rotate()
+        now = time.monotonic()
+        self.file.write(RECORD.pack(kind, conn_id, now - self.start, len(data)))
+        self.file.write(data)
+        self.size += RECORD.size + len(data)
+        self.stats['records'] += 1
+        self.stats['bytes'] += len(data)
+        if now - self._last_flush >= self.flush_interval:
+            self.file.flush()
+            self._last_flush = now
+
+    def open(self, addr, transport: str = 'tcp') -> int:
+        conn_id = self.next_conn
+        self.next_conn += 1
+        peer = f"{transport} {addr[0]}:{addr[1]}".encode() if addr else transport.encode()
+        self.open_conns[conn_id] = peer
+        self._write(OPEN, conn_id, peer)
+        return conn_id
+
+    def data(self, conn_id: int, data: bytes):
+        self._write(DATA, conn_id, data)
+
+    def close_conn(self, conn_id: int):
+        self.open_conns.pop(conn_id, None)
+        self._write(CLOSE, conn_id)
+
+    def datagram(self, addr, data: bytes):
+        conn_id = self.udp_conns.get(addr)
+        if conn_id is None:
+            conn_id = self.udp_conns[addr] = self.open(addr, 'udp')
+        self.data(conn_id, data)
+
+    def close(self):
+        if self.file:
+            for conn_id in list(self.open_conns):
+                self.close_conn(conn_id)
+            self.file.close()
+            self.file = None
+        self.closed = True
+
+    def metrics(self) -> dict:
+        return {'file': self.path, **self.stats}
+
+
+def read_capture(path: str) -> Iterator[Tuple[int, int, float, bytes]]:
+    """Recorre un archivo de captura: (tipo, conexión, segundos, datos)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, _ = FILE_HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} no es un archivo de captura")
+    offset = FILE_HEADER.size
+    while offset + RECORD.size <= len(data):
+        kind, conn_id, t, length = RECORD.unpack_from(data, offset)
+        start = offset + RECORD.size
+        if start + length > len(data):
+            break  # Registro incompleto (captura cortada)
+        yield kind, conn_id, t, data[start:start + length]
+        offset = start + length
+
+
+def capture_start(path: str) -> float:
+    with open(path, 'rb') as f:
+        _, start = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+    return start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Muestra el contenido de una captura de tráfico')
+    parser.add_argument('path')
+    args = parser.parse_args()
+
+    names = {OPEN: 'OPEN', DATA: 'DATA', CLOSE: 'CLOSE'}
+    print(f"inicio: {datetime.fromtimestamp(capture_start(args.path))}")
+    for kind, conn_id, t, data in read_capture(args.path):
+        print(f"{t:12.6f}  #{conn_id:<6} {names.get(kind, kind):<5} {data!r}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Decodificador de Ademco Contact ID.
+
+Formato completo (16 dígitos): ACCT MT Q EEE GG CCC S
+
+* ACCT: cuenta (4 dígitos hex, sin el dígito A)
+* MT:   tipo de mensaje, 18 (o 98)
+* Q:    calificador: 1 nuevo evento / apertura, 3 restauración / cierre, 6 repetición
+* EEE:  código de evento
+* GG:   partición
+* CCC:  zona o usuario
+* S:    checksum, tal que la suma de todos los dígitos sea múltiplo de 15
+        (el dígito 0 vale 10)
+
+También se aceptan los formatos que entregan algunas receptoras y los
+comunicadores IP: con espacios, sin checksum, y el bloque de datos de
+SIA DC-09 "ADM-CID" (Q EEE GG CCC con la cuenta en el encabezado).
+
+Todo el trabajo se hace con tablas precalculadas por byte, sin regex.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+MESSAGE_TYPES = (b'18', b'98')
+QUALIFIERS = frozenset(b'136')
+
+# Valor de cada byte ASCII para el checksum (0 vale 10); 0xFF = inválido
+_DIGITS = '0123456789BCDEF'
+_VALUES = (10, 1, 2, 3, 4, 5, 6, 7, 8, 9, 11, 12, 13, 14, 15)
+_DIGIT_VALUE = bytearray(b'\xff' * 256)
+for _char, _value in zip(_DIGITS.encode() + _DIGITS.lower().encode(), _VALUES * 2):
+    _DIGIT_VALUE[_char] = _value
+_DIGIT_VALUE = bytes(_DIGIT_VALUE)
+_VALUE_DIGIT = dict(zip(_VALUES, _DIGITS))
+
+# Bytes que se descartan antes de decodificar (separadores habituales)
+_STRIP = b' \t\r\n'
+_INVALID = 0xFF
+
+
+class CIDError(ValueError):
+    """Mensaje Contact ID mal formado"""
+
+
+@dataclass(frozen=True)
+class CIDEvent:
+    account: str
+    qualifier: str
+    event_code: str
+    partition: str
+    zone_user: str
+    message_type: str = '18'
+    checksum_ok: Optional[bool] = None   # None si el mensaje no traía checksum
+
+    @property
+    def code(self) -> str:
+        """Código tal como figura en event_codes (calificador + evento)"""
+        return self.qualifier + self.event_code
+
+
+def checksum_digit(digits: bytes) -> str:
+    """Dígito de checksum que completa digits a un múltiplo de 15"""
+    total = sum(digits.translate(_DIGIT_VALUE))
+    return _VALUE_DIGIT[(15 - total % 15) % 15 or 15]
+
+
+def encode(account: str, qualifier: str, event_code: str, partition: str = '01',
+           zone_user: str = '000', message_type: str = '18') -> str:
+    """Arma un mensaje Contact ID completo con su checksum"""
+    body = f'{account:0>4}{message_type}{qualifier}{event_code:0>3}{partition:0>2}{zone_user:0>3}'
+    return body + checksum_digit(body.encode())
+
+
+def _digit_values(data: bytes) -> bytes:
+    values = data.translate(_DIGIT_VALUE)
+    if _INVALID in values:
+        raise CIDError(f'dígitos inválidos en {data!r}')
+    return values
+
+
+def _decode_event_block(account: str, block: bytes, message_type: str,
+                        checksum_ok: Optional[bool]) -> CIDEvent:
+    # block = Q EEE GG CCC (9 dígitos)
+    if block[0] not in QUALIFIERS:
+        raise CIDError(f'calificador inválido: {chr(block[0])!r}')
+    return CIDEvent(
+        account=account,
+        qualifier=chr(block[0]),
+        event_code=block[1:4].decode(),
+        partition=block[4:6].decode(),
+        zone_user=block[6:9].decode(),
+        message_type=message_type,
+        checksum_ok=checksum_ok,
+    )
+
+
+def decode(message) -> CIDEvent:
+    """Decodifica un mensaje Contact ID completo (con o sin checksum)"""
+    data = message.encode('ascii', 'replace') if isinstance(message, str) else bytes(message)
+    data = data.translate(None, _STRIP).upper()
+    if len(data) not in (15, 16):
+        raise CIDError(f'longitud inválida ({len(data)}): {message!r}')
+    values = _digit_values(data)
+
+    message_type = data[4:6]
+    if message_type not in MESSAGE_TYPES:
+        raise CIDError(f'tipo de mensaje inválido: {message_type!r}')
+
+    checksum_ok = None
+    if len(data) == 16:
+        checksum_ok = sum(values) % 15 == 0
+        if not checksum_ok:
+            raise CIDError(f'checksum inválido: {message!r}')
+
+    return _decode_event_block(data[:4].decode(), data[6:15], message_type.decode(), checksum_ok)
+
+
+def decode_dc09(account: str, data: str) -> CIDEvent:
+    """Decodifica el bloque de datos de una trama DC-09 ADM-CID: '#ACCT|Q EEE GG CCC'"""
+    raw = data.encode('ascii', 'replace')
+    if b'|' in raw:
+        prefix, _, raw = raw.partition(b'|')
+        if prefix.startswith(b'#') and len(prefix) > 1:
+            account = prefix[1:].decode()
+    block = raw.translate(None, _STRIP).upper()
+    if len(block) != 9:
+        raise CIDError(f'bloque ADM-CID inválido: {data!r}')
+    _digit_values(block)
+    return _decode_event_block(account, block, '18', None)
+
+
+def is_cid(message) -> bool:
+    try:
+        decode(message)
+        return True
+    except CIDError:
+        return False
@@ -0,0 +1,130 @@
+"""Agrupación de tormentas de eventos por panel, código y zona.
+
+Un corte de AC o una zona que rebota mandan cientos de tramas iguales por
+minuto. El primer evento de cada (panel, protocolo, código, partición, zona)
+pasa directo a la ingesta, sin demora, sea cual sea su prioridad, y abre un
+grupo. Los de prioridad 1 (robo, fuego, pánico) nunca se agrupan: cada uno
+llega a la ingesta como evento propio para que el operador lo vea.
+
+Las repeticiones que llegan mientras el grupo está abierto no crean filas:
+cada una pasa por la ingesta como actualización (IngestEvent.repeat) del
+repeat_count y last_timestamp de la fila del primer evento, y se confirma al
+panel recién cuando es durable, igual que cualquier otro evento. En el
+journal ocupan un registro cada una, pero insert_events aplica solo la de
+mayor total por lote, así que la tormenta cuesta una fila y a lo sumo un
+UPDATE por lote en la tabla events. El grupo se cierra cuando pasan window
+segundos sin repeticiones o cuando lleva max_hold segundos abierto; la
+siguiente trama igual vuelve a crear una fila.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Group:
+    opened: float
+    last_seen: float
+    first: object
+    # True cuando la fila del primer evento es durable, False si no se guardó
+    stored: asyncio.Future
+    repeats: int = 0
+
+
+def event_key(event) -> Tuple:
+    return (event.panel_id, event.event_type, event.code, event.partition, event.zone_user)
+
+
+class EventCoalescer:
+    def __init__(self, ingest, window: float = 10.0, max_hold: float = 60.0,
+                 max_groups: int = 20000):
+        self.ingest = ingest
+        self.window = window
+        self.max_hold = max_hold
+        self.max_groups = max_groups
+        self.groups: "OrderedDict[Tuple, _Group]" = OrderedDict()
+        self.stats = {
+            'passed': 0,
+            'priority': 0,
+            'coalesced': 0,
+            'storms': 0,
+            'forced_closes': 0,
+        }
+
+    async def submit(self, event):
+        """Entrega el evento a la ingesta, o la repetición si hay un grupo abierto"""
+        if event.priority == 1:
+            await self.ingest.submit(event)
+            self.stats['priority'] += 1
+            return
+
+        now = time.monotonic()
+        key = event_key(event)
+        group = self.groups.get(key)
+        if group is not None:
+            await self._submit_repeat(key, group, event, now)
+            return
+
+        # El grupo se abre antes de esperar a la ingesta para que las copias
+        # que llegan en el mismo segmento ya cuenten como repeticiones
+        group = _Group(opened=now, last_seen=now, first=event,
+                       stored=asyncio.get_running_loop().create_future())
+        self.groups[key] = group
+        try:
+            await self.ingest.submit(event)
+        except Exception:
+            # El panel reintentará; las repeticiones en espera reciben NAK
+            if self.groups.get(key) is group:
+                del self.groups[key]
+            group.stored.set_result(False)
+            raise
+        group.stored.set_result(True)
+        self.stats['passed'] += 1
+        while len(self.groups) > self.max_groups:
+            # Sin lugar: se cierra el grupo con actividad más vieja
+            self.groups.popitem(last=False)
+            self.stats['forced_closes'] += 1
+
+    async def _submit_repeat(self, key: Tuple, group: _Group, event, now: float):
+        # La actualización solo tiene sentido si la fila del primero existe
+        if not await asyncio.shield(group.stored):
+            raise RuntimeError(f"El primer evento {event.code} del panel {event.panel_id} no se guardó")
+        group.repeats += 1
+        group.last_seen = now
+        if group.repeats == 1:
+            self.stats['storms'] += 1
+        if self.groups.get(key) is group:
+            self.groups.move_to_end(key)
+        await self.ingest.submit(replace(
+            group.first,
+            repeat_count=group.repeats + 1,
+            last_timestamp=event.timestamp,
+            repeat=True,
+        ))
+        self.stats['coalesced'] += 1
+
+    def flush_expired(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        expired = [
+            key for key, group in self.groups.items()
+            if now - group.last_seen >= self.window or now - group.opened >= self.max_hold
+        ]
+        for key in expired:
+            del self.groups[key]
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(min(self.window, self.max_hold) / 4)
+            self.flush_expired()
+
+    async def close(self):
+        """Cierra los grupos abiertos (sus repeticiones ya se guardaron al confirmarlas)"""
+        self.groups.clear()
+
+    def metrics(self) -> dict:
+        return {'open_groups': len(self.groups), **self.stats}
@@ -0,0 +1,74 @@
+"""Control de conexiones de la receptora.
+
+Limita la cantidad de sockets abiertos (en total y por IP), define los
+tiempos máximos sin datos (idle) y sin tramas completas (heartbeat) y lleva
+la cuenta de rechazos y desalojos para las métricas.
+"""
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ConnectionLimits:
+    max_connections: int = 2000
+    max_per_ip: int = 50              # los concentradores abren varias conexiones
+    idle_timeout: float = 120.0       # segundos sin recibir bytes
+    heartbeat_timeout: float = 300.0  # segundos sin recibir una trama completa
+    read_size: int = 4096
+    max_buffer: int = 64 * 1024       # bytes pendientes sin formar trama
+    ingest_high_water: int = 8000     # eventos en cola a partir de los que se deja de leer
+    backpressure_delay: float = 0.01
+
+
+class ConnectionGovernor:
+    def __init__(self, limits: Optional[ConnectionLimits] = None):
+        self.limits = limits or ConnectionLimits()
+        self.active = 0
+        self.per_ip: Counter = Counter()
+        self.stats = {
+            'accepted': 0,
+            'max_active': 0,
+            'rejected_max_connections': 0,
+            'rejected_per_ip': 0,
+            'evicted_idle': 0,
+            'evicted_heartbeat': 0,
+            'evicted_buffer': 0,
+            'backpressure_waits': 0,
+        }
+
+    def admit(self, ip: str) -> bool:
+        """Registra una conexión nueva si no supera los límites"""
+        if self.active >= self.limits.max_connections:
+            self.stats['rejected_max_connections'] += 1
+            logger.warning(f"Conexión de {ip} rechazada: límite de {self.limits.max_connections} conexiones")
+            return False
+        if self.per_ip[ip] >= self.limits.max_per_ip:
+            self.stats['rejected_per_ip'] += 1
+            logger.warning(f"Conexión de {ip} rechazada: límite de {self.limits.max_per_ip} conexiones por IP")
+            return False
+        self.active += 1
+        self.per_ip[ip] += 1
+        self.stats['accepted'] += 1
+        self.stats['max_active'] = max(self.stats['max_active'], self.active)
+        return True
+
+    def release(self, ip: str):
+        self.active -= 1
+        self.per_ip[ip] -= 1
+        if self.per_ip[ip] <= 0:
+            del self.per_ip[ip]
+
+    def evict(self, reason: str, addr: tuple):
+        self.stats[f'evicted_{reason}'] += 1
+        logger.warning(f"Conexión con {addr} cerrada por {reason}")
+
+    def metrics(self) -> dict:
+        return {
+            'active': self.active,
+            'ips': len(self.per_ip),
+            **self.stats,
+        }
@@ -0,0 +1,120 @@
+"""Acceso a la base desde el event loop de la receptora sin bloquearlo.
+
+psycopg2 es síncrono, así que cada operación se ejecuta en un pool de hilos
+acotado con su propio pool de conexiones (una conexión por hilo como máximo).
+Si todas las conexiones están ocupadas la operación espera en el semáforo
+sin ocupar un hilo, y esa espera queda registrada en las métricas.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+from psycopg2.pool import ThreadedConnectionPool
+
+from app.config.database import DB_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDBPool:
+    def __init__(self, minconn: int = 2, maxconn: int = 10):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.pool: Optional[ThreadedConnectionPool] = None
+        self.executor = ThreadPoolExecutor(max_workers=maxconn, thread_name_prefix='alarm-db')
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.in_use = 0
+        self.waiting = 0
+        self.stats = {
+            'acquired': 0,
+            'errors': 0,
+            'max_in_use': 0,
+            'max_waiting': 0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+        }
+
+    def _opened(self, pool: ThreadedConnectionPool):
+        self.pool = pool
+        self.semaphore = asyncio.Semaphore(self.maxconn)
+        logger.info(f"Pool de conexiones de la receptora abierto ({self.minconn}-{self.maxconn})")
+
+    def open(self):
+        if self.pool is None:
+            self._opened(ThreadedConnectionPool(self.minconn, self.maxconn, **DB_CONFIG))
+
+    async def connect(self):
+        """Abre el pool en un hilo: con la base caída la conexión inicial puede demorar"""
+        if self.pool is not None:
+            return
+        loop = asyncio.get_running_loop()
+        pool = await loop.run_in_executor(
+            self.executor, partial(ThreadedConnectionPool, self.minconn, self.maxconn, **DB_CONFIG)
+        )
+        if self.pool is None:
+            self._opened(pool)
+        else:
+            # Otra tarea lo abrió mientras tanto
+            pool.closeall()
+
+    def _call(self, fn: Callable, args: tuple) -> Any:
+        conn = self.pool.getconn()
+        broken = False
+        try:
+            return fn(conn, *args)
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.pool.putconn(conn, close=broken or bool(conn.closed))
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Ejecuta fn(conn, *args) en un hilo del pool con una conexión prestada"""
+        if self.pool is None:
+            await self.connect()
+        start = time.perf_counter()
+        self.waiting += 1
+        self.stats['max_waiting'] = max(self.stats['max_waiting'], self.waiting)
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        wait_ms = (time.perf_counter() - start) * 1000
+        self.stats['wait_ms_total'] += wait_ms
+        self.stats['wait_ms_max'] = max(self.stats['wait_ms_max'], wait_ms)
+        self.stats['acquired'] += 1
+
+        self.in_use += 1
+        self.stats['max_in_use'] = max(self.stats['max_in_use'], self.in_use)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self._call, fn, args)
+        except Exception:
+            self.stats['errors'] += 1
+            raise
+        finally:
+            self.in_use -= 1
+            self.semaphore.release()
+
+    def metrics(self) -> dict:
+        acquired = self.stats['acquired']
+        return {
+            'size': self.maxconn,
+            'in_use': self.in_use,
+            'waiting': self.waiting,
+            'saturation': self.in_use / self.maxconn,
+            'avg_wait_ms': self.stats['wait_ms_total'] / acquired if acquired else 0.0,
+            **self.stats,
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        if self.pool is not None:
+            self.pool.closeall()
+            self.pool = None
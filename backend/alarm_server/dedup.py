@@ -0,0 +1,88 @@
+"""Supresión de tramas duplicadas.
+
+Cuando el ACK llega tarde el panel retransmite la misma trama, y sin filtro
+cada retransmisión termina como una fila nueva en events. La ventana guarda
+las claves (cuenta, secuencia o timestamp, código, partición, zona) vistas en
+los últimos horizon segundos, repartidas en buckets de tiempo: agregar y
+consultar es O(1) y al avanzar el tiempo se descarta el bucket más viejo
+entero. Si un bucket llega a max_entries / buckets claves se rota antes de
+tiempo, así que la memoria queda acotada aunque llegue una ráfaga.
+
+Una trama sin secuencia ni timestamp (Contact ID, SIA sin hora) no se
+distingue de un segundo evento real idéntico, así que para ella solo se
+filtra la copia exacta que llega por la misma conexión.
+"""
+import time
+from collections import deque
+from typing import Deque, Hashable, Optional, Set
+
+from alarm_server.framing import Frame
+
+
+def frame_key(frame: Frame, addr: tuple) -> tuple:
+    """Clave de deduplicación de una trama SIA o Contact ID recibida desde addr"""
+    if frame.sequence or frame.timestamp:
+        return (
+            frame.account,
+            frame.sequence or frame.timestamp,
+            frame.code,
+            frame.partition,
+            frame.zone,
+        )
+    # Sin secuencia ni timestamp: solo la misma trama por la misma conexión
+    return (addr, frame.raw)
+
+
+class DedupWindow:
+    def __init__(self, horizon: float = 30.0, buckets: int = 6, max_entries: int = 200000,
+                 start: Optional[float] = None):
+        self.horizon = horizon
+        self.bucket_span = horizon / buckets
+        self.max_bucket = max(1, max_entries // buckets)
+        self.buckets: Deque[Set[Hashable]] = deque([set() for _ in range(buckets)], maxlen=buckets)
+        self.bucket_start = time.monotonic() if start is None else start
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'rotations': 0,
+            'forced_rotations': 0,
+        }
+
+    def _rotate(self, now: float):
+        elapsed = now - self.bucket_start
+        if elapsed < self.bucket_span:
+            return
+        # Si pasó más de un horizonte completo se vacían todos los buckets
+        steps = int(elapsed // self.bucket_span)
+        for _ in range(min(steps, self.buckets.maxlen)):
+            self.buckets.append(set())
+        self.bucket_start += steps * self.bucket_span
+        self.stats['rotations'] += steps
+
+    def add(self, key: Hashable, now: Optional[float] = None) -> bool:
+        """Registra la clave; devuelve False si ya estaba dentro del horizonte"""
+        self._rotate(time.monotonic() if now is None else now)
+        for bucket in self.buckets:
+            if key in bucket:
+                self.stats['hits'] += 1
+                return False
+
+        current = self.buckets[-1]
+        if len(current) >= self.max_bucket:
+            self.buckets.append(set())
+            self.stats['forced_rotations'] += 1
+            current = self.buckets[-1]
+        current.add(key)
+        self.stats['misses'] += 1
+        return True
+
+    def discard(self, key: Hashable):
+        """Olvida una clave (la trama no se pudo persistir y se espera la retransmisión)"""
+        for bucket in self.buckets:
+            bucket.discard(key)
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self.buckets)
+
+    def metrics(self) -> dict:
+        return {'size': len(self), **self.stats}
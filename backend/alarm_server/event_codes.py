@@ -0,0 +1,112 @@
+"""Tabla de códigos de evento (event_codes) en memoria.
+
+Se carga al iniciar la receptora y se consulta por (protocolo, código) sin
+tocar la base en la ruta de cada trama. Un trigger sobre event_codes emite
+EVENT_CODES_CHANNEL y la tabla se recarga completa (son pocas filas).
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from alarm_server.db import AsyncDBPool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRIORITY = 3
+
+
+@dataclass(frozen=True)
+class EventCode:
+    protocol: str
+    code: str
+    description: str
+    priority: int
+    requires_action: bool
+
+
+def fetch_event_codes(conn) -> list:
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT protocol, code, description, priority, requires_action
+            FROM event_codes
+        """)
+        return cur.fetchall()
+
+
+def default_sia_priority(code: str) -> int:
+    """Prioridad para códigos SIA que no están en la tabla: las alarmas (xA) primero"""
+    if len(code) == 2 and code[1] == 'A':
+        return 1
+    return DEFAULT_PRIORITY
+
+
+def default_cid_priority(qualifier: str, event_code: str) -> int:
+    """Prioridad para códigos CID que no están en la tabla.
+
+    Los eventos nuevos de la familia 1xx (médico, incendio, pánico, robo)
+    son alarmas; el resto se trata con la prioridad por defecto.
+    """
+    if qualifier == '1' and event_code[:1] == '1':
+        return 1
+    return DEFAULT_PRIORITY
+
+
+class EventCodeTable:
+    def __init__(self, db: AsyncDBPool):
+        self.db = db
+        self.codes: Dict[Tuple[str, str], EventCode] = {}
+        self.reloads = 0
+        # Una sola recarga por vez; las notificaciones que llegan durante ella
+        # se juntan en una única recarga más al terminar
+        self._reload: Optional[asyncio.Task] = None
+        self._reload_again = False
+
+    async def load(self):
+        rows = await self.db.run(fetch_event_codes)
+        self.codes = {
+            (protocol, code): EventCode(protocol, code, description,
+                                        priority if priority is not None else DEFAULT_PRIORITY,
+                                        bool(requires_action))
+            for protocol, code, description, priority, requires_action in rows
+        }
+        self.reloads += 1
+        logger.info(f"Tabla de códigos de evento cargada: {len(self.codes)} códigos")
+
+    def handle_notification(self, payload: str):
+        """Recarga la tabla cuando cambia event_codes"""
+        if self._reload is not None and not self._reload.done():
+            # La recarga en curso pudo leer la tabla antes de este cambio
+            self._reload_again = True
+            return
+        self._reload = asyncio.create_task(self._reload_loop())
+
+    async def _reload_loop(self):
+        while True:
+            self._reload_again = False
+            try:
+                await self.load()
+            except Exception as e:
+                logger.error(f"Error recargando la tabla de códigos de evento: {e}")
+            if not self._reload_again:
+                return
+
+    def get(self, protocol: str, code: str) -> Optional[EventCode]:
+        return self.codes.get((protocol, code))
+
+    def classify_sia(self, code: str) -> Tuple[int, Optional[str]]:
+        """(prioridad, descripción) para un código SIA"""
+        entry = self.codes.get(('SIA', code))
+        if entry:
+            return entry.priority, entry.description
+        return default_sia_priority(code), None
+
+    def classify_cid(self, qualifier: str, event_code: str) -> Tuple[int, Optional[str]]:
+        """(prioridad, descripción) para un evento Contact ID"""
+        entry = self.codes.get(('CID', qualifier + event_code))
+        if entry:
+            return entry.priority, entry.description
+        return default_cid_priority(qualifier, event_code), None
+
+    def __len__(self) -> int:
+        return len(self.codes)
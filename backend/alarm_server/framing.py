@@ -0,0 +1,276 @@
+"""Framing y parseo de tramas de la receptora de alarmas.
+
+Soporta tres formatos sobre el mismo flujo TCP:
+
+* SIA "legacy" terminado en LF/CR:  ["1234"]HHMMSS,MMDDYY|BA|1
+* Contact ID terminado en LF/CR:    1234 18 1130 01 015
+* SIA DC-09 con CRC y longitud:     <LF>CRC0LLL"SIA-DCS"0001L0#1234[#1234|NBA01]_ts<CR>
+
+El decodificador es incremental: acumula bytes en un buffer, extrae todas
+las tramas completas que haya (varias tramas por segmento o una trama
+partida en varios segmentos) y deja el resto para la siguiente lectura.
+"""
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+from alarm_server import cid
+from alarm_server.cid import CIDEvent
+
+LF = 0x0A
+CR = 0x0D
+
+ACK = b'\x06'
+NAK = b'\x15'
+
+# Longitud máxima de una trama sin terminador antes de descartarla
+MAX_FRAME_SIZE = 1024
+
+# Patrones precompilados (se compilan una sola vez al importar el módulo)
+SIA_PATTERN = re.compile(r'^\["([^"]+)"\]\s*([^|]*)\|(.+)$')
+DC09_PATTERN = re.compile(
+    r'^"(?P<id>\*?[A-Z-]+)"(?P<seq>\d{4})'
+    r'(?:R(?P<rcvr>[0-9A-F]{1,6}))?L(?P<pref>[0-9A-F]{1,6})'
+    r'#(?P<acct>[0-9A-F]{3,16})\[(?P<data>[^\]]*)\](?P<ts>_.*)?$'
+)
+DC09_SIA_DATA_PATTERN = re.compile(r'^#?[0-9A-F]*\|?N?(?:ri(?P<part>\d+))?/?(?P<code>[A-Z]{2})(?P<zone>[0-9A-F]*)')
+
+_HEX_DIGITS = frozenset(b'0123456789ABCDEFabcdef')
+
+
+def _crc16_table() -> List[int]:
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC16_TABLE = _crc16_table()
+
+
+def crc16(data: bytes) -> int:
+    """CRC-16/ARC usado por SIA DC-09 (polinomio 0x8005 reflejado)"""
+    crc = 0
+    table = _CRC16_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+@dataclass
+class Frame:
+    """Trama individual ya delimitada y parseada"""
+    raw: bytes
+    protocol: str                 # SIA, CID, NULL o UNKNOWN
+    transport: str = 'LINE'       # LINE (terminada en LF/CR) o DC09
+    account: Optional[str] = None
+    timestamp: Optional[str] = None
+    data: Optional[str] = None
+    code: Optional[str] = None
+    zone: Optional[str] = None
+    partition: Optional[str] = None
+    sequence: Optional[str] = None
+    receiver: Optional[str] = None
+    prefix: Optional[str] = None
+    cid: Optional[CIDEvent] = None
+    valid: bool = True
+    error: Optional[str] = None
+
+    @property
+    def message(self) -> str:
+        return self.raw.decode('ascii', errors='replace').strip()
+
+
+def parse_line(line: bytes) -> Frame:
+    """Parsea una trama terminada en LF/CR (SIA legacy o Contact ID)"""
+    text = line.decode('ascii', errors='replace').strip()
+
+    match = SIA_PATTERN.match(text)
+    if match:
+        account, timestamp, data = match.groups()
+        code, _, zone = data.partition('|')
+        return Frame(
+            raw=line, protocol='SIA', account=account,
+            timestamp=timestamp.strip() or None, data=data,
+            code=code[:2], zone=zone or None
+        )
+
+    try:
+        event = cid.decode(text)
+    except cid.CIDError as e:
+        if text[:1].isdigit():
+            return Frame(raw=line, protocol='CID', data=text, valid=False, error=str(e))
+        return Frame(raw=line, protocol='UNKNOWN', valid=False, error='formato no reconocido')
+    return _cid_frame(Frame(raw=line, protocol='CID', data=text), event)
+
+
+def _cid_frame(frame: Frame, event: CIDEvent) -> Frame:
+    frame.cid = event
+    frame.account = event.account
+    frame.code = event.code
+    frame.partition = event.partition
+    frame.zone = event.zone_user
+    return frame
+
+
+def parse_dc09(raw: bytes, body: bytes, crc_ok: bool) -> Frame:
+    """Parsea el cuerpo de una trama DC-09 (desde la primera comilla hasta antes del CR)"""
+    text = body.decode('ascii', errors='replace')
+    match = DC09_PATTERN.match(text)
+    if not match:
+        return Frame(raw=raw, protocol='UNKNOWN', transport='DC09',
+                     valid=False, error='cuerpo DC-09 inválido')
+
+    token = match.group('id')
+    frame = Frame(
+        raw=raw, protocol='UNKNOWN', transport='DC09',
+        account=match.group('acct'), sequence=match.group('seq'),
+        receiver=match.group('rcvr'), prefix=match.group('pref'),
+        data=match.group('data'), timestamp=(match.group('ts') or '')[1:] or None
+    )
+
+    if not crc_ok:
+        frame.valid = False
+        frame.error = 'CRC inválido'
+    elif token.startswith('*'):
+        frame.valid = False
+        frame.error = 'mensaje cifrado no soportado'
+    elif token == 'NULL':
+        frame.protocol = 'NULL'
+    elif token == 'SIA-DCS':
+        frame.protocol = 'SIA'
+        sia = DC09_SIA_DATA_PATTERN.match(frame.data)
+        if sia:
+            frame.code = sia.group('code')
+            frame.zone = sia.group('zone') or None
+            frame.partition = sia.group('part')
+    elif token == 'ADM-CID':
+        frame.protocol = 'CID'
+        try:
+            _cid_frame(frame, cid.decode_dc09(frame.account, frame.data))
+        except cid.CIDError as e:
+            frame.valid = False
+            frame.error = str(e)
+    else:
+        frame.valid = False
+        frame.error = f'token DC-09 no soportado: {token}'
+
+    return frame
+
+
+def build_dc09(token: str, frame: Frame, data: str = '') -> bytes:
+    """Construye una trama DC-09 (usada para ACK/NAK) con CRC y longitud"""
+    if token == 'NAK':
+        stamp = datetime.utcnow().strftime('_%H:%M:%S,%m-%d-%Y')
+        body = f'"NAK"0000R0L0A0[]{stamp}'
+    else:
+        receiver = f'R{frame.receiver}' if frame.receiver else ''
+        body = (f'"{token}"{frame.sequence or "0000"}{receiver}'
+                f'L{frame.prefix or "0"}#{frame.account or "0"}[{data}]')
+    payload = body.encode('ascii')
+    header = f'{crc16(payload):04X}0{len(payload):03X}'.encode('ascii')
+    return b'\n' + header + payload + b'\r'
+
+
+def build_ack(frame: Frame, accepted: bool = True) -> bytes:
+    """Respuesta que corresponde a una trama: ACK/NAK DC-09 o byte ACK/NAK.
+
+    accepted=False indica que la trama era válida pero no se pudo persistir,
+    para que el panel la retransmita.
+    """
+    ok = frame.valid and accepted
+    if frame.transport == 'DC09':
+        return build_dc09('ACK' if ok else 'NAK', frame)
+    return ACK if ok else NAK
+
+
+def _dc09_header(buf: bytearray, pos: int) -> int:
+    """Devuelve la longitud declarada si en pos empieza un encabezado DC-09, o -1"""
+    # LF + CRC(4 hex) + '0' + longitud(3 hex)
+    if buf[pos + 5] != 0x30:
+        return -1
+    for i in range(pos + 1, pos + 9):
+        if buf[i] not in _HEX_DIGITS:
+            return -1
+    return int(buf[pos + 6:pos + 9], 16)
+
+
+class FrameDecoder:
+    """Decodificador incremental de tramas para una conexión"""
+
+    def __init__(self, max_frame_size: int = MAX_FRAME_SIZE):
+        self.buffer = bytearray()
+        self.max_frame_size = max_frame_size
+        self.discarded_bytes = 0
+
+    def feed(self, data: bytes) -> List[Frame]:
+        """Agrega datos al buffer y devuelve todas las tramas completas"""
+        buf = self.buffer
+        buf += data
+        frames: List[Frame] = []
+        pos = 0
+        size = len(buf)
+
+        while pos < size:
+            byte = buf[pos]
+
+            if byte == LF and size - pos >= 9:
+                length = _dc09_header(buf, pos)
+                if length >= 0:
+                    end = pos + 9 + length
+                    if end >= size:
+                        break  # Trama DC-09 incompleta
+                    if buf[end] == CR:
+                        body = bytes(buf[pos + 9:end])
+                        crc_ok = int(buf[pos + 1:pos + 5], 16) == crc16(body)
+                        frames.append(parse_dc09(bytes(buf[pos:end + 1]), body, crc_ok))
+                        pos = end + 1
+                        continue
+                    # Longitud inconsistente: se trata el LF como separador
+            elif byte == LF and size - pos < 9 and self._may_be_dc09(buf, pos, size):
+                break  # Posible encabezado DC-09 todavía incompleto
+
+            if byte == LF or byte == CR:
+                pos += 1
+                continue
+
+            # Trama de línea: hasta el siguiente LF o CR
+            end_lf = buf.find(b'\n', pos)
+            end_cr = buf.find(b'\r', pos)
+            if end_lf < 0:
+                end = end_cr
+            elif end_cr < 0:
+                end = end_lf
+            else:
+                end = min(end_lf, end_cr)
+
+            if end < 0:
+                if size - pos > self.max_frame_size:
+                    self.discarded_bytes += size - pos
+                    pos = size
+                break
+
+            frames.append(parse_line(bytes(buf[pos:end])))
+            pos = end + 1
+
+        del buf[:pos]
+        return frames
+
+    @staticmethod
+    def _may_be_dc09(buf: bytearray, pos: int, size: int) -> bool:
+        for i in range(pos + 1, size):
+            if i == pos + 5:
+                if buf[i] != 0x30:
+                    return False
+            elif buf[i] not in _HEX_DIGITS:
+                return False
+        return True
+
+    @property
+    def pending(self) -> int:
+        """Bytes en el buffer que todavía no forman una trama completa"""
+        return len(self.buffer)
@@ -0,0 +1,91 @@
+"""Fuzzing del decodificador Contact ID.
+
+Parte del corpus alarm_server/fuzz/cid_corpus.txt y aplica mutaciones
+aleatorias (cambio, inserción y borrado de bytes, truncado). Cada entrada
+debe decodificarse o fallar con CIDError; cualquier otra excepción es un
+error del decodificador. También verifica que decode(encode(...)) devuelva
+los mismos campos.
+
+Uso (desde backend/):
+    python -m alarm_server.fuzz_cid --iterations 100000 --seed 1
+"""
+import argparse
+import os
+import random
+import sys
+
+from alarm_server import cid
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'fuzz', 'cid_corpus.txt')
+ALPHABET = b'0123456789ABCDEFabcdef |#\r\n\x00\xff'
+
+
+def load_corpus(path: str = CORPUS) -> list:
+    with open(path, 'rb') as f:
+        return [line.rstrip(b'\n') for line in f if line.strip() and not line.startswith(b'# ')]
+
+
+def mutate(rnd: random.Random, data: bytes) -> bytes:
+    buf = bytearray(data)
+    for _ in range(rnd.randint(1, 4)):
+        op = rnd.randrange(4)
+        pos = rnd.randint(0, len(buf))
+        if op == 0 and buf:
+            buf[min(pos, len(buf) - 1)] = rnd.choice(ALPHABET)
+        elif op == 1:
+            buf.insert(pos, rnd.choice(ALPHABET))
+        elif op == 2 and buf:
+            del buf[min(pos, len(buf) - 1)]
+        else:
+            del buf[pos:]
+    return bytes(buf)
+
+
+def check(data: bytes) -> bool:
+    for decode in (cid.decode, lambda d: cid.decode_dc09('1234', d.decode('latin-1'))):
+        try:
+            decode(data)
+        except cid.CIDError:
+            pass
+        except Exception as e:
+            print(f'{type(e).__name__} con {data!r}: {e}')
+            return False
+    return True
+
+
+def check_roundtrip(rnd: random.Random) -> bool:
+    fields = (
+        ''.join(rnd.choice('0123456789BCDEF') for _ in range(4)),
+        rnd.choice('136'),
+        f'{rnd.randint(0, 999):03d}',
+        f'{rnd.randint(0, 99):02d}',
+        f'{rnd.randint(0, 999):03d}',
+    )
+    event = cid.decode(cid.encode(*fields))
+    decoded = (event.account, event.qualifier, event.event_code, event.partition, event.zone_user)
+    if decoded != fields or not event.checksum_ok:
+        print(f'Ida y vuelta incorrecta: {fields} -> {decoded}')
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fuzzing del decodificador Contact ID')
+    parser.add_argument('--iterations', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    rnd = random.Random(seed)
+    corpus = load_corpus()
+    failures = sum(not check(entry) for entry in corpus)
+    for _ in range(args.iterations):
+        failures += not check(mutate(rnd, rnd.choice(corpus)))
+        failures += not check_roundtrip(rnd)
+
+    print(f'semilla {seed}: {len(corpus)} entradas, {args.iterations} mutaciones, {failures} fallas')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Ingesta de eventos con group commit.
+
+Los eventos parseados se encolan y unos pocos escritores los insertan en
+lotes (INSERT multi-fila) dentro de una sola transacción. El lote se cierra al
+llegar a max_batch eventos o cuando pasan max_delay segundos desde el primer
+evento encolado. Cada productor espera a que su lote esté confirmado en la
+base antes de enviar el ACK al panel.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+from alarm_server.db import AsyncDBPool
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IngestEvent:
+    panel_id: int
+    event_type: str
+    raw_message: str
+    code: Optional[str]
+    qualifier: Optional[str] = None
+    event_code: Optional[str] = None
+    partition: Optional[str] = None
+    zone_user: Optional[str] = None
+    timestamp: Optional[datetime] = None
+    priority: int = 3
+    description: Optional[str] = None
+    repeat_count: int = 1
+    last_timestamp: Optional[datetime] = None
+    # Repetición de un evento ya guardado (ver coalesce.py): en lugar de otra
+    # fila se actualizan repeat_count y last_timestamp de la fila del primero
+    repeat: bool = False
+
+
+EVENT_COLUMNS = tuple(f.name for f in fields(IngestEvent) if f.name != 'repeat')
+INSERT_EVENTS = f"INSERT INTO events ({', '.join(EVENT_COLUMNS)}) VALUES %s"
+
+# La fila del primer evento se identifica por panel, código, zona y su
+# timestamp exacto (el UPDATE usa idx_events_timestamp). GREATEST hace que
+# aplicar dos veces la misma repetición (el journal reintenta lotes) no cambie nada
+REPEAT_KEY = ('panel_id', 'event_type', 'code', 'partition', 'zone_user', 'timestamp')
+UPDATE_REPEATS = """
+    UPDATE events AS e
+    SET repeat_count = GREATEST(e.repeat_count, v.repeat_count),
+        last_timestamp = GREATEST(e.last_timestamp, v.last_timestamp)
+    FROM (VALUES %s) AS v(panel_id, event_type, code, partition, zone_user, timestamp,
+                          repeat_count, last_timestamp)
+    WHERE e.panel_id = v.panel_id
+      AND e.timestamp = v.timestamp
+      AND e.event_type = v.event_type
+      AND e.code = v.code
+      AND e.partition IS NOT DISTINCT FROM v.partition
+      AND e.zone_user IS NOT DISTINCT FROM v.zone_user
+"""
+REPEAT_TEMPLATE = '(%s::int, %s, %s, %s, %s, %s::timestamptz, %s::int, %s::timestamptz)'
+
+
+def insert_events(conn, events: List[IngestEvent]):
+    """Inserta un lote de eventos y aplica sus repeticiones en una única transacción"""
+    rows = [tuple(getattr(e, c) for c in EVENT_COLUMNS) for e in events if not e.repeat]
+    # De varias repeticiones del mismo evento en el lote alcanza con la de mayor total
+    repeats = {}
+    for e in events:
+        if e.repeat:
+            key = tuple(getattr(e, c) for c in REPEAT_KEY)
+            if key not in repeats or e.repeat_count > repeats[key].repeat_count:
+                repeats[key] = e
+    with conn.cursor() as cur:
+        # Las filas nuevas primero: el primer evento puede venir en el mismo lote
+        if rows:
+            execute_values(cur, INSERT_EVENTS, rows, page_size=len(rows))
+        if repeats:
+            execute_values(cur, UPDATE_REPEATS,
+                           [key + (e.repeat_count, e.last_timestamp) for key, e in repeats.items()],
+                           template=REPEAT_TEMPLATE, page_size=len(repeats))
+    conn.commit()
+
+
+class EventBatcher:
+    def __init__(self, db: AsyncDBPool, max_batch: int = 500, max_delay: float = 0.005,
+                 max_queue: int = 10000, writers: int = 2):
+        self.db = db
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.writers = writers
+        self.queue: "asyncio.Queue[Tuple[IngestEvent, asyncio.Future]]" = asyncio.Queue(max_queue)
+        self.stats = {
+            'events': 0,
+            'batches': 0,
+            'errors': 0,
+            'last_batch_size': 0,
+            'last_flush_ms': 0.0,
+        }
+
+    async def submit(self, event: IngestEvent):
+        """Encola un evento y espera a que su lote quede confirmado"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((event, future))
+        await future
+
+    async def _collect(self) -> List[Tuple[IngestEvent, asyncio.Future]]:
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            # Primero vaciar lo que ya está encolado sin esperar
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.max_batch or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        """Lanza los escritores; cada uno tiene como máximo un lote en vuelo"""
+        await asyncio.gather(*(self._writer() for _ in range(self.writers)))
+
+    async def _writer(self):
+        while True:
+            batch = await self._collect()
+            events = [event for event, _ in batch]
+            start = time.perf_counter()
+            try:
+                await self.db.run(insert_events, events)
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Error insertando lote de {len(events)} eventos: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                # Para flush(): el lote ya no está pendiente, se haya insertado o no
+                for _ in batch:
+                    self.queue.task_done()
+
+            self.stats['events'] += len(events)
+            self.stats['batches'] += 1
+            self.stats['last_batch_size'] = len(events)
+            self.stats['last_flush_ms'] = (time.perf_counter() - start) * 1000
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+    def backlog(self) -> int:
+        """Eventos encolados que todavía no se insertaron"""
+        return self.queue.qsize()
+
+    async def flush(self, timeout: float = 10.0):
+        """Espera a que se inserte lo encolado (al detener la receptora, antes de cancelar run)"""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Eventos sin insertar al cerrar: {self.queue.qsize()} en cola")
+
+    def metrics(self) -> dict:
+        return {'queue_depth': self.queue.qsize(), **self.stats}
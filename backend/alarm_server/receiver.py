@@ -1,75 +1,346 @@
 import asyncio
 import logging
 from datetime import datetime
-from typing import Optional
-import re
+from typing import List, Optional
 import socket
-from app.config.database import get_db_connection
+from app.config.database import EVENT_CODES_CHANNEL, PANELS_CHANNEL
+from app.core.pg_listener import PgListener
+from alarm_server.framing import (
+    Frame, FrameDecoder, SIA_PATTERN, build_ack, parse_line
+)
+from alarm_server import cid
+from alarm_server.capture import TrafficCapture
+from alarm_server.coalesce import EventCoalescer
+from alarm_server.connections import ConnectionGovernor, ConnectionLimits
+from alarm_server.db import AsyncDBPool
+from alarm_server.dedup import DedupWindow, frame_key
+from alarm_server.event_codes import EventCodeTable
+from alarm_server.ingest import EventBatcher, IngestEvent
+from alarm_server.registry import PanelInfo, PanelRegistry
+from alarm_server.spool import EventSpool, orphan_directories
+from alarm_server.supervision import PanelSupervisor
+from alarm_server.udp import AlarmDatagramProtocol
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Espera máxima entre intentos de cargar el registro con la base caída
+LOAD_RETRY_MAX = 5.0
+
 class AlarmReceiver:
-    def __init__(self, host: str = '127.0.0.1', port: int = 9999):
+    def __init__(self, host: str = '127.0.0.1', port: int = 9999,
+                 db_min_connections: int = 2, db_max_connections: int = 10,
+                 stats_interval: float = 60.0, reuse_port: bool = False,
+                 spool_dir: Optional[str] = 'spool',
+                 limits: Optional[ConnectionLimits] = None, udp: bool = True,
+                 dedup_horizon: float = 30.0, coalesce_window: float = 10.0,
+                 ingest=None, capture_dir: Optional[str] = None,
+                 orphan_spools: Optional[List[str]] = None, supervise: bool = True):
         self.host = host
         self.port = port
+        self.reuse_port = reuse_port
         self.clients = {}
+        self.connections = ConnectionGovernor(limits)
+        # Captura opcional del tráfico crudo para reproducirlo con alarm_server.replay
+        self.capture = TrafficCapture(capture_dir) if capture_dir else None
+        # DC-09 por UDP en el mismo número de puerto que TCP
+        self.udp = AlarmDatagramProtocol(self) if udp else None
+        # Retransmisiones del panel dentro del horizonte: se confirman sin insertar
+        self.dedup = DedupWindow(dedup_horizon) if dedup_horizon > 0 else None
+        self.stats_interval = stats_interval
+        self.db = AsyncDBPool(db_min_connections, db_max_connections)
+        self.registry = PanelRegistry(self.db)
+        self.event_codes = EventCodeTable(self.db)
+        # Registro, códigos y supervisión cargados (ver _load)
+        self.loaded = asyncio.Event()
+        self.listener = PgListener()
+        self.listener.subscribe(PANELS_CHANNEL, self.registry.handle_notification)
+        self.listener.subscribe(EVENT_CODES_CHANNEL, self.event_codes.handle_notification)
+        self.listener.on_connect = self._resync_registry
+        self._listener_connects = 0
+        self.server: Optional[asyncio.AbstractServer] = None
+        # Con journal local el ACK sale al quedar el evento en disco y el
+        # journal lo vuelca a la base; sin él, al confirmarse el lote en la base
+        # (ingest permite inyectar otro destino, p. ej. en los benchmarks)
+        self.spool = EventSpool(self.db, spool_dir) if spool_dir and ingest is None else None
+        self.ingest = ingest or self.spool or EventBatcher(self.db)
+        # Journals sin dueño (otra cantidad de workers u otro modo) que este
+        # proceso vuelca además del suyo; por defecto, todos los de spool_dir
+        if self.spool and orphan_spools is None:
+            orphan_spools = orphan_directories(spool_dir, [spool_dir])
+        self.orphan_spools = list(orphan_spools or []) if self.spool else []
+        # Las repeticiones de (panel, código, zona) se agrupan antes de la ingesta
+        self.coalescer = EventCoalescer(self.ingest, coalesce_window) if coalesce_window > 0 else None
+        self.sink = self.coalescer or self.ingest
+        # Con SO_REUSEPORT hay otros workers: la supervisión corre solo en el que
+        # tiene supervise y confirma contra la base lo que no vio
+        self.supervision = PanelSupervisor(self.db, self.registry, self.sink, self.event_codes.classify_sia,
+                                           supervise=supervise, shared=reuse_port)
         logger.info(f"AlarmReceiver inicializado en {host}:{port}")
 
     async def start(self):
         try:
             logger.info(f"Intentando iniciar servidor en {self.host}:{self.port}")
             
-            # Verificar que el puerto está disponible
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            try:
-                sock.bind((self.host, self.port))
-                sock.close()
-            except Exception as e:
-                logger.error(f"Puerto {self.port} no disponible: {e}")
-                raise
-                
+            # Verificar que el puerto está disponible (con SO_REUSEPORT otros
+            # workers ya pueden estar escuchando en él)
+            if not self.reuse_port:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                try:
+                    sock.bind((self.host, self.port))
+                    sock.close()
+                except Exception as e:
+                    logger.error(f"Puerto {self.port} no disponible: {e}")
+                    raise
+            
+            # El journal y el servidor no dependen de la base: el registro se
+            # carga en segundo plano y se reintenta mientras la base no responda
+            if self.spool:
+                self.spool.open()
+            tasks = [
+                asyncio.create_task(self._load()),
+                asyncio.create_task(self.listener.run()),
+                asyncio.create_task(self.ingest.run()),
+                *([asyncio.create_task(self.coalescer.run())] if self.coalescer else []),
+                asyncio.create_task(self.supervision.run()),
+                asyncio.create_task(self.log_stats()),
+                *(asyncio.create_task(self._drain_orphan(d)) for d in self.orphan_spools),
+            ]
+
             server = await asyncio.start_server(
                 self.handle_client, 
                 self.host, 
                 self.port,
-                family=socket.AF_INET  # Forzar IPv4
+                family=socket.AF_INET,  # Forzar IPv4
+                limit=self.connections.limits.max_buffer,
+                reuse_port=self.reuse_port or None
             )
             
+            self.server = server
             addr = server.sockets[0].getsockname()
             logger.info(f'Servidor de alarmas iniciado exitosamente en {addr}')
+
+            udp_transport = None
+            if self.udp:
+                udp_transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                    lambda: self.udp,
+                    local_addr=(self.host, addr[1]),
+                    family=socket.AF_INET,
+                    reuse_port=self.reuse_port or None
+                )
+                logger.info(f'Recepción DC-09 por UDP en {self.host}:{addr[1]}')
             
-            async with server:
-                await server.serve_forever()
+            try:
+                async with server:
+                    await server.serve_forever()
+            finally:
+                if udp_transport:
+                    udp_transport.close()
+                # Lo que está en vuelo (datagramas, YC/YK) todavía necesita la
+                # ingesta: se espera antes de detenerla
+                if self.udp:
+                    await self.udp.close()
+                if self.coalescer:
+                    await self.coalescer.close()
+                await self.supervision.close()
+                if isinstance(self.ingest, EventBatcher):
+                    await self.ingest.flush()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                if self.capture:
+                    self.capture.close()
+                if self.spool:
+                    self.spool.close()
+                self.db.close()
                 
         except Exception as e:
             logger.error(f"Error iniciando servidor de alarmas: {e}")
             raise
 
+    async def _drain_orphan(self, directory: str):
+        try:
+            spool = EventSpool(self.db, directory)
+            spool.open()
+            lag = spool.metrics()['lag']
+            logger.info(f"Volcando journal sin dueño {directory} ({lag} eventos)")
+            await spool.drain()
+            logger.info(f"Journal {directory} volcado a la base")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error volcando el journal {directory}: {e}")
+
+    async def _load(self):
+        """Carga registro, códigos y supervisión; con la base caída reintenta con backoff.
+
+        Hasta que termina, las tramas SIA/CID se contestan con NAK (ver
+        process_frame) y los paneles las retransmiten más tarde.
+        """
+        backoff = 0.1
+        while True:
+            try:
+                await self.registry.load()
+                await self.event_codes.load()
+                await self.supervision.seed()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Base no disponible, registro de paneles sin cargar "
+                             f"(reintento en {backoff:.1f} s): {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, LOAD_RETRY_MAX)
+                continue
+            self.loaded.set()
+            return
+
+    async def _resync_registry(self):
+        """Recarga registro y códigos al reconectar el listener (se pudieron perder cambios)"""
+        self._listener_connects += 1
+        # Antes de la primera carga completa de eso se ocupa _load
+        if self._listener_connects > 1 and self.loaded.is_set():
+            await self.registry.load()
+            await self.event_codes.load()
+            await self.supervision.seed()
+
+    def get_stats(self) -> dict:
+        """Métricas de la receptora (pool de conexiones, ingesta y registro)"""
+        return {
+            'db_pool': self.db.metrics(),
+            'ingest': self.ingest.metrics(),
+            'registry': {'panels': len(self.registry), **self.registry.stats},
+            'event_codes': {'codes': len(self.event_codes), 'reloads': self.event_codes.reloads},
+            'connections': self.connections.metrics(),
+            **({'udp': self.udp.metrics()} if self.udp else {}),
+            **({'dedup': self.dedup.metrics()} if self.dedup is not None else {}),
+            **({'coalesce': self.coalescer.metrics()} if self.coalescer else {}),
+            **({'capture': self.capture.metrics()} if self.capture else {}),
+            'supervision': self.supervision.metrics(),
+        }
+
+    async def log_stats(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            pool = self.db.metrics()
+            logger.info(
+                f"Pool DB: {pool['in_use']}/{pool['size']} en uso, {pool['waiting']} esperando "
+                f"(espera media {pool['avg_wait_ms']:.1f} ms, máx {pool['wait_ms_max']:.1f} ms)"
+            )
+            if self.spool:
+                spool = self.spool.metrics()
+                logger.info(
+                    f"Journal: {spool['journal_bytes']} bytes en {spool['segments']} segmentos, "
+                    f"atraso {spool['lag']} eventos, volcado {spool['replay_rate']:.0f} ev/s"
+                )
+            else:
+                ingest = self.ingest.metrics()
+                logger.info(
+                    f"Ingesta: {ingest['events']} eventos en {ingest['batches']} lotes, "
+                    f"cola {ingest['queue_depth']}"
+                )
+            conns = self.connections.metrics()
+            evicted = conns['evicted_idle'] + conns['evicted_heartbeat'] + conns['evicted_buffer']
+            rejected = conns['rejected_max_connections'] + conns['rejected_per_ip']
+            logger.info(
+                f"Conexiones: {conns['active']} activas (máx {conns['max_active']}), "
+                f"{rejected} rechazadas, {evicted} desalojadas, "
+                f"{conns['backpressure_waits']} pausas por backpressure"
+            )
+            if self.udp:
+                udp = self.udp.metrics()
+                logger.info(
+                    f"UDP: {udp['frames']} tramas, {udp['duplicates']} retransmisiones, "
+                    f"{udp['invalid']} inválidas, {udp['dropped']} descartadas"
+                )
+            if self.dedup is not None:
+                dedup = self.dedup.metrics()
+                logger.info(
+                    f"Duplicados: {dedup['hits']} descartados, {dedup['misses']} únicos, "
+                    f"{dedup['size']} claves en la ventana"
+                )
+            if self.coalescer:
+                coalesce = self.coalescer.metrics()
+                logger.info(
+                    f"Tormentas: {coalesce['coalesced']} repeticiones sumadas a "
+                    f"{coalesce['storms']} eventos, {coalesce['open_groups']} grupos abiertos, "
+                    f"{coalesce['priority']} de prioridad 1 sin agrupar"
+                )
+            supervision = self.supervision.metrics()
+            logger.info(
+                f"Supervisión: {supervision['supervised']} paneles supervisados, "
+                f"{supervision['lost']} sin comunicación, {supervision['flushed_rows']} "
+                f"actualizaciones de última conexión en {supervision['flushes']} lotes"
+            )
+
     async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         addr = writer.get_extra_info('peername')
+        ip = addr[0] if addr else ''
+        if not self.connections.admit(ip):
+            writer.close()
+            return
+
         logger.info(f"Nueva conexión desde {addr}")
+        capture_id = self.capture.open(addr) if self.capture else None
+        limits = self.connections.limits
+        decoder = FrameDecoder()
+        loop = asyncio.get_running_loop()
+        last_data = last_frame = loop.time()
         
         try:
             while True:
-                data = await reader.read(1024)
+                # Backpressure: si la ingesta está saturada no se lee más del
+                # socket; el buffer del kernel se llena y el panel espera
+                if self.ingest.backlog() >= limits.ingest_high_water:
+                    self.connections.stats['backpressure_waits'] += 1
+                    while self.ingest.backlog() >= limits.ingest_high_water:
+                        await asyncio.sleep(limits.backpressure_delay)
+                    last_data = last_frame = loop.time()
+
+                now = loop.time()
+                idle_left = last_data + limits.idle_timeout - now
+                heartbeat_left = last_frame + limits.heartbeat_timeout - now
+                try:
+                    data = await asyncio.wait_for(
+                        reader.read(limits.read_size), max(min(idle_left, heartbeat_left), 0)
+                    )
+                except asyncio.TimeoutError:
+                    self.connections.evict('idle' if idle_left <= heartbeat_left else 'heartbeat', addr)
+                    break
                 if not data:
                     break
+                last_data = loop.time()
+                if capture_id is not None:
+                    self.capture.data(capture_id, data)
                 
-                message = data.decode()
-                logger.info(f"Mensaje recibido de {addr}: {message}")
+                # Un segmento puede traer varias tramas o solo parte de una
+                frames = decoder.feed(data)
+                if decoder.pending > limits.max_buffer:
+                    self.connections.evict('buffer', addr)
+                    break
+                if not frames:
+                    continue
+                last_frame = last_data
                 
-                # Procesar el mensaje
-                await self.process_message(message, addr)
+                # Las tramas del segmento se procesan juntas para que compartan
+                # lote de inserción; el ACK sale cuando el lote está confirmado
+                results = await asyncio.gather(
+                    *(self.process_frame(frame, addr) for frame in frames)
+                )
+                for frame, accepted in zip(frames, results):
+                    writer.write(build_ack(frame, accepted))
                 
-                # Enviar ACK
-                writer.write(b'\x06')
+                # Un único drain para todos los ACK del segmento
                 await writer.drain()
-                logger.info(f"ACK enviado a {addr}")
+                logger.debug(f"{len(frames)} ACK enviados a {addr}")
                 
         except Exception as e:
             logger.error(f"Error procesando mensaje de {addr}: {e}")
         finally:
+            self.connections.release(ip)
+            if capture_id is not None:
+                self.capture.close_conn(capture_id)
+            if decoder.discarded_bytes:
+                logger.warning(f"{decoder.discarded_bytes} bytes descartados de {addr} (trama sin terminador)")
             try:
                 writer.close()
                 await writer.wait_closed()
@@ -78,77 +349,111 @@ class AlarmReceiver:
                 logger.error(f"Error cerrando conexión con {addr}: {e}")
 
     async def process_message(self, message: str, addr: tuple):
-        """Procesa los mensajes recibidos e identifica el protocolo"""
-        if self.is_sia_message(message):
-            await self.process_sia_message(message, addr)
-        elif self.is_cid_message(message):
-            await self.process_cid_message(message, addr)
-        else:
-            logger.warning(f"Mensaje no reconocido: {message}")
+        """Procesa un mensaje de texto suelto (una única trama sin terminador)"""
+        await self.process_frame(parse_line(message.encode()), addr)
+
+    async def process_frame(self, frame: Frame, addr: tuple) -> bool:
+        """Procesa una trama ya delimitada según su protocolo.
+
+        Devuelve False si la trama no pudo persistirse (se responde NAK).
+        """
+        logger.debug(f"Trama recibida de {addr}: {frame.raw!r}")
+        if not frame.valid:
+            logger.warning(f"Trama inválida de {addr} ({frame.error}): {frame.raw!r}")
+            return True
+
+        # Sin el registro cargado no se puede asignar el panel_id sin ir a la
+        # base por cada trama (y con la base caída cada intento demora): se
+        # contesta NAK y el panel retransmite. Las pruebas de enlace se aceptan
+        if not self.loaded.is_set():
+            if frame.protocol in ('SIA', 'CID'):
+                logger.debug(f"Registro sin cargar, NAK a {addr}: {frame.message}")
+                return False
+            return True
+
+        # Una sola resolución de la cuenta por trama. Si el registro falla (la
+        # base no responde) se contesta NAK y el panel retransmite más tarde
+        try:
+            panel = await self.registry.get(frame.account) if frame.account else None
+        except Exception as e:
+            logger.error(f"Error resolviendo la cuenta {frame.account} de {addr}: {e}")
+            return False
+
+        # Cualquier trama válida (incluidas las pruebas de enlace) cuenta como actividad
+        if panel:
+            self.supervision.seen(panel)
+
+        if frame.protocol in ('SIA', 'CID'):
+            if not panel:
+                logger.warning(f"Panel no registrado: {frame.account}")
+                return True
+            key = frame_key(frame, addr) if self.dedup is not None else None
+            if key and not self.dedup.add(key):
+                logger.debug(f"Retransmisión descartada de {addr}: {frame.message}")
+                return True
+            if frame.protocol == 'SIA':
+                accepted = await self.process_sia_message(frame, panel, addr)
+            else:
+                accepted = await self.process_cid_message(frame, panel, addr)
+            # Si no se pudo persistir se olvida la clave para aceptar la retransmisión
+            if key and not accepted:
+                self.dedup.discard(key)
+            return accepted
+        elif frame.protocol == 'NULL':
+            logger.debug(f"Prueba de enlace de {addr} (cuenta {frame.account})")
+        return True
 
     def is_sia_message(self, message: str) -> bool:
         """Verifica si el mensaje es formato SIA"""
-        # Implementar verificación de formato SIA
-        sia_pattern = r'^\["([^"]+)"\]([^|]+)\|(.+)$'
-        return bool(re.match(sia_pattern, message))
+        return bool(SIA_PATTERN.match(message))
 
     def is_cid_message(self, message: str) -> bool:
         """Verifica si el mensaje es formato Contact ID"""
-        # Implementar verificación de formato CID
-        cid_pattern = r'^\d{4}18([^$]+)\$'
-        return bool(re.match(cid_pattern, message))
+        return cid.is_cid(message)
 
-    async def process_sia_message(self, message: str, addr: tuple):
-        """Procesa mensajes en formato SIA"""
+    async def process_sia_message(self, frame: Frame, panel: PanelInfo, addr: tuple) -> bool:
+        """Procesa mensajes en formato SIA de un panel ya resuelto en el registro"""
+        priority, description = self.event_codes.classify_sia(frame.code or '')
         try:
-            # Extraer información del mensaje SIA
-            match = re.match(r'^\["([^"]+)"\]([^|]+)\|(.+)$', message)
-            if match:
-                account, timestamp, data = match.groups()
-                
-                # Guardar en la base de datos
-                conn = get_db_connection()
-                cur = conn.cursor()
-                
-                try:
-                    # Obtener panel_id
-                    cur.execute("""
-                        SELECT id FROM alarm_panels 
-                        WHERE account_number = %s
-                    """, (account,))
-                    panel = cur.fetchone()
-                    
-                    if not panel:
-                        logger.warning(f"Panel no registrado: {account}")
-                        return
-                    
-                    # Insertar evento
-                    cur.execute("""
-                        INSERT INTO events (
-                            panel_id, event_type, raw_message, 
-                            code, qualifier, event_code, 
-                            partition, zone_user, timestamp
-                        ) VALUES (%s, 'SIA', %s, %s, %s, %s, %s, %s, %s)
-                        RETURNING id
-                    """, (
-                        panel[0], message, data[:2],
-                        data[0], data[1:], None,
-                        None, datetime.now()
-                    ))
-                    
-                    conn.commit()
-                    
-                finally:
-                    cur.close()
-                    conn.close()
-                
+            await self.sink.submit(IngestEvent(
+                panel_id=panel.panel_id,
+                event_type='SIA',
+                raw_message=frame.message,
+                code=frame.code,
+                qualifier=frame.code[0] if frame.code else None,
+                partition=frame.partition,
+                zone_user=frame.zone,
+                timestamp=datetime.now(),
+                priority=priority,
+                description=description
+            ))
+            return True
         except Exception as e:
             logger.error(f"Error procesando mensaje SIA: {e}")
+            return False
 
-    async def process_cid_message(self, message: str, addr: tuple):
-        """Procesa mensajes en formato Contact ID"""
-        # Implementar procesamiento similar al SIA
-        pass
+    async def process_cid_message(self, frame: Frame, panel: PanelInfo, addr: tuple) -> bool:
+        """Procesa mensajes en formato Contact ID (ya decodificados por framing)"""
+        event = frame.cid
+        priority, description = self.event_codes.classify_cid(event.qualifier, event.event_code)
+        try:
+            await self.sink.submit(IngestEvent(
+                panel_id=panel.panel_id,
+                event_type='CID',
+                raw_message=frame.message,
+                code=event.code,
+                qualifier=event.qualifier,
+                event_code=event.event_code,
+                partition=event.partition,
+                zone_user=event.zone_user,
+                timestamp=datetime.now(),
+                priority=priority,
+                description=description
+            ))
+            return True
+        except Exception as e:
+            logger.error(f"Error procesando mensaje CID: {e}")
+            return False
 
 # Para iniciar el servidor
 if __name__ == "__main__":
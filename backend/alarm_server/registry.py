@@ -0,0 +1,168 @@
+"""Registro en memoria de paneles de alarma (cuenta -> panel).
+
+Se carga completo al iniciar la receptora y se mantiene al día con las
+notificaciones que emiten los endpoints /alarm-panels de la API por el canal
+PANELS_CHANNEL. Las cuentas desconocidas se cachean como negativas durante
+negative_ttl segundos para no consultar la base en cada trama.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from psycopg2.extras import DictCursor
+
+from alarm_server.db import AsyncDBPool
+
+logger = logging.getLogger(__name__)
+
+PANELS_QUERY = """
+    SELECT ap.id, ap.client_id, ap.account_number, ap.verification_code,
+           ap.supervision_interval, ap.last_connection,
+           pz.zone_number, pz.description AS zone_description, pz.zone_type
+    FROM alarm_panels ap
+    LEFT JOIN panel_zones pz ON pz.panel_id = ap.id
+"""
+
+
+@dataclass(frozen=True)
+class PanelInfo:
+    panel_id: int
+    client_id: int
+    account_number: str
+    verification_code: str
+    zones: Dict[str, dict] = field(default_factory=dict)
+    supervision_interval: Optional[int] = None  # segundos; None = sin supervisión
+    # Al cargar el panel; la actividad posterior la lleva PanelSupervisor
+    last_connection: Optional[datetime] = None
+
+
+def fetch_panels(conn, where: str = '', params: tuple = ()) -> Dict[int, PanelInfo]:
+    with conn.cursor(cursor_factory=DictCursor) as cur:
+        cur.execute(PANELS_QUERY + where, params)
+        rows = cur.fetchall()
+
+    panels: Dict[int, dict] = {}
+    for row in rows:
+        panel = panels.setdefault(row['id'], {
+            'panel_id': row['id'],
+            'client_id': row['client_id'],
+            'account_number': row['account_number'],
+            'verification_code': row['verification_code'],
+            'zones': {},
+            'supervision_interval': row['supervision_interval'],
+            'last_connection': row['last_connection'],
+        })
+        if row['zone_number'] is not None:
+            panel['zones'][str(row['zone_number'])] = {
+                'description': row['zone_description'],
+                'zone_type': row['zone_type'],
+            }
+    return {panel_id: PanelInfo(**data) for panel_id, data in panels.items()}
+
+
+class PanelRegistry:
+    def __init__(self, db: AsyncDBPool, negative_ttl: float = 60.0, max_negative: int = 10000):
+        self.db = db
+        self.by_account: Dict[str, PanelInfo] = {}
+        self.by_id: Dict[int, PanelInfo] = {}
+        self.negative: "OrderedDict[str, float]" = OrderedDict()
+        self.negative_ttl = negative_ttl
+        self.max_negative = max_negative
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'negative_hits': 0,
+            'db_lookups': 0,
+            'invalidations': 0,
+            'reloads': 0,
+        }
+        # Recargas de paneles en vuelo: se guarda la referencia hasta que terminan
+        self.tasks: Set[asyncio.Task] = set()
+
+    async def _fetch(self, where: str = '', params: tuple = ()) -> Dict[int, PanelInfo]:
+        return await self.db.run(fetch_panels, where, params)
+
+    def _put(self, panel: PanelInfo):
+        previous = self.by_id.get(panel.panel_id)
+        if previous and previous.account_number != panel.account_number:
+            self.by_account.pop(previous.account_number, None)
+        self.by_id[panel.panel_id] = panel
+        self.by_account[panel.account_number] = panel
+        self.negative.pop(panel.account_number, None)
+
+    def _remove(self, panel_id: int):
+        panel = self.by_id.pop(panel_id, None)
+        if panel:
+            self.by_account.pop(panel.account_number, None)
+
+    async def load(self):
+        """Carga completa del registro (al iniciar y al reconectar el listener)"""
+        panels = await self._fetch()
+        self.by_id = panels
+        self.by_account = {panel.account_number: panel for panel in panels.values()}
+        self.negative.clear()
+        self.stats['reloads'] += 1
+        logger.info(f"Registro de paneles cargado: {len(panels)} paneles")
+
+    async def refresh_panel(self, panel_id: int):
+        panels = await self._fetch("WHERE ap.id = %s", (panel_id,))
+        if panel_id in panels:
+            self._put(panels[panel_id])
+        else:
+            self._remove(panel_id)
+
+    async def _refresh_logged(self, panel_id: int):
+        try:
+            await self.refresh_panel(panel_id)
+        except Exception as e:
+            # Queda la versión anterior; la próxima recarga completa la corrige
+            logger.error(f"Error recargando el panel {panel_id}: {e}")
+
+    def handle_notification(self, payload: str):
+        """Aplica una notificación de cambio emitida por la API"""
+        data = json.loads(payload)
+        self.stats['invalidations'] += 1
+        if data.get('op') == 'delete':
+            self._remove(data['id'])
+        else:
+            task = asyncio.create_task(self._refresh_logged(data['id']))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        # La cuenta pudo haber pasado de desconocida a registrada
+        if data.get('account_number'):
+            self.negative.pop(data['account_number'], None)
+
+    async def get(self, account: str) -> Optional[PanelInfo]:
+        """Resuelve una cuenta; None si el panel no está registrado"""
+        panel = self.by_account.get(account)
+        if panel is not None:
+            self.stats['hits'] += 1
+            return panel
+
+        now = time.monotonic()
+        expires = self.negative.get(account)
+        if expires is not None and expires > now:
+            self.stats['negative_hits'] += 1
+            return None
+
+        # Puede ser un panel recién creado cuya notificación aún no llegó
+        self.stats['misses'] += 1
+        self.stats['db_lookups'] += 1
+        panels = await self._fetch("WHERE ap.account_number = %s", (account,))
+        for panel in panels.values():
+            self._put(panel)
+            return panel
+
+        self.negative[account] = now + self.negative_ttl
+        self.negative.move_to_end(account)
+        while len(self.negative) > self.max_negative:
+            self.negative.popitem(last=False)
+        return None
+
+    def __len__(self) -> int:
+        return len(self.by_account)
@@ -0,0 +1,170 @@
+"""Reproduce una captura de tráfico (alarm_server.capture) contra una receptora.
+
+Cada conexión capturada se abre de nuevo y sus segmentos se envían con los
+mismos cortes y en el mismo orden. Con --speed 1 se respetan los tiempos
+originales (2 = el doble de rápido); con --speed 0 se envía todo lo más
+rápido posible, lo que sirve como benchmark de regresión con tráfico real.
+Las respuestas de la receptora (ACK/NAK) se leen y se cuentan.
+
+Uso (desde backend/):
+    python -m alarm_server.replay captures/capture-....alcap --port 9999 --speed 0
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from alarm_server.capture import DATA, OPEN, read_capture
+from alarm_server.framing import ACK, NAK
+
+logger = logging.getLogger(__name__)
+
+
+def load_sessions(paths: List[str]) -> Dict[Tuple[int, int], dict]:
+    """Agrupa los registros por conexión: transporte, apertura y segmentos"""
+    sessions: Dict[Tuple[int, int], dict] = {}
+    offset = 0.0
+    for index, path in enumerate(paths):
+        last = 0.0
+        for kind, conn_id, t, data in read_capture(path):
+            key = (index, conn_id)
+            last = t
+            if kind == OPEN:
+                transport = data.split(b' ', 1)[0].decode() or 'tcp'
+                sessions.setdefault(key, {'transport': transport, 'opened': offset + t, 'chunks': []})
+            elif kind == DATA and key in sessions:
+                sessions[key]['chunks'].append((offset + t, data))
+        # Los archivos rotados se encadenan en el tiempo
+        offset += last
+    return sessions
+
+
+class _ReplayCounter:
+    def __init__(self):
+        self.stats = defaultdict(int)
+        self.last_response = None
+
+    def responses(self, data: bytes):
+        self.last_response = time.perf_counter()
+        self.stats['response_bytes'] += len(data)
+        self.stats['acks'] += data.count(ACK) + data.count(b'"ACK"')
+        self.stats['naks'] += data.count(NAK) + data.count(b'"NAK"')
+
+
+class _UDPReplay(asyncio.DatagramProtocol):
+    def __init__(self, counter: _ReplayCounter):
+        self.counter = counter
+
+    def datagram_received(self, data, addr):
+        self.counter.responses(data)
+
+
+async def replay_session(session: dict, host: str, port: int, speed: float, start: float,
+                         counter: _ReplayCounter, linger: float):
+    loop = asyncio.get_running_loop()
+
+    async def wait_until(t: float):
+        if speed > 0:
+            delay = start + t / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    await wait_until(session['opened'])
+    if session['transport'] == 'udp':
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _UDPReplay(counter), remote_addr=(host, port)
+        )
+        try:
+            for t, data in session['chunks']:
+                await wait_until(t)
+                transport.sendto(data)
+                counter.stats['chunks'] += 1
+                counter.stats['bytes'] += len(data)
+            await asyncio.sleep(linger)
+        finally:
+            transport.close()
+        return
+
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError as e:
+        counter.stats['connect_errors'] += 1
+        logger.error(f"No se pudo conectar a {host}:{port}: {e}")
+        return
+
+    async def read_responses():
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                return
+            counter.responses(data)
+
+    reading = asyncio.create_task(read_responses())
+    try:
+        for t, data in session['chunks']:
+            await wait_until(t)
+            writer.write(data)
+            await writer.drain()
+            counter.stats['chunks'] += 1
+            counter.stats['bytes'] += len(data)
+        # Dar tiempo a que lleguen los últimos ACK antes de cerrar
+        await asyncio.wait_for(asyncio.shield(reading), linger)
+    except asyncio.TimeoutError:
+        pass
+    except OSError as e:
+        counter.stats['send_errors'] += 1
+        logger.error(f"Conexión perdida durante la reproducción: {e}")
+    finally:
+        reading.cancel()
+        writer.close()
+
+
+async def replay(paths: List[str], host: str, port: int, speed: float, linger: float) -> dict:
+    sessions = load_sessions(paths)
+    counter = _ReplayCounter()
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        replay_session(session, host, port, speed, loop.time(), counter, linger)
+        for session in sessions.values()
+    ))
+    # Duración hasta la última respuesta (sin la espera final)
+    elapsed = (counter.last_response or start) - start
+    stats = dict(counter.stats)
+    responses = stats.get('acks', 0) + stats.get('naks', 0)
+    return {
+        'captures': paths,
+        'speed': speed,
+        'connections': len(sessions),
+        'elapsed_s': round(elapsed, 3),
+        'responses_per_sec': round(responses / elapsed, 1) if elapsed > 0 else None,
+        **stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reproduce capturas de tráfico contra la receptora')
+    parser.add_argument('captures', nargs='+', help='Archivos .alcap (en orden si están rotados)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9999)
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='1 = tiempos originales, 0 = lo más rápido posible')
+    parser.add_argument('--linger', type=float, default=2.0, help='Espera final de respuestas (s)')
+    parser.add_argument('--report', help='Guardar el resultado en JSON')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    started = time.time()
+    result = asyncio.run(replay(args.captures, args.host, args.port, args.speed, args.linger))
+    result['started_at'] = started
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
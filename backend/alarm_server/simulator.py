@@ -1,9 +1,15 @@
+import argparse
 import asyncio
+import json
 import random
+from dataclasses import dataclass, field
 from datetime import datetime
 import logging
 import time
 import socket
+from typing import List, Optional
+
+from alarm_server import cid
 
 logging.basicConfig(
     level=logging.INFO,
@@ -11,6 +17,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+MAX_ACCOUNTS = 10000
+
 class AlarmSimulator:
     def __init__(self, host: str = '127.0.0.1', port: int = 9999):
         self.host = host
@@ -65,14 +73,22 @@ class AlarmSimulator:
                     logger.error(f"Error conectando al servidor después de {self.max_retries} intentos")
                     return False
 
+    @staticmethod
+    def build_sia(account: str, event: str) -> bytes:
+        # Formato SIA: ["CUENTA"]TIMESTAMP|EVENTO
+        timestamp = datetime.now().strftime("%H%M%S,%m%d%y")
+        return f'["{account}"]{timestamp}|{event}\n'.encode()
+
+    @staticmethod
+    def build_cid(account: str, qualifier: str, event_code: str, zone: int) -> bytes:
+        return (cid.encode(account, qualifier, event_code, '01', f'{zone:03d}') + '\r\n').encode()
+
     async def send_event(self, event: str):
         """Envía un evento al servidor"""
         try:
-            # Formato SIA: ["CUENTA"]TIMESTAMP|EVENTO
-            timestamp = datetime.now().strftime("%H%M%S,%m%d%y")
-            message = f'["{self.account}"]{timestamp}|{event}\n'
+            message = self.build_sia(self.account, event)
             
-            self.writer.write(message.encode())
+            self.writer.write(message)
             await self.writer.drain()
             
             # Esperar ACK
@@ -106,12 +122,262 @@ class AlarmSimulator:
             await self.writer.wait_closed()
             logger.info("Conexión cerrada")
 
+
+def ramp_rate(ramp: str, elapsed: float) -> float:
+    """Tasa objetivo para un perfil 'tasa:duración,tasa:duración,...' (rampas lineales)"""
+    stages = [tuple(float(x) for x in step.split(':')) for step in ramp.split(',')]
+    previous = stages[0][0]
+    for rate, duration in stages:
+        if elapsed < duration:
+            return previous + (rate - previous) * (elapsed / duration if duration else 1)
+        elapsed -= duration
+        previous = rate
+    return previous
+
+
+def percentile(ordered: List[float], pct: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))], 3)
+
+
+@dataclass
+class LoadStats:
+    scheduled: int = 0
+    sent: int = 0
+    acked: int = 0
+    naks: int = 0
+    timeouts: int = 0
+    errors: int = 0
+    skipped: int = 0
+    reconnects: int = 0
+    latencies: List[float] = field(default_factory=list)
+
+
+class LoadGenerator:
+    """Prueba de capacidad: miles de paneles virtuales sobre muchas conexiones.
+
+    Un planificador reparte los eventos a la tasa objetivo (fija o por rampa)
+    entre las conexiones; cada conexión tiene como máximo una trama sin ACK,
+    igual que un panel o concentrador real. La latencia se mide desde el
+    instante planificado hasta el ACK, así que incluye la espera en cola
+    cuando la receptora no da abasto. Los eventos que no se pueden despachar
+    porque todas las conexiones están ocupadas se cuentan como omitidos.
+
+    Cada trama de un panel lleva la zona siguiente (1 a 999, contador por
+    cuenta): así ninguna repite la clave (panel, código, zona) dentro de la
+    ventana de duplicados ni de la agrupación de tormentas mientras cada panel
+    mande menos de ~15 eventos por segundo, y toda la carga llega a la base.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 9999, panels: int = 1000,
+                 connections: int = 100, rate: float = 500.0, duration: float = 60.0,
+                 ramp: Optional[str] = None, cid_ratio: float = 0.5, account_start: int = 1000,
+                 ack_timeout: float = 5.0):
+        # Las cuentas son de 4 dígitos: un rango que pase de 9999 repetiría cuentas
+        if account_start < 0 or account_start + panels > MAX_ACCOUNTS:
+            raise ValueError(f"Rango de cuentas inválido: {account_start} + {panels} paneles supera 9999")
+        self.host = host
+        self.port = port
+        self.accounts = [f'{account_start + i:04d}' for i in range(panels)]
+        self.zones = dict.fromkeys(self.accounts, 0)
+        self.connections = connections
+        self.rate = rate
+        self.duration = duration
+        self.ramp = ramp
+        self.cid_ratio = cid_ratio
+        self.ack_timeout = ack_timeout
+        self.simulator = AlarmSimulator(host, port)
+        self.cid_events = [('1', '130'), ('3', '130'), ('1', '110'), ('1', '301'), ('3', '301'), ('1', '384')]
+        self.queue: asyncio.Queue = asyncio.Queue(connections * 2)
+        self.stats = LoadStats()
+        self.timeline: List[dict] = []
+        self.running = False
+
+    def target_rate(self, elapsed: float) -> float:
+        return ramp_rate(self.ramp, elapsed) if self.ramp else self.rate
+
+    def build_frame(self, rnd: random.Random) -> bytes:
+        account = rnd.choice(self.accounts)
+        zone = self.zones[account] % 999 + 1
+        self.zones[account] = zone
+        if rnd.random() < self.cid_ratio:
+            qualifier, event_code = rnd.choice(self.cid_events)
+            return self.simulator.build_cid(account, qualifier, event_code, zone)
+        code = rnd.choice(self.simulator.sia_events).partition('|')[0]
+        return self.simulator.build_sia(account, f'{code}|{zone}')
+
+    async def _open(self):
+        while self.running:
+            try:
+                return await asyncio.open_connection(self.host, self.port)
+            except OSError as e:
+                self.stats.errors += 1
+                logger.warning(f"No se pudo conectar a {self.host}:{self.port}: {e}")
+                await asyncio.sleep(1)
+        return None, None
+
+    async def _connection(self, index: int):
+        reader, writer = await self._open()
+        while self.running or not self.queue.empty():
+            try:
+                scheduled, frame = await asyncio.wait_for(self.queue.get(), 0.5)
+            except asyncio.TimeoutError:
+                continue
+            if writer is None:
+                reader, writer = await self._open()
+                if writer is None:
+                    break
+                self.stats.reconnects += 1
+            try:
+                writer.write(frame)
+                await writer.drain()
+                self.stats.sent += 1
+                ack = await asyncio.wait_for(reader.readexactly(1), self.ack_timeout)
+            except asyncio.TimeoutError:
+                # Sin ACK a tiempo el panel cierra y reintenta en otra conexión
+                self.stats.timeouts += 1
+                writer.close()
+                writer = None
+                continue
+            except (OSError, asyncio.IncompleteReadError) as e:
+                self.stats.errors += 1
+                logger.debug(f"Conexión {index} perdida: {e}")
+                writer.close()
+                writer = None
+                continue
+            if ack == b'\x06':
+                self.stats.acked += 1
+                self.stats.latencies.append((time.perf_counter() - scheduled) * 1000)
+            else:
+                self.stats.naks += 1
+        if writer is not None:
+            writer.close()
+
+    async def _schedule(self):
+        rnd = random.Random(42)
+        start = time.perf_counter()
+        due = 0.0
+        last = start
+        second = 0
+        counters = (0, 0, 0)
+        while True:
+            now = time.perf_counter()
+            elapsed = now - start
+            if elapsed >= self.duration:
+                break
+            due += self.target_rate(elapsed) * (now - last)
+            last = now
+            while due >= 1:
+                due -= 1
+                self.stats.scheduled += 1
+                try:
+                    self.queue.put_nowait((now, self.build_frame(rnd)))
+                except asyncio.QueueFull:
+                    self.stats.skipped += 1
+            if int(elapsed) > second:
+                acked = self.stats.acked
+                self.timeline.append({
+                    'second': second,
+                    'target_rate': round(self.target_rate(second), 1),
+                    'sent': self.stats.sent - counters[0],
+                    'acked': acked - counters[1],
+                    'p99_ms': percentile(sorted(self.stats.latencies[counters[2]:]), 99),
+                })
+                counters = (self.stats.sent, acked, len(self.stats.latencies))
+                second = int(elapsed)
+            await asyncio.sleep(0.005)
+
+    async def run(self) -> dict:
+        self.running = True
+        workers = [asyncio.create_task(self._connection(i)) for i in range(self.connections)]
+        start = time.perf_counter()
+        try:
+            await self._schedule()
+        finally:
+            self.running = False
+            await asyncio.gather(*workers, return_exceptions=True)
+        return self.report(time.perf_counter() - start)
+
+    def report(self, elapsed: float) -> dict:
+        stats = self.stats
+        ordered = sorted(stats.latencies)
+        failed = stats.naks + stats.timeouts + stats.errors
+        return {
+            'config': {
+                'host': self.host, 'port': self.port, 'panels': len(self.accounts),
+                'connections': self.connections, 'rate': self.rate, 'ramp': self.ramp,
+                'duration': self.duration, 'cid_ratio': self.cid_ratio,
+            },
+            'elapsed_s': round(elapsed, 3),
+            'scheduled': stats.scheduled,
+            'sent': stats.sent,
+            'acked': stats.acked,
+            'naks': stats.naks,
+            'timeouts': stats.timeouts,
+            'errors': stats.errors,
+            'skipped': stats.skipped,
+            'reconnects': stats.reconnects,
+            'ack_rate': round(stats.acked / elapsed, 1) if elapsed else 0,
+            'error_rate': round(failed / max(stats.sent, 1), 6),
+            'latency_ms': {
+                'p50': percentile(ordered, 50),
+                'p90': percentile(ordered, 90),
+                'p99': percentile(ordered, 99),
+                'p999': percentile(ordered, 99.9),
+                'max': round(ordered[-1], 3) if ordered else None,
+            },
+            'timeline': self.timeline,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulador de paneles de alarma')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9999)
+    parser.add_argument('--load', action='store_true', help='Modo generador de carga')
+    parser.add_argument('--panels', type=int, default=1000)
+    parser.add_argument('--connections', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=500.0, help='Eventos por segundo (total)')
+    parser.add_argument('--ramp', help="Perfil 'tasa:segundos,...', p. ej. 100:10,2000:60,2000:30")
+    parser.add_argument('--duration', type=float, default=60.0)
+    parser.add_argument('--cid-ratio', type=float, default=0.5, help='Fracción de tramas Contact ID')
+    parser.add_argument('--account-start', type=int, default=1000)
+    parser.add_argument('--ack-timeout', type=float, default=5.0)
+    parser.add_argument('--report', default='load_report.json', help='Archivo JSON de resultados')
+    args = parser.parse_args()
+
+    if not args.load:
+        asyncio.run(AlarmSimulator(args.host, args.port).run())
+        return
+
+    duration = args.duration
+    if args.ramp:
+        duration = sum(float(step.split(':')[1]) for step in args.ramp.split(','))
+    try:
+        generator = LoadGenerator(
+            args.host, args.port, panels=args.panels, connections=args.connections,
+            rate=args.rate, duration=duration, ramp=args.ramp, cid_ratio=args.cid_ratio,
+            account_start=args.account_start, ack_timeout=args.ack_timeout
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    report = asyncio.run(generator.run())
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    latency = report['latency_ms']
+    logger.info(
+        f"{report['acked']}/{report['scheduled']} eventos confirmados ({report['ack_rate']} ev/s), "
+        f"errores {report['error_rate']:.2%}, p50 {latency['p50']} ms, p99 {latency['p99']} ms; "
+        f"informe en {args.report}"
+    )
+
+
 # Para ejecutar el simulador
 if __name__ == "__main__":
-    simulator = AlarmSimulator()
     try:
-        asyncio.run(simulator.run())
+        main()
     except KeyboardInterrupt:
         logger.info("Simulador detenido por el usuario")
     except Exception as e:
-        logger.error(f"Error en el simulador: {e}") 
\ No newline at end of file
+        logger.error(f"Error en el simulador: {e}")
@@ -0,0 +1,442 @@
+"""Journal local de eventos para no perder alarmas si la base está caída.
+
+Cada evento parseado se agrega a un journal en disco (solo append, dividido
+en segmentos) antes de enviar el ACK al panel. Los fsync se agrupan: todos
+los eventos escritos durante fsync_delay comparten un único fsync. Un
+drenador en segundo plano inserta los eventos en la tabla events en orden,
+en lotes, y guarda en un checkpoint la última secuencia confirmada. Si la
+base no responde, el drenador reintenta con backoff y el journal crece hasta
+que se recupera; al reiniciar la receptora se continúa desde el checkpoint
+leyendo los segmentos con mmap.
+
+La entrega a la base es "al menos una vez": si el proceso cae entre el
+INSERT y el checkpoint, ese lote se vuelve a insertar al reiniciar.
+
+Un journal que quedó sin dueño (se redujo la cantidad de workers o se pasó
+entre modo multiproceso y modo de un solo proceso) lo adopta un proceso en
+marcha: ver orphan_directories() y EventSpool.drain().
+
+Formato de registro: longitud (u32) | crc32 (u32) | secuencia (u64) | JSON
+"""
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from datetime import datetime
+from itertools import islice
+from typing import Deque, List, Optional, Tuple
+
+from alarm_server.db import AsyncDBPool
+from alarm_server.ingest import IngestEvent, insert_events
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct('<IIQ')
+SEGMENT_SUFFIX = '.seg'
+CHECKPOINT_FILE = 'checkpoint'
+WORKER_PREFIX = 'worker-'
+
+
+DATETIME_FIELDS = ('timestamp', 'last_timestamp')
+
+
+def encode_event(event: IngestEvent) -> bytes:
+    data = asdict(event)
+    for name in DATETIME_FIELDS:
+        if data[name] is not None:
+            data[name] = data[name].isoformat()
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+def decode_event(payload: bytes) -> IngestEvent:
+    data = json.loads(payload)
+    for name in DATETIME_FIELDS:
+        if data.get(name) is not None:
+            data[name] = datetime.fromisoformat(data[name])
+    return IngestEvent(**data)
+
+
+def iter_records(buf, offset: int = 0):
+    """Recorre los registros válidos de un segmento: (seq, payload, siguiente offset)"""
+    size = len(buf)
+    while offset + RECORD_HEADER.size <= size:
+        length, crc, seq = RECORD_HEADER.unpack_from(buf, offset)
+        start = offset + RECORD_HEADER.size
+        end = start + length
+        if end > size:
+            return
+        payload = bytes(buf[start:end])
+        if zlib.crc32(payload) != crc:
+            return
+        yield seq, payload, end
+        offset = end
+
+
+def worker_directory(root: str, index: int) -> str:
+    return os.path.join(root, f'{WORKER_PREFIX}{index}')
+
+
+def has_segments(directory: str) -> bool:
+    try:
+        return any(name.endswith(SEGMENT_SUFFIX) and os.path.getsize(os.path.join(directory, name))
+                   for name in os.listdir(directory))
+    except FileNotFoundError:
+        return False
+
+
+def orphan_directories(root: str, active: List[str]) -> List[str]:
+    """Journals bajo root (la raíz y los worker-N) que no usa ningún proceso actual"""
+    candidates = [root]
+    if os.path.isdir(root):
+        candidates += sorted(os.path.join(root, name) for name in os.listdir(root)
+                             if name.startswith(WORKER_PREFIX) and os.path.isdir(os.path.join(root, name)))
+    in_use = {os.path.abspath(directory) for directory in active}
+    return [d for d in candidates if os.path.abspath(d) not in in_use and has_segments(d)]
+
+
+class EventSpool:
+    def __init__(self, db: AsyncDBPool, directory: str, segment_size: int = 64 * 1024 * 1024,
+                 fsync_delay: float = 0.002, max_batch: int = 500, max_memory: int = 50000,
+                 retry_max: float = 5.0):
+        self.db = db
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync_delay = fsync_delay
+        self.max_batch = max_batch
+        self.max_memory = max_memory
+        self.retry_max = retry_max
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='alarm-spool')
+
+        self.segments: List[int] = []        # primera secuencia de cada segmento
+        self.segment_bytes: dict = {}
+        self.fd: Optional[int] = None
+        self.active_size = 0
+        self.next_seq = 1
+        self.synced_seq = 0
+        self.committed_seq = 0
+
+        self.pending: Deque[Tuple[int, IngestEvent]] = deque()
+        self._memory_overflow = False
+        self._cursor: Optional[Tuple[int, int, int]] = None  # (segmento, offset, seq)
+        self._closing_fds: List[int] = []
+        self._waiters: List[asyncio.Future] = []
+        self._dirty = asyncio.Event()
+        self._has_data = asyncio.Event()
+
+        self.db_available = True
+        self.replay_rate = 0.0
+        self.stats = {
+            'appended': 0,
+            'fsyncs': 0,
+            'drained': 0,
+            'disk_reads': 0,
+            'db_errors': 0,
+        }
+
+    # --- Apertura y recuperación -------------------------------------------------
+
+    def _segment_path(self, first_seq: int) -> str:
+        return os.path.join(self.directory, f'{first_seq:020d}{SEGMENT_SUFFIX}')
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX)
+        )
+        for first_seq in self.segments:
+            self.segment_bytes[first_seq] = os.path.getsize(self._segment_path(first_seq))
+
+        checkpoint = os.path.join(self.directory, CHECKPOINT_FILE)
+        if os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                self.committed_seq = int(f.read().strip() or 0)
+
+        if self.segments:
+            last = self.segments[-1]
+            path = self._segment_path(last)
+            valid_end, last_seq = 0, last - 1
+            with open(path, 'rb') as f:
+                data = f.read()
+            for seq, _, end in iter_records(data):
+                valid_end, last_seq = end, seq
+            if valid_end < len(data):
+                # Escritura incompleta al caer el proceso: se descarta la cola
+                logger.warning(f"Journal truncado en {path}: {len(data) - valid_end} bytes inválidos")
+                with open(path, 'r+b') as f:
+                    f.truncate(valid_end)
+            self.segment_bytes[last] = valid_end
+            self.next_seq = last_seq + 1
+            self.committed_seq = max(self.committed_seq, self.segments[0] - 1)
+        else:
+            self.next_seq = self.committed_seq + 1
+
+        self.synced_seq = self.next_seq - 1
+        self._open_active()
+        lag = self.next_seq - 1 - self.committed_seq
+        if lag:
+            logger.info(f"Journal con {lag} eventos pendientes de volcar a la base")
+            self._has_data.set()
+
+    def _open_active(self):
+        if not self.segments or self.segment_bytes[self.segments[-1]] >= self.segment_size:
+            self.segments.append(self.next_seq)
+            self.segment_bytes[self.next_seq] = 0
+        active = self.segments[-1]
+        self.fd = os.open(self._segment_path(active), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.active_size = self.segment_bytes[active]
+
+    # --- Escritura -----------------------------------------------------------------
+
+    def _append(self, event: IngestEvent) -> int:
+        seq = self.next_seq
+        payload = encode_event(event)
+        record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload), seq) + payload
+        view = memoryview(record)
+        while view:
+            written = os.write(self.fd, view)
+            view = view[written:]
+        self.next_seq += 1
+        self.active_size += len(record)
+        self.segment_bytes[self.segments[-1]] = self.active_size
+        self.stats['appended'] += 1
+
+        if not self._memory_overflow and len(self.pending) < self.max_memory:
+            self.pending.append((seq, event))
+        else:
+            # Sin memoria suficiente: el drenador leerá del disco hasta vaciar la cola
+            self._memory_overflow = True
+
+        if self.active_size >= self.segment_size:
+            self._closing_fds.append(self.fd)
+            self._open_active()
+        return seq
+
+    async def submit(self, event: IngestEvent):
+        """Escribe el evento en el journal y espera a que sea durable (fsync)"""
+        self._append(event)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self._dirty.set()
+        await future
+
+    def _sync(self, fds: List[int], closing: List[int]):
+        for fd in fds:
+            os.fsync(fd)
+        for fd in closing:
+            os.close(fd)
+
+    async def _fsync_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._dirty.wait()
+            await asyncio.sleep(self.fsync_delay)
+            self._dirty.clear()
+            waiters, self._waiters = self._waiters, []
+            closing, self._closing_fds = self._closing_fds, []
+            target = self.next_seq - 1
+            try:
+                await loop.run_in_executor(self.executor, self._sync, closing + [self.fd], closing)
+            except Exception as e:
+                logger.error(f"Error haciendo fsync del journal: {e}")
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                continue
+            self.synced_seq = target
+            self.stats['fsyncs'] += 1
+            # Solo lo que ya es durable se vuelca a la base (ver _next_batch)
+            self._has_data.set()
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    # --- Drenado hacia la base -------------------------------------------------------
+
+    def _read_from_disk(self, start: int, end: int) -> List[Tuple[int, IngestEvent]]:
+        """Lee los registros [start, end) de los segmentos usando mmap"""
+        records = []
+        # Copia: corre en el hilo del journal y el loop puede abrir un segmento nuevo
+        segments = list(self.segments)
+        index = max((i for i, first in enumerate(segments) if first <= start), default=0)
+        cursor = self._cursor
+        for first_seq in segments[index:]:
+            if len(records) >= end - start:
+                break
+            path = self._segment_path(first_seq)
+            if os.path.getsize(path) == 0:
+                continue
+            offset = cursor[1] if cursor and cursor[0] == first_seq and cursor[2] <= start else 0
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                for seq, payload, next_offset in iter_records(buf, offset):
+                    if seq >= end:
+                        break
+                    if seq >= start:
+                        records.append((seq, decode_event(payload)))
+                        self._cursor = (first_seq, next_offset, seq + 1)
+        self.stats['disk_reads'] += 1
+        return records
+
+    def _next_batch(self) -> List[Tuple[int, IngestEvent]]:
+        # Nunca más allá del último fsync: si el proceso cae, la base no debe
+        # tener eventos que el journal no conserva (y volvería a numerar)
+        start = self.committed_seq + 1
+        limit = min(self.max_batch, self.synced_seq + 1 - start)
+        if self.pending and self.pending[0][0] == start:
+            return list(islice(self.pending, limit))
+        # Hueco entre el checkpoint y lo que hay en memoria: leer del disco
+        end = self.pending[0][0] if self.pending else self.next_seq
+        return self._read_from_disk(start, min(end, start + limit))
+
+    def _release_segments(self, seq: int) -> List[int]:
+        """Quita de la lista los segmentos completamente volcados (nunca el activo).
+
+        Corre en el loop, igual que metrics() y _append(): el hilo del journal
+        solo recibe la lista de archivos a borrar.
+        """
+        released = []
+        while len(self.segments) > 1 and self.segments[1] - 1 <= seq:
+            first_seq = self.segments.pop(0)
+            self.segment_bytes.pop(first_seq, None)
+            released.append(first_seq)
+        return released
+
+    def _checkpoint(self, seq: int, released: List[int]):
+        path = os.path.join(self.directory, CHECKPOINT_FILE)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(str(seq))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+        # Si el proceso cae antes de borrarlos, open() los vuelve a listar y
+        # se borran en el próximo checkpoint
+        for first_seq in released:
+            os.remove(self._segment_path(first_seq))
+
+    async def _drain_loop(self):
+        loop = asyncio.get_running_loop()
+        backoff = 0.1
+        while True:
+            if self.committed_seq >= self.synced_seq:
+                if self.committed_seq + 1 >= self.next_seq:
+                    self._memory_overflow = False
+                self._has_data.clear()
+                await self._has_data.wait()
+                continue
+
+            if self.pending and self.pending[0][0] == self.committed_seq + 1:
+                batch = self._next_batch()
+            else:
+                batch = await loop.run_in_executor(self.executor, self._next_batch)
+            if not batch:
+                logger.error(f"No se pudo leer del journal la secuencia {self.committed_seq + 1}")
+                await asyncio.sleep(self.retry_max)
+                continue
+
+            start = time.perf_counter()
+            try:
+                await self.db.run(insert_events, [event for _, event in batch])
+            except Exception as e:
+                self.stats['db_errors'] += 1
+                if self.db_available:
+                    logger.error(f"Base no disponible, eventos retenidos en el journal: {e}")
+                self.db_available = False
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.retry_max)
+                continue
+
+            if not self.db_available:
+                logger.info("Base disponible nuevamente, volcando journal")
+            self.db_available = True
+            backoff = 0.1
+
+            self.committed_seq = batch[-1][0]
+            while self.pending and self.pending[0][0] <= self.committed_seq:
+                self.pending.popleft()
+            await loop.run_in_executor(self.executor, self._checkpoint, self.committed_seq,
+                                       self._release_segments(self.committed_seq))
+
+            self.stats['drained'] += len(batch)
+            elapsed = max(time.perf_counter() - start, 1e-6)
+            self.replay_rate = 0.8 * self.replay_rate + 0.2 * (len(batch) / elapsed)
+
+    async def run(self):
+        await asyncio.gather(self._fsync_loop(), self._drain_loop())
+
+    async def drain(self, poll: float = 0.1):
+        """Vuelca a la base todo lo que quedó en el journal y lo cierra.
+
+        Para journals huérfanos, que ya no reciben eventos nuevos. Mientras la
+        base no responda se reintenta con el mismo backoff que el drenador. Si
+        se volcó completo se borran sus archivos (ver _remove), para que el
+        próximo arranque no lo vuelva a encontrar como huérfano.
+        """
+        task = asyncio.create_task(self._drain_loop())
+        drained = False
+        try:
+            while self.committed_seq + 1 < self.next_seq and not task.done():
+                await asyncio.sleep(poll)
+            if task.done():
+                task.result()
+            drained = True
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            self.close()
+        if drained:
+            # El último checkpoint pudo quedar en curso en el hilo del journal
+            await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+            self._remove()
+
+    def _remove(self):
+        """Borra segmentos y checkpoint, y el directorio si queda vacío"""
+        for first_seq in self.segments:
+            try:
+                os.remove(self._segment_path(first_seq))
+            except FileNotFoundError:
+                pass
+        for name in (CHECKPOINT_FILE, CHECKPOINT_FILE + '.tmp'):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        self.segments = []
+        self.segment_bytes = {}
+        try:
+            os.rmdir(self.directory)
+        except OSError:
+            # La raíz del spool todavía contiene los journals worker-N
+            pass
+        logger.info(f"Journal {self.directory} volcado completo, archivos borrados")
+
+    def backlog(self) -> int:
+        """Eventos escritos que todavía esperan el fsync"""
+        return self.next_seq - 1 - self.synced_seq
+
+    def metrics(self) -> dict:
+        return {
+            'journal_bytes': sum(self.segment_bytes.values()),
+            'segments': len(self.segments),
+            'lag': self.next_seq - 1 - self.committed_seq,
+            'unsynced': self.next_seq - 1 - self.synced_seq,
+            'replay_rate': self.replay_rate,
+            'db_available': self.db_available,
+            'queue_depth': len(self.pending),
+            **self.stats,
+        }
+
+    def close(self):
+        if self.fd is not None:
+            os.fsync(self.fd)
+            os.close(self.fd)
+            self.fd = None
+        self.executor.shutdown(wait=False)
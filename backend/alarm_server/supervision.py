@@ -0,0 +1,361 @@
+"""Supervisión de paneles: última conexión y pérdida de supervisión.
+
+Cada trama válida de un panel registrado actualiza su última conexión en
+memoria; un bucle vuelca los cambios a alarm_panels.last_connection con un
+único UPDATE masivo cada flush_interval segundos en lugar de uno por trama.
+
+Los paneles con supervision_interval configurado se agendan en una rueda de
+timers (hashed timer wheel): un arreglo de slots de tick segundos donde cada
+panel ocupa una entrada en el slot de su vencimiento. Reagendar es O(1) (la
+entrada vieja queda obsoleta y se descarta al llegar a su slot) y cada tick
+solo recorre un slot, así que escala a cientos de miles de paneles sin una
+tarea asyncio por panel. Si un panel no se reporta a tiempo se genera un
+evento YC (falla de comunicación) y, cuando vuelve, un YK (restauración).
+
+Al cargar el registro la rueda se siembra con last_connection, así que un
+panel que ya estaba callado antes de un reinicio también se detecta (sin
+repetir el YC si ya se había avisado). Con varios workers la supervisión
+corre en uno solo (supervise); los demás solo vuelcan last_connection. Como
+ese worker no ve las tramas que llegan a los otros, antes de dar un panel
+por perdido lo confirma contra alarm_panels.last_connection con un margen
+de flush_interval, y cada flush_interval busca ahí los paneles perdidos que
+volvieron a reportarse (shared).
+"""
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timezone
+from typing import Dict, Hashable, List, Optional, Set
+
+from psycopg2.extras import execute_values
+
+from alarm_server.db import AsyncDBPool
+from alarm_server.ingest import IngestEvent
+from alarm_server.registry import PanelInfo, PanelRegistry
+
+logger = logging.getLogger(__name__)
+
+UPDATE_LAST_CONNECTION = """
+    UPDATE alarm_panels AS ap
+    SET last_connection = v.seen
+    FROM (VALUES %s) AS v(id, seen)
+    WHERE ap.id = v.id
+      AND (ap.last_connection IS NULL OR ap.last_connection < v.seen)
+"""
+
+SUPERVISION_LOST_CODE = 'YC'
+SUPERVISION_RESTORED_CODE = 'YK'
+
+FETCH_LAST_CONNECTION = "SELECT id, last_connection FROM alarm_panels WHERE id = ANY(%s)"
+
+# Paneles cuyo último evento de supervisión es un YC posterior a su última
+# conexión: ya se avisó la pérdida antes del reinicio
+ALREADY_LOST_QUERY = f"""
+    SELECT ap.id, ap.last_connection
+    FROM alarm_panels ap
+    JOIN LATERAL (
+        SELECT e.code, e.timestamp
+        FROM events e
+        WHERE e.panel_id = ap.id AND e.code IN ('{SUPERVISION_LOST_CODE}', '{SUPERVISION_RESTORED_CODE}')
+        ORDER BY e.timestamp DESC
+        LIMIT 1
+    ) last_event ON TRUE
+    WHERE ap.id = ANY(%s)
+      AND last_event.code = '{SUPERVISION_LOST_CODE}'
+      AND (ap.last_connection IS NULL OR last_event.timestamp >= ap.last_connection)
+"""
+
+
+def fetch_last_connection(conn, panel_ids: list) -> Dict[int, Optional[datetime]]:
+    with conn.cursor() as cur:
+        cur.execute(FETCH_LAST_CONNECTION, (panel_ids,))
+        return dict(cur.fetchall())
+
+
+def fetch_already_lost(conn, panel_ids: list) -> Dict[int, Optional[datetime]]:
+    with conn.cursor() as cur:
+        cur.execute(ALREADY_LOST_QUERY, (panel_ids,))
+        return dict(cur.fetchall())
+
+
+def update_last_connection(conn, rows: list):
+    with conn.cursor() as cur:
+        execute_values(cur, UPDATE_LAST_CONNECTION, rows,
+                       template='(%s, %s::timestamptz)', page_size=len(rows))
+    conn.commit()
+
+
+class TimerWheel:
+    """Rueda de timers con slots de tick segundos.
+
+    Los vencimientos más lejanos que una vuelta completa quedan en su slot y
+    se revisan en cada vuelta hasta que llega su momento.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 4096, start: Optional[float] = None):
+        self.tick = tick
+        self.slots: List[Dict[Hashable, float]] = [{} for _ in range(slots)]
+        self.deadlines: Dict[Hashable, float] = {}
+        self.current = int((time.monotonic() if start is None else start) // tick)
+
+    def schedule(self, key: Hashable, deadline: float):
+        self.deadlines[key] = deadline
+        # Primer tick en el que now >= deadline
+        slot = max(math.ceil(deadline / self.tick), self.current)
+        self.slots[slot % len(self.slots)][key] = deadline
+
+    def cancel(self, key: Hashable):
+        # La entrada del slot queda obsoleta y se descarta al procesarlo
+        self.deadlines.pop(key, None)
+
+    def advance(self, now: float) -> List[Hashable]:
+        """Avanza hasta now y devuelve las claves vencidas"""
+        expired = []
+        target = int(now // self.tick)
+        # Si pasó más de una vuelta alcanza con recorrer cada slot una vez
+        first = max(self.current, target - len(self.slots) + 1)
+        for tick in range(first, target + 1):
+            slot = self.slots[tick % len(self.slots)]
+            if not slot:
+                continue
+            keep = {}
+            for key, deadline in slot.items():
+                if self.deadlines.get(key) != deadline:
+                    continue  # reagendado o cancelado
+                if deadline <= now:
+                    del self.deadlines[key]
+                    expired.append(key)
+                else:
+                    keep[key] = deadline  # vence en una vuelta posterior
+            self.slots[tick % len(self.slots)] = keep
+        self.current = target + 1
+        return expired
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.deadlines
+
+    def __len__(self) -> int:
+        return len(self.deadlines)
+
+
+class PanelSupervisor:
+    def __init__(self, db: AsyncDBPool, registry: PanelRegistry, sink, classify,
+                 flush_interval: float = 30.0, tick: float = 1.0,
+                 supervise: bool = True, shared: bool = False):
+        self.db = db
+        self.registry = registry
+        self.sink = sink
+        self.classify = classify  # código SIA -> (prioridad, descripción)
+        self.flush_interval = flush_interval
+        # Solo un proceso evalúa la supervisión; los demás vuelcan last_connection
+        self.supervise = supervise
+        # Con otros procesos recibiendo tramas la actividad ajena solo se ve en
+        # last_connection, que llega con hasta flush_interval de atraso
+        self.shared = shared
+        self.grace = flush_interval + tick if shared else 0.0
+        self.wheel = TimerWheel(tick)
+        self.dirty: Dict[int, datetime] = {}
+        # Panel perdido -> última conexión conocida al perderlo
+        self.lost: Dict[int, Optional[datetime]] = {}
+        # Eventos YC/YK en vuelo: se guarda la referencia hasta que terminan
+        self.tasks: Set[asyncio.Task] = set()
+        self.stats = {
+            'flushes': 0,
+            'flushed_rows': 0,
+            'flush_errors': 0,
+            'supervision_lost': 0,
+            'supervision_restored': 0,
+        }
+
+    def _deadline(self, panel: PanelInfo, last: Optional[datetime], now: float) -> float:
+        """Vencimiento (reloj monotónico) según la última conexión conocida"""
+        remaining = panel.supervision_interval + self.grace
+        if last is not None:
+            remaining += (last - datetime.now(timezone.utc)).total_seconds()
+        return now + max(0.0, remaining)
+
+    async def seed(self):
+        """Agenda los paneles supervisados del registro según su last_connection.
+
+        Se llama al cargar el registro. Los paneles que ya estaban vencidos se
+        dan por perdidos en el primer tick, salvo que ya se haya avisado el YC
+        antes del reinicio.
+        """
+        if not self.supervise:
+            return
+        now = time.monotonic()
+        overdue = []
+        for panel in self.registry.by_id.values():
+            if not panel.supervision_interval or panel.panel_id in self.wheel or panel.panel_id in self.lost:
+                continue
+            deadline = self._deadline(panel, panel.last_connection, now)
+            self.wheel.schedule(panel.panel_id, deadline)
+            if deadline <= now:
+                overdue.append(panel.panel_id)
+
+        already_lost: Dict[int, Optional[datetime]] = {}
+        if overdue:
+            try:
+                already_lost = await self.db.run(fetch_already_lost, overdue)
+            except Exception as e:
+                # Ante la duda se avisa de nuevo: mejor un YC repetido que uno perdido
+                logger.error(f"Error consultando la supervisión previa de {len(overdue)} paneles: {e}")
+        for panel_id, last in already_lost.items():
+            self.wheel.cancel(panel_id)
+            self.lost[panel_id] = last
+        logger.info(f"Supervisión: {len(self.wheel)} paneles agendados, "
+                    f"{len(self.lost)} sin comunicación desde antes del arranque")
+
+    def seen(self, panel: PanelInfo):
+        """Registra actividad del panel (O(1), sin tocar la base)"""
+        self.dirty[panel.panel_id] = datetime.now(timezone.utc)
+        if not self.supervise:
+            return
+        if panel.supervision_interval:
+            self.wheel.schedule(panel.panel_id, time.monotonic() + panel.supervision_interval)
+        if panel.panel_id in self.lost:
+            self._restore(panel)
+
+    def _restore(self, panel: PanelInfo):
+        del self.lost[panel.panel_id]
+        self.stats['supervision_restored'] += 1
+        self._emit(panel, SUPERVISION_RESTORED_CODE, "Comunicación restablecida")
+
+    def _emit(self, panel: PanelInfo, code: str, message: str):
+        priority, description = self.classify(code)
+        event = IngestEvent(
+            panel_id=panel.panel_id,
+            event_type='SIA',
+            raw_message=f'[{panel.account_number}] {message}',
+            code=code,
+            qualifier=code[0],
+            timestamp=datetime.now(),
+            priority=priority,
+            description=description,
+        )
+        task = asyncio.ensure_future(self._submit(event))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _submit(self, event: IngestEvent):
+        try:
+            await self.sink.submit(event)
+        except Exception as e:
+            logger.error(f"Error guardando evento de supervisión {event.code} del panel {event.panel_id}: {e}")
+
+    async def check(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        expired = []
+        for panel_id in self.wheel.advance(now):
+            # Datos actuales del registro: el panel pudo borrarse o dejar de supervisarse
+            panel = self.registry.by_id.get(panel_id)
+            if panel is not None and panel.supervision_interval:
+                expired.append(panel)
+        if not expired:
+            return
+
+        last_seen: Dict[int, Optional[datetime]] = {}
+        if self.shared:
+            # El panel pudo reportarse a otro worker: se confirma contra la base
+            try:
+                last_seen = await self.db.run(fetch_last_connection, [p.panel_id for p in expired])
+            except Exception as e:
+                logger.error(f"Error verificando la última conexión de {len(expired)} paneles: {e}")
+                for panel in expired:
+                    self.wheel.schedule(panel.panel_id, now + self.flush_interval)
+                return
+
+        for panel in expired:
+            last = max(filter(None, (last_seen.get(panel.panel_id), self.dirty.get(panel.panel_id))),
+                       default=None)
+            if self.shared and last is not None:
+                deadline = self._deadline(panel, last, now)
+                if deadline > now:
+                    self.wheel.schedule(panel.panel_id, deadline)
+                    continue
+            self.lost[panel.panel_id] = last
+            self.stats['supervision_lost'] += 1
+            logger.warning(f"Supervisión perdida: panel {panel.account_number} sin reportarse "
+                           f"en {panel.supervision_interval} s")
+            self._emit(panel, SUPERVISION_LOST_CODE,
+                       f"Sin comunicación en {panel.supervision_interval} s")
+
+    async def check_restored(self):
+        """Restaura los paneles perdidos que se reportaron a otro worker"""
+        if not self.lost:
+            return
+        try:
+            last_seen = await self.db.run(fetch_last_connection, list(self.lost))
+        except Exception as e:
+            logger.error(f"Error consultando la última conexión de {len(self.lost)} paneles perdidos: {e}")
+            return
+        now = time.monotonic()
+        for panel_id, last in last_seen.items():
+            if panel_id not in self.lost or last is None:
+                continue
+            previous = self.lost[panel_id]
+            if previous is not None and last <= previous:
+                continue
+            panel = self.registry.by_id.get(panel_id)
+            if panel is None or not panel.supervision_interval:
+                del self.lost[panel_id]
+                continue
+            self._restore(panel)
+            self.wheel.schedule(panel_id, self._deadline(panel, last, now))
+
+    async def flush(self):
+        if not self.dirty:
+            return
+        pending, self.dirty = self.dirty, {}
+        try:
+            # Orden por id: los workers actualizan filas en el mismo orden y no se bloquean entre sí
+            await self.db.run(update_last_connection, sorted(pending.items()))
+        except Exception as e:
+            self.stats['flush_errors'] += 1
+            logger.error(f"Error actualizando last_connection de {len(pending)} paneles: {e}")
+            # Se reintenta en el próximo ciclo sin pisar actividad más nueva
+            for panel_id, seen in pending.items():
+                self.dirty.setdefault(panel_id, seen)
+            return
+        self.stats['flushes'] += 1
+        self.stats['flushed_rows'] += len(pending)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _check_loop(self):
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            await self.check()
+
+    async def _restore_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.check_restored()
+
+    async def run(self):
+        loops = [self._flush_loop()]
+        if self.supervise:
+            loops.append(self._check_loop())
+            if self.shared:
+                loops.append(self._restore_loop())
+        await asyncio.gather(*loops)
+
+    async def close(self, timeout: float = 10.0):
+        """Espera los eventos de supervisión en vuelo y guarda last_connection"""
+        if self.tasks:
+            _, pending = await asyncio.wait(set(self.tasks), timeout=timeout)
+            if pending:
+                logger.error(f"{len(pending)} eventos de supervisión sin guardar al cerrar")
+        await self.flush()
+
+    def metrics(self) -> dict:
+        return {
+            'supervised': len(self.wheel),
+            'lost': len(self.lost),
+            'pending_flush': len(self.dirty),
+            **self.stats,
+        }
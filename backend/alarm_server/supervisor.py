@@ -0,0 +1,229 @@
+"""Supervisor multiproceso de la receptora de alarmas.
+
+Lanza N procesos AlarmReceiver que comparten el puerto de escucha con
+SO_REUSEPORT (el kernel reparte las conexiones entrantes entre ellos). Cada
+worker tiene su propio event loop y su propio pool de conexiones a la base.
+La supervisión de paneles corre solo en el worker 0.
+El supervisor reinicia los workers que terminan inesperadamente y agrega
+las métricas que cada uno publica periódicamente.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def reuse_port_supported() -> bool:
+    return hasattr(socket, 'SO_REUSEPORT')
+
+
+def _worker_main(index: int, workers: int, host: str, port: int, stats_queue, stats_interval: float,
+                 db_max_connections: int, spool_dir: Optional[str], capture_dir: Optional[str]):
+    from alarm_server.receiver import AlarmReceiver
+    from alarm_server.spool import orphan_directories, worker_directory
+
+    # Cada worker tiene su propio journal y su propia captura. El worker 0
+    # además vuelca los journals que no son de ningún worker actual: los de
+    # índices que ya no existen y el del modo de un solo proceso, y es el
+    # único que evalúa la supervisión de los paneles (YC/YK)
+    orphans = []
+    if spool_dir and index == 0:
+        orphans = orphan_directories(spool_dir, [worker_directory(spool_dir, i) for i in range(workers)])
+    receiver = AlarmReceiver(
+        host=host, port=port, reuse_port=True,
+        db_max_connections=db_max_connections, stats_interval=stats_interval,
+        spool_dir=worker_directory(spool_dir, index) if spool_dir else None,
+        capture_dir=os.path.join(capture_dir, f'worker-{index}') if capture_dir else None,
+        orphan_spools=orphans, supervise=index == 0
+    )
+
+    async def publish_stats():
+        while True:
+            await asyncio.sleep(stats_interval)
+            try:
+                stats_queue.put_nowait((index, os.getpid(), receiver.get_stats()))
+            except queue.Full:
+                pass
+
+    async def main():
+        # SIGTERM del supervisor (y Ctrl+C, que llega a todo el grupo) cancela
+        # start(): su finally vuelca lo pendiente y cierra journal y base
+        task = asyncio.current_task()
+        stopping = []
+
+        def shutdown():
+            if not stopping:
+                stopping.append(True)
+                task.cancel()
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, shutdown)
+
+        publisher = asyncio.create_task(publish_stats())
+        try:
+            await receiver.start()
+        except asyncio.CancelledError:
+            if not stopping:
+                raise
+            logger.info(f"Worker {index} detenido")
+        finally:
+            publisher.cancel()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+def aggregate_stats(snapshots: List[dict]) -> dict:
+    """Suma las métricas de los workers (máximos y promedios donde corresponde)"""
+    result: dict = {}
+    for snapshot in snapshots:
+        for key, value in snapshot.items():
+            if isinstance(value, dict):
+                result.setdefault(key, []).append(value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                result.setdefault(key, []).append(value)
+
+    aggregated = {}
+    for key, values in result.items():
+        if isinstance(values[0], dict):
+            aggregated[key] = aggregate_stats(values)
+        elif 'max' in key or key.startswith('last_'):
+            aggregated[key] = max(values)
+        elif 'avg' in key or key == 'saturation':
+            aggregated[key] = sum(values) / len(values)
+        else:
+            aggregated[key] = sum(values)
+    return aggregated
+
+
+class ReceiverSupervisor:
+    def __init__(self, host: str = '127.0.0.1', port: int = 9999, workers: Optional[int] = None,
+                 stats_interval: float = 30.0, db_max_connections: int = 10,
+                 max_restarts_per_minute: int = 10, spool_dir: Optional[str] = 'spool',
+                 capture_dir: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.workers = workers or default_workers()
+        self.stats_interval = stats_interval
+        self.db_max_connections = db_max_connections
+        self.max_restarts_per_minute = max_restarts_per_minute
+        self.spool_dir = spool_dir
+        self.capture_dir = capture_dir
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self.stats_queue = multiprocessing.Queue(maxsize=self.workers * 10)
+        self.worker_stats: Dict[int, dict] = {}
+        self.restarts: List[float] = []
+        self.running = False
+
+    def _spawn(self, index: int):
+        process = multiprocessing.Process(
+            target=_worker_main,
+            args=(index, self.workers, self.host, self.port, self.stats_queue,
+                  self.stats_interval, self.db_max_connections, self.spool_dir, self.capture_dir),
+            name=f'alarm-receiver-{index}',
+            daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+        logger.info(f"Worker {index} de la receptora iniciado con PID {process.pid}")
+
+    def _check_workers(self):
+        now = time.monotonic()
+        self.restarts = [t for t in self.restarts if now - t < 60]
+        for index, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            logger.error(f"Worker {index} (PID {process.pid}) terminó con código {process.exitcode}")
+            self.worker_stats.pop(index, None)
+            if len(self.restarts) >= self.max_restarts_per_minute:
+                logger.error("Demasiados reinicios en el último minuto, se espera antes de reintentar")
+                continue
+            self.restarts.append(now)
+            self._spawn(index)
+
+    def _drain_stats(self):
+        while True:
+            try:
+                index, pid, stats = self.stats_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.worker_stats[index] = {'pid': pid, **stats}
+
+    def get_stats(self) -> dict:
+        snapshots = [
+            {key: value for key, value in stats.items() if key != 'pid'}
+            for stats in self.worker_stats.values()
+        ]
+        return {
+            'workers': self.workers,
+            'alive': sum(1 for p in self.processes.values() if p.is_alive()),
+            'restarts_last_minute': len(self.restarts),
+            'total': aggregate_stats(snapshots),
+            'per_worker': dict(self.worker_stats),
+        }
+
+    def _log_stats(self):
+        stats = self.get_stats()
+        total = stats['total']
+        ingest = total.get('ingest', {})
+        pool = total.get('db_pool', {})
+        logger.info(
+            f"Receptora: {stats['alive']}/{stats['workers']} workers | "
+            f"eventos {ingest.get('events', ingest.get('drained', 0))} volcados, "
+            f"cola {ingest.get('queue_depth', 0)} | "
+            f"pool DB {pool.get('in_use', 0)}/{pool.get('size', 0)} en uso, "
+            f"{pool.get('waiting', 0)} esperando"
+        )
+
+    def run(self):
+        """Bucle del supervisor (bloqueante)"""
+        if not reuse_port_supported():
+            raise RuntimeError("SO_REUSEPORT no está disponible en esta plataforma")
+
+        self.running = True
+        # Detenido por el sistema (systemd, docker stop): se detienen los workers antes de salir
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, 'running', False))
+        for index in range(self.workers):
+            self._spawn(index)
+
+        last_log = time.monotonic()
+        try:
+            while self.running:
+                time.sleep(1)
+                self._drain_stats()
+                self._check_workers()
+                if time.monotonic() - last_log >= self.stats_interval:
+                    self._log_stats()
+                    last_log = time.monotonic()
+        except KeyboardInterrupt:
+            logger.info("Deteniendo workers de la receptora...")
+        finally:
+            self.stop()
+
+    def stop(self, timeout: float = 15.0):
+        """Pide a los workers que terminen (SIGTERM) y los mata si no lo hacen en timeout"""
+        self.running = False
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for index, process in self.processes.items():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.error(f"Worker {index} (PID {process.pid}) no terminó en {timeout} s, se fuerza")
+                process.kill()
+                process.join()
@@ -0,0 +1,130 @@
+"""Recepción de SIA DC-09 por UDP.
+
+Cada datagrama trae una trama DC-09 completa, así que no hay estado por
+conexión: se decodifica con el mismo framing que TCP, se procesa con el
+registro de paneles y la ingesta de la receptora y se responde ACK/NAK al
+origen. Los comunicadores retransmiten el mismo datagrama si el ACK no llega;
+esas retransmisiones se contestan desde una caché de respuestas sin volver
+a procesar el evento.
+
+UDP no es más rápido que TCP: las dos vías comparten el parseo, el CRC y la
+construcción del ACK, que es donde se va la CPU por trama, y cada datagrama
+lleva además su propia tarea para que uno que espera el fsync del journal no
+frene a los demás. Con alarm_server.bench_udp ambas dan el mismo throughput
+y UDP apenas un ~10 % menos de CPU por trama en la receptora. Lo que se gana
+es que no hay socket ni corrutina por panel (sin límites de conexiones ni
+timeouts de inactividad), y que los comunicadores que solo hablan UDP
+pueden reportar.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Set, Tuple
+
+from alarm_server.framing import FrameDecoder, build_ack
+
+logger = logging.getLogger(__name__)
+
+
+class AlarmDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, receiver, replay_window: float = 30.0, max_replay: int = 100000,
+                 max_inflight: int = 10000):
+        self.receiver = receiver
+        self.replay_window = replay_window
+        self.max_replay = max_replay
+        self.max_inflight = max_inflight
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        # (origen, datagrama) -> (instante, respuesta); respuesta None = en proceso
+        self.replies: "OrderedDict[Tuple[tuple, bytes], Tuple[float, Optional[bytes]]]" = OrderedDict()
+        self.inflight = 0
+        # Datagramas en proceso: se guarda la referencia hasta que terminan
+        self.tasks: Set[asyncio.Task] = set()
+        self.stats = {
+            'datagrams': 0,
+            'frames': 0,
+            'duplicates': 0,
+            'invalid': 0,
+            'acks': 0,
+            'naks': 0,
+            'dropped': 0,
+        }
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def error_received(self, exc):
+        logger.error(f"Error en el socket UDP: {exc}")
+
+    def _expire(self, now: float):
+        replies = self.replies
+        while replies:
+            key, (stamp, _) = next(iter(replies.items()))
+            if now - stamp < self.replay_window and len(replies) <= self.max_replay:
+                break
+            replies.popitem(last=False)
+
+    def datagram_received(self, data: bytes, addr):
+        self.stats['datagrams'] += 1
+        if self.receiver.capture:
+            self.receiver.capture.datagram(addr, data)
+        now = time.monotonic()
+        self._expire(now)
+
+        key = (addr, data)
+        cached = self.replies.get(key)
+        if cached is not None:
+            self.stats['duplicates'] += 1
+            if cached[1] is not None:
+                self.transport.sendto(cached[1], addr)
+            return
+
+        # Sin capacidad: se descarta sin responder y el panel retransmite
+        if (self.inflight >= self.max_inflight
+                or self.receiver.ingest.backlog() >= self.receiver.connections.limits.ingest_high_water):
+            self.stats['dropped'] += 1
+            return
+
+        frames = FrameDecoder().feed(data)
+        if len(frames) != 1:
+            # Un datagrama DC-09 trae exactamente una trama
+            self.stats['invalid'] += 1
+            logger.warning(f"Datagrama inválido de {addr}: {data[:64]!r}")
+            return
+
+        self.stats['frames'] += 1
+        self.replies[key] = (now, None)
+        self.inflight += 1
+        task = asyncio.ensure_future(self._process(key, frames[0], addr))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _process(self, key, frame, addr):
+        try:
+            accepted = await self.receiver.process_frame(frame, addr)
+        except Exception as e:
+            logger.error(f"Error procesando datagrama de {addr}: {e}")
+            accepted = False
+        finally:
+            self.inflight -= 1
+
+        reply = build_ack(frame, accepted)
+        if frame.valid and accepted:
+            self.stats['acks'] += 1
+            self.replies[key] = (self.replies.get(key, (time.monotonic(), None))[0], reply)
+        else:
+            # Un NAK no se cachea: la retransmisión se vuelve a procesar
+            self.stats['naks'] += 1
+            self.replies.pop(key, None)
+        if self.transport is not None:
+            self.transport.sendto(reply, addr)
+
+    async def close(self, timeout: float = 10.0):
+        """Espera a que terminen los datagramas en proceso (el socket ya está cerrado)"""
+        if self.tasks:
+            _, pending = await asyncio.wait(set(self.tasks), timeout=timeout)
+            if pending:
+                logger.error(f"{len(pending)} datagramas sin procesar al cerrar")
+
+    def metrics(self) -> dict:
+        return {'inflight': self.inflight, 'replay_cache': len(self.replies), **self.stats}
@@ -76,18 +76,16 @@ ROLE_PERMISSIONS: Dict[str, List[Permission]] = {
     ]
 }
 
+def has_permission(user_role: str, required_permission: Permission) -> bool:
+    user_permissions = ROLE_PERMISSIONS.get(user_role, [])
+    return Permission.ADMIN_ALL in user_permissions or required_permission in user_permissions
+
 def check_permission(required_permission: Permission):
     async def permission_dependency(current_user = Depends(get_current_user)):
         if not current_user:
             raise HTTPException(status_code=401, detail="Not authenticated")
             
-        user_role = current_user.get("role", "")
-        user_permissions = ROLE_PERMISSIONS.get(user_role, [])
-        
-        if Permission.ADMIN_ALL in user_permissions:
-            return True
-            
-        if required_permission not in user_permissions:
+        if not has_permission(current_user.get("role", ""), required_permission):
             raise HTTPException(
                 status_code=403,
                 detail=f"No tiene permiso para realizar esta acción: {required_permission}"
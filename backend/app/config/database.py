@@ -1,7 +1,13 @@
 import os
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
 import psycopg2
-from psycopg2.extras import DictCursor
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.pool import ThreadedConnectionPool
 
 load_dotenv()
 
@@ -21,4 +27,171 @@ def get_db_connection():
         print(f"Error connecting to database: {e}")
         raise e
 
+logger = logging.getLogger(__name__)
+
+class PoolTimeout(Exception):
+    """No se liberó ninguna conexión del pool dentro de acquire_timeout"""
+
+class DatabasePool:
+    """Pool de conexiones compartido por todos los endpoints de la API.
+
+    Reutiliza conexiones abiertas en lugar de hacer el handshake TCP y la
+    autenticación con Postgres en cada petición. Si están todas prestadas se
+    espera hasta acquire_timeout. Una conexión que estuvo ociosa más de
+    health_check_after segundos se prueba con SELECT 1 antes de entregarla y
+    se reemplaza si falla. Al devolverla se descarta cualquier transacción
+    que el endpoint haya dejado abierta.
+    """
+
+    def __init__(self, minconn: int = 2, maxconn: int = 20, acquire_timeout: float = 5.0,
+                 health_check_after: float = 30.0):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.health_check_after = health_check_after
+        self.pool = None
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.lock = threading.Lock()
+        self.last_used = {}
+        self.in_use = 0
+        self.waiting = 0
+        self.stats = {
+            'acquired': 0,
+            'timeouts': 0,
+            'health_checks': 0,
+            'replaced': 0,
+            'max_in_use': 0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+            'hold_ms_total': 0.0,
+            'hold_ms_max': 0.0,
+        }
+
+    def open(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadedConnectionPool(self.minconn, self.maxconn, **DB_CONFIG)
+                logger.info(f"Pool de conexiones de la API abierto ({self.minconn}-{self.maxconn})")
+
+    def close(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.closeall()
+                self.pool = None
+                self.last_used.clear()
+
+    def _healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - self.last_used.get(id(conn), 0.0) < self.health_check_after:
+            return True
+        self.stats['health_checks'] += 1
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self):
+        if self.pool is None:
+            self.open()
+        start = time.perf_counter()
+        with self.lock:
+            self.waiting += 1
+        acquired = self.slots.acquire(timeout=self.acquire_timeout)
+        with self.lock:
+            self.waiting -= 1
+        wait_ms = (time.perf_counter() - start) * 1000
+        if not acquired:
+            self.stats['timeouts'] += 1
+            raise PoolTimeout(f"Sin conexiones libres tras {self.acquire_timeout} s ({self.maxconn} en uso)")
+        try:
+            conn = self.pool.getconn()
+            # Tras un reinicio de Postgres pueden estar caídas todas las ociosas
+            for _ in range(self.maxconn):
+                if self._healthy(conn):
+                    break
+                self.stats['replaced'] += 1
+                self.last_used.pop(id(conn), None)
+                self.pool.putconn(conn, close=True)
+                conn = self.pool.getconn()
+        except Exception:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.in_use += 1
+            self.stats['acquired'] += 1
+            self.stats['max_in_use'] = max(self.stats['max_in_use'], self.in_use)
+            self.stats['wait_ms_total'] += wait_ms
+            self.stats['wait_ms_max'] = max(self.stats['wait_ms_max'], wait_ms)
+        return conn
+
+    def putconn(self, conn, held_ms: float = 0.0):
+        broken = bool(conn.closed)
+        if not broken and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        if broken:
+            self.last_used.pop(id(conn), None)
+        else:
+            self.last_used[id(conn)] = time.monotonic()
+        try:
+            if self.pool is not None:
+                self.pool.putconn(conn, close=broken)
+            else:
+                conn.close()
+        finally:
+            with self.lock:
+                self.in_use -= 1
+                self.stats['hold_ms_total'] += held_ms
+                self.stats['hold_ms_max'] = max(self.stats['hold_ms_max'], held_ms)
+            self.slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        start = time.perf_counter()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn, (time.perf_counter() - start) * 1000)
+
+    def metrics(self) -> dict:
+        acquired = self.stats['acquired']
+        return {
+            'min': self.minconn,
+            'max': self.maxconn,
+            'in_use': self.in_use,
+            'waiting': self.waiting,
+            'avg_wait_ms': self.stats['wait_ms_total'] / acquired if acquired else 0.0,
+            'avg_hold_ms': self.stats['hold_ms_total'] / acquired if acquired else 0.0,
+            **self.stats,
+        }
+
+db_pool = DatabasePool(
+    minconn=int(os.getenv('DB_POOL_MIN', '2')),
+    maxconn=int(os.getenv('DB_POOL_MAX', '20')),
+    acquire_timeout=float(os.getenv('DB_POOL_TIMEOUT', '5')),
+)
+
+def get_db():
+    """Dependencia de FastAPI: presta una conexión del pool durante la petición"""
+    with db_pool.connection() as conn:
+        yield conn
+
+# Canal de LISTEN/NOTIFY para cambios en paneles de alarma
+PANELS_CHANNEL = 'alarm_panels_changed'
+# Lo emite un trigger sobre event_codes (migrations/03_event_code_priorities.sql)
+EVENT_CODES_CHANNEL = 'event_codes_changed'
+# Altas y cambios de processed en events (migrations/06_event_notifications.sql)
+EVENTS_CHANNEL = 'events_changed'
+
+def notify(cur, channel: str, payload: dict):
+    """Emite un NOTIFY dentro de la transacción actual (se entrega al hacer commit)"""
+    cur.execute("SELECT pg_notify(%s, %s)", (channel, json.dumps(payload)))
+
 # ... resto del código igual 
\ No newline at end of file
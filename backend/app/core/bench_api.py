@@ -0,0 +1,115 @@
+"""Benchmark del pool de conexiones de la API.
+
+Dos modos:
+  --mode db    compara, sin HTTP, una conexión nueva por petición (la ruta
+               anterior con get_db_connection) contra db_pool, con la misma
+               consulta y los mismos hilos concurrentes.
+  --mode http  mide req/s y latencia de un endpoint de una API en marcha;
+               correrlo antes y después de un cambio para comparar.
+
+Uso (desde backend/):
+    python -m app.core.bench_api --mode db --threads 20 --requests 5000
+    python -m app.core.bench_api --mode http --url http://localhost:8000/clients --threads 50
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from alarm_server.bench_ingest import percentile
+from app.config.database import DatabasePool, get_db_connection
+
+QUERY = "SELECT id, name FROM clients ORDER BY name LIMIT 50"
+
+
+def run(requests: int, threads: int, call) -> dict:
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            call()
+        except Exception:
+            with lock:
+                errors += 1
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': requests,
+        'errors': errors,
+        'req_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 2) if latencies else None,
+    }
+
+
+def query_new_connection():
+    """Ruta anterior: conexión, consulta y cierre por cada petición"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(QUERY)
+            cur.fetchall()
+    finally:
+        conn.close()
+
+
+def bench_db(requests: int, threads: int, pool_size: int) -> dict:
+    pool = DatabasePool(minconn=min(2, pool_size), maxconn=pool_size)
+    pool.open()
+
+    def query_pool():
+        with pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(QUERY)
+            cur.fetchall()
+
+    try:
+        return {
+            'conexion_por_peticion': run(requests, threads, query_new_connection),
+            'pool': {**run(requests, threads, query_pool), 'metrics': pool.metrics()},
+        }
+    finally:
+        pool.close()
+
+
+def bench_http(url: str, token: str, requests: int, threads: int) -> dict:
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+
+    def get():
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=30) as response:
+            response.read()
+
+    return {'url': url, **run(requests, threads, get)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del pool de conexiones de la API')
+    parser.add_argument('--mode', choices=('db', 'http'), default='db')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=20)
+    parser.add_argument('--pool-size', type=int, default=20)
+    parser.add_argument('--url', default='http://localhost:8000/clients')
+    parser.add_argument('--token', help='JWT para endpoints con permisos')
+    args = parser.parse_args()
+
+    if args.mode == 'db':
+        result = bench_db(args.requests, args.threads, args.pool_size)
+    else:
+        result = bench_http(args.url, args.token, args.requests, args.threads)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""Verifica con EXPLAIN que las consultas frecuentes de la API usen índices.
+
+Ejecuta EXPLAIN (FORMAT JSON) sobre cada consulta de queries() y termina con
+código 1 si alguna hace Seq Scan sobre una tabla con más de --min-rows filas
+estimadas. Las tablas chicas se recorren completas a propósito y no cuentan.
+
+Pensado para una base local con las migraciones aplicadas. Con --seed carga
+datos sintéticos (eventos, logs, servicios, asignaciones, inventario) dentro
+de una transacción, corre ANALYZE y los EXPLAIN, y al final hace ROLLBACK: la
+base queda como estaba. Sin --seed se miran los planes sobre los datos existentes.
+
+Las consultas no se copian: se arman con los mismos builders y constantes
+de main.py (events_history_query, CLIENTS_QUERY, ...) y con page_query, que
+es lo que ejecuta fetch_page. Los reportes y las exportaciones agregan o
+recorren la tabla completa por diseño y no están en la lista. Al agregar una
+consulta frecuente en main.py, sacarla a un builder o constante y sumarla a
+queries().
+
+Uso (desde backend/):
+    python -m app.core.check_query_plans --seed 200000
+
+tests/app/test_query_plans.py corre lo mismo con pytest, y se saltea si la
+base de DB_CONFIG no responde.
+"""
+import argparse
+import sys
+from typing import Iterator, List, Tuple
+
+from app.config.database import get_db_connection
+from app.core.event_push import PENDING_EVENTS_QUERY
+from app.core.pagination import DEFAULT_PAGE_SIZE, page_query
+
+Query = Tuple[str, str, list]
+
+SEED = [
+    """
+    INSERT INTO users (username, password)
+    VALUES ('plan_check', 'x')
+    """,
+    """
+    INSERT INTO clients (name, company, tax_id, client_number, billing_type)
+    SELECT 'Cliente ' || g, 'Empresa ' || g, 'PLAN-' || g, 'PLAN-' || g, 'A'
+    FROM generate_series(1, %(clients)s) g
+    """,
+    """
+    INSERT INTO alarm_panels (client_id, account_number, verification_code, panel_type, last_connection)
+    SELECT id, 'PLAN-' || id, '0000', 'plan_check', NOW() - random() * INTERVAL '30 days'
+    FROM clients WHERE tax_id LIKE 'PLAN-%%'
+    """,
+    # Un año de eventos; 1 de cada 100 queda pendiente
+    """
+    WITH panels AS (
+        SELECT array_agg(id) AS ids FROM alarm_panels WHERE panel_type = 'plan_check'
+    )
+    INSERT INTO events (panel_id, event_type, raw_message, code, timestamp, processed, priority)
+    SELECT ids[1 + g %% array_length(ids, 1)], 'CID', 'plan_check', 'E130',
+           NOW() - (g %% 525600) * INTERVAL '1 minute', g %% 100 <> 0, 1 + g %% 3
+    FROM panels, generate_series(1, %(events)s) g
+    """,
+    """
+    INSERT INTO event_logs (event_id, operator_id, action)
+    SELECT e.id, u.id, 'process'
+    FROM events e, users u
+    WHERE e.raw_message = 'plan_check' AND e.id %% 10 = 0 AND u.username = 'plan_check'
+    """,
+    """
+    INSERT INTO inventory_items (code, name, category, stock, min_stock)
+    SELECT 'PLAN-' || g, 'Artículo ' || g, 'plan_check', g %% 50, 10
+    FROM generate_series(1, %(inventory)s) g
+    """,
+    """
+    INSERT INTO technicians (user_id)
+    SELECT id FROM users, generate_series(1, 20) WHERE username = 'plan_check'
+    """,
+    """
+    WITH clients_seed AS (
+        SELECT array_agg(id) AS ids FROM clients WHERE tax_id LIKE 'PLAN-%%'
+    )
+    INSERT INTO technical_services (client_id, service_type, priority, status, scheduled_date,
+                                    location_lat, location_lon)
+    SELECT ids[1 + g %% array_length(ids, 1)], 'mantenimiento', 1 + g %% 3,
+           (ARRAY['pending', 'assigned', 'completed', 'completed'])[1 + g %% 4],
+           NOW() - (g %% 730) * INTERVAL '1 day', -34.6, -58.4
+    FROM clients_seed, generate_series(1, %(services)s) g
+    """,
+    """
+    WITH techs AS (SELECT array_agg(id) AS ids FROM technicians)
+    INSERT INTO service_assignments (service_id, technician_id)
+    SELECT ts.id, ids[1 + ts.id %% array_length(ids, 1)]
+    FROM technical_services ts, techs
+    WHERE ts.service_type = 'mantenimiento' AND ts.status <> 'pending'
+    """,
+    # Algunos servicios con dos técnicos: salen dos veces en los listados
+    """
+    WITH techs AS (SELECT array_agg(id) AS ids FROM technicians)
+    INSERT INTO service_assignments (service_id, technician_id)
+    SELECT ts.id, ids[1 + (ts.id + 1) %% array_length(ids, 1)]
+    FROM technical_services ts, techs
+    WHERE ts.service_type = 'mantenimiento' AND ts.status <> 'pending' AND ts.id %% 50 = 0
+    """,
+]
+
+ANALYZE = ['users', 'clients', 'alarm_panels', 'events', 'event_logs', 'inventory_items',
+           'technicians', 'technical_services', 'service_assignments']
+
+
+def queries(cur) -> List[Query]:
+    # main se importa recién acá: importarlo arma la aplicación FastAPI completa
+    import main as api
+
+    # Las consultas salen de los mismos builders y constantes que usan los
+    # endpoints de main.py. Cada listado paginado se mira en la primera página
+    # y desde un cursor de ejemplo: la prueba de las páginas profundas es que
+    # el índice arranca en la clave, no cuántas filas quedan después
+    def page(keyset, built, key=None, limit=DEFAULT_PAGE_SIZE) -> Tuple[str, list]:
+        query, params = built
+        cursor = keyset.encode(key) if key else None
+        query, params, _ = page_query(keyset, query, params, cursor, limit)
+        return query, params
+
+    history_key = ['1', '2024-01-01 00:00:00+00', '1000']
+    services_key = ['2', '2024-01-01 00:00:00+00', '1000', '0']
+    clients_key = ['Cliente 500', '1000']
+    inventory_key = ['false', 'plan_check', 'false', 'Artículo 500', '1000']
+    day = '2024-06-01'
+
+    result = [
+        ('events/pending', PENDING_EVENTS_QUERY, []),
+        ('dashboard/stats', api.DASHBOARD_STATS_QUERY, []),
+        ('events/{id}/details', api.EVENT_DETAILS_QUERY, [1000]),
+        ('events/{id}/details logs', api.EVENT_LOGS_QUERY, [1000]),
+        # Lo que revisa la FK event_logs.event_id al borrar un evento
+        ('event_logs por evento', "SELECT 1 FROM event_logs WHERE event_id = %s", [1000]),
+        ('clients', *page(api.CLIENTS_ORDER, (api.CLIENTS_QUERY, []))),
+        ('clients cursor', *page(api.CLIENTS_ORDER, (api.CLIENTS_QUERY, []), clients_key)),
+        ('events/history', *page(api.EVENTS_HISTORY_ORDER, api.events_history_query())),
+        ('events/history pending', *page(api.EVENTS_HISTORY_ORDER, api.events_history_query(status='pending'))),
+        ('events/history processed',
+         *page(api.EVENTS_HISTORY_ORDER, api.events_history_query(status='processed'))),
+        ('events/history priority', *page(api.EVENTS_HISTORY_ORDER, api.events_history_query(priority='1'))),
+        ('events/history today', *page(api.EVENTS_HISTORY_ORDER, api.events_history_query(date_range='today'))),
+        ('events/history cursor', *page(api.EVENTS_HISTORY_ORDER, api.events_history_query(), history_key)),
+        ('technical-services', *page(api.SERVICES_ORDER, api.technical_services_query())),
+        ('technical-services cursor', *page(api.SERVICES_ORDER, api.technical_services_query(), services_key)),
+        ('technical-services from_date',
+         *page(api.SERVICES_ORDER, api.technical_services_query(from_date=day))),
+        ('inventory', *page(api.INVENTORY_ORDER, api.inventory_query())),
+        ('inventory cursor', *page(api.INVENTORY_ORDER, api.inventory_query(), inventory_key)),
+        ('map/service-locations', *page(api.SERVICES_ORDER, api.service_locations_query())),
+        ('map/service-locations date', *page(api.SERVICES_ORDER, api.service_locations_query(date=day))),
+        ('technician-routes/optimize', api.ROUTE_SERVICES_QUERY, [1, day, day]),
+    ]
+
+    cur.execute("SELECT to_regclass('notifications') IS NOT NULL")
+    if cur.fetchone()[0]:
+        result += [
+            ('notifications', *api.notifications_query(1)),
+            ('notifications unread', *api.notifications_query(1, unread_only=True)),
+        ]
+    return result
+
+
+def seq_scans(plan: dict) -> Iterator[str]:
+    if plan.get('Node Type') == 'Seq Scan':
+        yield plan['Relation Name']
+    for child in plan.get('Plans', []):
+        yield from seq_scans(child)
+
+
+def table_rows(cur) -> dict:
+    cur.execute("SELECT relname, reltuples FROM pg_class WHERE relkind = 'r'")
+    return dict(cur.fetchall())
+
+
+def check(cur, min_rows: int, verbose: bool = False) -> List[str]:
+    rows = table_rows(cur)
+    failures = []
+    for name, query, params in queries(cur):
+        cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+        plan = cur.fetchone()[0][0]['Plan']
+        large = sorted({t for t in seq_scans(plan) if rows.get(t, 0) >= min_rows})
+        status = 'SEQ SCAN ' + ', '.join(large) if large else 'ok'
+        print(f"{name:32} {status}  (costo {plan['Total Cost']:.0f})")
+        if large:
+            failures.append(name)
+        if verbose or large:
+            cur.execute("EXPLAIN " + query, params)
+            print("\n".join("    " + line for (line,) in cur.fetchall()))
+    return failures
+
+
+def run(cur, seed: int = 0, min_rows: int = 10000, verbose: bool = False) -> List[str]:
+    """Carga seed eventos sintéticos (si seed) y revisa los planes.
+
+    No confirma nada: el llamador hace ROLLBACK para descartar los datos.
+    """
+    if seed:
+        sizes = {'events': seed, 'clients': max(seed // 100, 10),
+                 'services': max(seed // 10, 10), 'inventory': max(seed // 10, 10)}
+        for statement in SEED:
+            cur.execute(statement, sizes)
+        for table in ANALYZE:
+            cur.execute(f"ANALYZE {table}")
+    return check(cur, min_rows, verbose)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verifica que las consultas frecuentes usen índices')
+    parser.add_argument('--seed', type=int, default=0, metavar='EVENTS',
+                        help='carga EVENTS eventos sintéticos (y datos proporcionales) y los deshace al final')
+    parser.add_argument('--min-rows', type=int, default=10000,
+                        help='tablas con menos filas estimadas pueden recorrerse completas')
+    parser.add_argument('--verbose', action='store_true', help='muestra todos los planes')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            failures = run(cur, args.seed, args.min_rows, args.verbose)
+    finally:
+        # Nunca se confirma: los datos sintéticos y las estadísticas se descartan
+        conn.rollback()
+        conn.close()
+
+    if failures:
+        print(f"\n{len(failures)} consultas recorren tablas grandes completas: {', '.join(failures)}")
+        sys.exit(1)
+    print("\nTodas las consultas usan índices")
+
+
+if __name__ == '__main__':
+    main()
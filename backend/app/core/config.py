@@ -18,6 +18,9 @@ class Settings(BaseModel):
     DEBUG: bool = True
     ALLOWED_ORIGINS: List[str] = ['http://localhost:5173', 'http://127.0.0.1:5173']
 
+    # Hilos para endpoints síncronos (consultas a la base); 0 = 2 x DB_POOL_MAX
+    API_THREADS: int = 0
+
     # Application settings
     APP_NAME: str = 'MonitoringApp'
     APP_VERSION: str = '1.0.0'
@@ -40,6 +43,9 @@ class Settings(BaseModel):
         if os.getenv('ALLOWED_ORIGINS'):
             self.ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS').split(',')
         
+        if os.getenv('API_THREADS'):
+            self.API_THREADS = int(os.getenv('API_THREADS'))
+
         if os.getenv('APP_NAME'): self.APP_NAME = os.getenv('APP_NAME')
         if os.getenv('APP_VERSION'): self.APP_VERSION = os.getenv('APP_VERSION')
 
@@ -0,0 +1,175 @@
+"""Envío de eventos pendientes a las consolas por WebSocket a partir de LISTEN/NOTIFY.
+
+El trigger de events (migrations/06_event_notifications.sql) notifica el id
+de cada evento nuevo o procesado. Las notificaciones se juntan durante unos
+milisegundos y se leen con una sola consulta, la misma que usa
+/events/pending. El resultado se aplica al conjunto de pendientes en memoria
+(app/core/pending.py) y solo los deltas numerados salen hacia las consolas,
+filtrados por los temas a los que cada una está suscrita (ver event_topics).
+
+Protocolo de /ws/events:
+    servidor -> {"type": "pending_snapshot", "epoch", "seq", "data": [eventos]}
+    servidor -> {"type": "pending_delta", "data": [{"seq", "op", "id", "event"?}]}
+    consola  -> {"action": "resume", "epoch", "since"} tras un "resync"
+Al reconectar, la consola pasa ?epoch=&since= con el último seq que aplicó y
+recibe solo los deltas que se perdió.
+"""
+import asyncio
+import json
+import logging
+from typing import List, Optional, Set
+
+from psycopg2.extras import DictCursor
+
+from app.config.database import db_pool
+from app.core.pending import PendingEvents
+
+logger = logging.getLogger(__name__)
+
+EVENTS_SELECT = """
+    SELECT
+        e.*,
+        c.id as client_id,
+        c.name as client_name,
+        c.company as client_company,
+        c.address as client_address,
+        c.phone as client_phone,
+        ap.verification_code
+    FROM events e
+    JOIN alarm_panels ap ON e.panel_id = ap.id
+    JOIN clients c ON ap.client_id = c.id
+"""
+
+# Usa el índice parcial idx_events_pending (migrations/08_query_plan_indexes.sql)
+PENDING_EVENTS_QUERY = EVENTS_SELECT + " WHERE e.processed = FALSE ORDER BY e.priority ASC, e.timestamp DESC"
+
+
+def format_event(row) -> dict:
+    """Agrupa los datos del cliente como los espera la consola"""
+    event = dict(row)
+    event['client_info'] = {
+        'id': event.pop('client_id'),
+        'name': event.pop('client_name'),
+        'company': event.pop('client_company'),
+        'address': event.pop('client_address'),
+        'phone': event.pop('client_phone'),
+        'verification_code': event.pop('verification_code')
+    }
+    return event
+
+
+def event_topics(event: dict) -> List[str]:
+    return [
+        f"client:{event['client_info']['id']}",
+        f"panel:{event['panel_id']}",
+        f"priority:{event['priority']}",
+    ]
+
+
+def fetch_pending_events() -> List[dict]:
+    with db_pool.connection() as conn, conn.cursor(cursor_factory=DictCursor) as cur:
+        cur.execute(PENDING_EVENTS_QUERY)
+        return [format_event(row) for row in cur.fetchall()]
+
+
+def fetch_events(ids: List[int]) -> List[dict]:
+    with db_pool.connection() as conn, conn.cursor(cursor_factory=DictCursor) as cur:
+        cur.execute(EVENTS_SELECT + " WHERE e.id = ANY(%s)", (ids,))
+        return [format_event(row) for row in cur.fetchall()]
+
+
+class EventPublisher:
+    def __init__(self, manager, delay: float = 0.02, max_batch: int = 1000,
+                 retry_delay: float = 5.0):
+        self.manager = manager
+        self.delay = delay
+        self.max_batch = max_batch
+        self.retry_delay = retry_delay
+        self.pending_events = PendingEvents(event_topics)
+        self.changed: Set[int] = set()
+        # Hace falta una lectura completa (arranque, reconexión del listener o error)
+        self.stale = True
+        self.wakeup = asyncio.Event()
+        self.stats = {'notifications': 0, 'batches': 0, 'deltas': 0, 'reloads': 0, 'errors': 0}
+
+    def handle_notification(self, payload: str):
+        self.stats['notifications'] += 1
+        self.changed.add(json.loads(payload)['id'])
+        self.wakeup.set()
+
+    async def resync(self):
+        """Relee los pendientes completos: se pudieron perder avisos sin conexión"""
+        self.stale = True
+        self.wakeup.set()
+
+    def catch_up(self, websocket, since: Optional[int] = None, epoch: Optional[str] = None):
+        """Envía a una consola lo que le falta: los deltas desde since o un snapshot"""
+        def include(topics):
+            return self.manager.wants(websocket, topics)
+
+        if since is not None and epoch == self.pending_events.epoch:
+            deltas = self.pending_events.since(since)
+            if deltas is not None:
+                self.manager.send(websocket, {
+                    'type': 'pending_delta',
+                    'data': [delta for delta, topics in deltas if include(topics)],
+                })
+                return
+        self.manager.send(websocket, {'type': 'pending_snapshot', **self.pending_events.snapshot(include)})
+
+    async def _publish_deltas(self, deltas: list):
+        self.stats['deltas'] += len(deltas)
+        if deltas:
+            await self.manager.publish_batch('pending_delta', deltas)
+
+    async def _reload(self):
+        loop = asyncio.get_running_loop()
+        rows = await loop.run_in_executor(None, fetch_pending_events)
+        self.stats['reloads'] += 1
+        await self._publish_deltas(self.pending_events.replace(rows))
+
+    async def _publish(self, ids: List[int]):
+        loop = asyncio.get_running_loop()
+        rows = {row['id']: row for row in await loop.run_in_executor(None, fetch_events, ids)}
+        self.stats['batches'] += 1
+        deltas = []
+        for event_id in ids:
+            # Un id que ya no está en la base sale de los pendientes
+            delta = self.pending_events.apply(rows.get(event_id) or {'id': event_id, 'processed': True})
+            if delta:
+                deltas.append(delta)
+        await self._publish_deltas(deltas)
+
+    async def run(self):
+        self.wakeup.set()
+        while True:
+            await self.wakeup.wait()
+            # Ventana corta para juntar el resto del lote
+            await asyncio.sleep(self.delay)
+            self.wakeup.clear()
+            try:
+                if self.stale:
+                    # La lectura completa incluye los cambios avisados hasta ahora
+                    self.changed.clear()
+                    self.stale = False
+                    await self._reload()
+                    continue
+                ids = list(self.changed)[:self.max_batch]
+                self.changed.difference_update(ids)
+                if self.changed:
+                    self.wakeup.set()
+                await self._publish(ids)
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Error actualizando los eventos pendientes: {e}")
+                self.stale = True
+                self.wakeup.set()
+                await asyncio.sleep(self.retry_delay)
+
+    def metrics(self) -> dict:
+        return {
+            'pending_events': len(self.pending_events),
+            'seq': self.pending_events.seq,
+            'changed': len(self.changed),
+            **self.stats,
+        }
@@ -1,6 +1,11 @@
+import asyncio
+import logging
+from collections import deque
 from datetime import datetime
 from typing import Dict, List
 
+logger = logging.getLogger(__name__)
+
 class MonitoringSystem:
     def __init__(self):
         self.metrics: Dict[str, List[float]] = {}
@@ -20,4 +25,42 @@ class MonitoringSystem:
     def _check_alerts(self, metric_name: str, value: float) -> None:
         """Verifica si se debe generar una alerta basada en el valor de la métrica"""
         # Implementa tu lógica de alertas aquí
-        pass 
\ No newline at end of file
+        pass
+
+
+class LoopLagProbe:
+    """Mide cuánto se atrasa el event loop.
+
+    Duerme interval segundos y registra cuánto tarda de más en despertar:
+    con el loop libre el retraso es de décimas de milisegundo; una consulta
+    bloqueante dentro de un endpoint async lo lleva a la duración de la
+    consulta. Se conservan las últimas window muestras.
+    """
+
+    def __init__(self, interval: float = 0.1, warn_ms: float = 100.0, window: int = 600):
+        self.interval = interval
+        self.warn_ms = warn_ms
+        self.samples: "deque[float]" = deque(maxlen=window)
+        self.stats = {'samples': 0, 'stalls': 0, 'max_lag_ms': 0.0}
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - start - self.interval) * 1000)
+            self.samples.append(lag_ms)
+            self.stats['samples'] += 1
+            self.stats['max_lag_ms'] = max(self.stats['max_lag_ms'], lag_ms)
+            if lag_ms >= self.warn_ms:
+                self.stats['stalls'] += 1
+                logger.warning(f"Event loop bloqueado {lag_ms:.0f} ms")
+
+    def metrics(self) -> dict:
+        ordered = sorted(self.samples)
+        return {
+            'last_lag_ms': self.samples[-1] if self.samples else 0.0,
+            'avg_lag_ms': sum(ordered) / len(ordered) if ordered else 0.0,
+            'p99_lag_ms': ordered[int(0.99 * (len(ordered) - 1))] if ordered else 0.0,
+            **self.stats,
+        }
@@ -0,0 +1,132 @@
+"""Paginación por keyset (cursor) para los listados grandes.
+
+En lugar de OFFSET, que recorre y descarta todas las filas anteriores, cada
+página sigue desde la clave de orden de la última fila entregada:
+
+    WHERE ... AND (k1, k2, id) > (%s, %s, %s) ORDER BY k1, k2, id LIMIT n + 1
+
+Con un índice sobre las mismas expresiones (ver migrations/07_keyset_indexes.sql)
+cada página cuesta O(n) sin importar la profundidad. Para que la comparación
+de filas sirva todas las claves van en el mismo sentido, ninguna puede ser
+NULL (se usa COALESCE, precedido de "expr IS NULL" si los NULL deben quedar
+al final como en un ORDER BY ascendente) y la clave completa identifica una
+única fila del resultado. Si un LEFT JOIN puede repetir la fila de la tabla principal (un
+servicio con varias asignaciones) no alcanza con su id: se agrega el id de la
+tabla unida como último desempate. Esas claves no están en el índice
+(indexed indica cuántas sí), así que la condición repite el prefijo indexado
+con >= para que Postgres arranque igual el recorrido en el cursor.
+
+El cursor es opaco para el cliente: la clave de la última fila, en texto,
+como JSON en base64url. Postgres convierte cada valor al tipo de su
+expresión al comparar, así 'infinity' o los decimales vuelven exactos.
+
+La paginación es opcional: sin cursor ni limit el endpoint devuelve la lista
+completa, en el mismo orden, como antes de paginar (los listados del
+frontend la usan así). Con cualquiera de los dos se devuelven páginas de
+limit filas (DEFAULT_PAGE_SIZE si no se indica).
+"""
+import base64
+import binascii
+import json
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class Keyset:
+    def __init__(self, *expressions: str, descending: bool = False, indexed: Optional[int] = None):
+        self.expressions = expressions
+        self.descending = descending
+        # Claves iniciales cubiertas por el índice; las demás solo desempatan
+        self.indexed = len(expressions) if indexed is None else indexed
+        self.aliases = [f"_page_key_{i}" for i in range(len(expressions))]
+        # Columnas a agregar al SELECT de la consulta para armar el cursor
+        self.columns = ", ".join(f"({expr})::text AS {alias}"
+                                 for expr, alias in zip(expressions, self.aliases))
+
+    def _compare(self, expressions, operator: str) -> str:
+        placeholders = ", ".join(["%s"] * len(expressions))
+        return f"({', '.join(expressions)}) {operator} ({placeholders})"
+
+    def condition(self) -> str:
+        operator = "<" if self.descending else ">"
+        condition = self._compare(self.expressions, operator)
+        if self.indexed < len(self.expressions):
+            condition = f"{self._compare(self.expressions[:self.indexed], operator + '=')} AND {condition}"
+        return condition
+
+    def bind(self, cursor: str) -> List[str]:
+        """Parámetros de condition() para un cursor"""
+        values = self.decode(cursor)
+        if self.indexed < len(self.expressions):
+            return values[:self.indexed] + values
+        return values
+
+    def order_by(self) -> str:
+        direction = " DESC" if self.descending else ""
+        return "ORDER BY " + ", ".join(f"{expr}{direction}" for expr in self.expressions)
+
+    def encode(self, values: List[str]) -> str:
+        raw = json.dumps(values, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def decode(self, cursor: str) -> List[str]:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            values = json.loads(raw)
+        except (binascii.Error, ValueError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        if (not isinstance(values, list) or len(values) != len(self.expressions)
+                or not all(isinstance(v, str) for v in values)):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        return values
+
+
+def page_size(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def page_query(keyset: Keyset, query: str, params: list, cursor: Optional[str] = None,
+               limit: Optional[int] = None) -> Tuple[str, list, Optional[int]]:
+    """Consulta, parámetros y tamaño de página (None = sin paginar) que ejecuta fetch_page"""
+    paginated = bool(cursor) or limit is not None
+    size = page_size(limit) if paginated else None
+    params = list(params)
+    if cursor:
+        query += " AND " + keyset.condition()
+        params.extend(keyset.bind(cursor))
+    query += f" {keyset.order_by()}"
+    if paginated:
+        query += " LIMIT %s"
+        params.append(size + 1)
+    return query, params, size
+
+
+def fetch_page(cur, keyset: Keyset, query: str, params: list,
+               cursor: Optional[str] = None, limit: Optional[int] = None) -> dict:
+    """Ejecuta una página de query (que debe incluir keyset.columns y terminar en su WHERE).
+
+    Devuelve data y next_cursor; next_cursor es None en la última página. Sin
+    cursor ni limit devuelve todas las filas (limit None).
+    """
+    query, params, size = page_query(keyset, query, params, cursor, limit)
+    paginated = size is not None
+    cur.execute(query, params)
+    rows = cur.fetchall()
+
+    data = []
+    last_key = None
+    for row in rows[:size]:
+        item = dict(row)
+        last_key = [item.pop(alias) for alias in keyset.aliases]
+        data.append(item)
+    return {
+        "data": data,
+        "next_cursor": keyset.encode(last_key) if paginated and len(rows) > size else None,
+        "limit": size,
+    }
@@ -0,0 +1,116 @@
+"""Conjunto en memoria de eventos pendientes con historial de cambios numerado.
+
+Los eventos sin procesar se guardan ordenados por (prioridad, timestamp
+descendente, id), el mismo orden de /events/pending. Cada alta, cambio o
+baja genera un delta con un número de secuencia creciente; los últimos
+max_log deltas se conservan para que una consola que reconecta pida solo
+lo que se perdió (since) en lugar de la lista completa. Si el número es
+anterior al historial o de otra instancia (epoch distinto) recibe un
+snapshot.
+
+Cada delta guarda los temas de WebSocket del evento (antes y después del
+cambio) para filtrarlo por suscripción al publicarlo o al reenviarlo.
+"""
+import time
+from bisect import bisect_left, insort
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+Delta = dict
+TopicsOf = Callable[[dict], List[str]]
+
+
+def pending_key(event: dict) -> Tuple:
+    timestamp = event.get('timestamp')
+    seconds = timestamp.timestamp() if isinstance(timestamp, datetime) else 0.0
+    return (event.get('priority') or 0, -seconds, event['id'])
+
+
+class PendingEvents:
+    def __init__(self, topics_of: TopicsOf, max_log: int = 10000):
+        self.topics_of = topics_of
+        self.epoch = format(int(time.time() * 1000), 'x')
+        self.seq = 0
+        self.loaded = False
+        self.events: Dict[int, dict] = {}
+        self.keys: Dict[int, Tuple] = {}
+        self.order: List[Tuple] = []
+        self.log: "deque[Tuple[Delta, List[str]]]" = deque(maxlen=max_log)
+
+    def _delta(self, op: str, event: dict, previous: Optional[dict] = None) -> Tuple[Delta, List[str]]:
+        self.seq += 1
+        delta = {'seq': self.seq, 'op': op, 'id': event['id']}
+        if op != 'remove':
+            delta['event'] = event
+        topics = self.topics_of(event)
+        if previous is not None:
+            # Si cambió la prioridad, también se entera quien seguía la anterior
+            topics = list(dict.fromkeys(topics + self.topics_of(previous)))
+        entry = (delta, topics)
+        self.log.append(entry)
+        return entry
+
+    def _remove(self, event_id: int) -> dict:
+        key = self.keys.pop(event_id)
+        del self.order[bisect_left(self.order, key)]
+        return self.events.pop(event_id)
+
+    def apply(self, row: dict) -> Optional[Tuple[Delta, List[str]]]:
+        """Aplica el estado actual de un evento; devuelve el delta o None si no cambió nada"""
+        event_id = row['id']
+        if row.get('processed'):
+            if event_id not in self.events:
+                return None
+            return self._delta('remove', self._remove(event_id))
+
+        event = jsonable_encoder(row)
+        current = self.events.get(event_id)
+        if current == event:
+            return None
+        if current is not None:
+            self._remove(event_id)
+        key = pending_key(row)
+        self.events[event_id] = event
+        self.keys[event_id] = key
+        insort(self.order, key)
+        return self._delta('update' if current is not None else 'insert', event, current)
+
+    def replace(self, rows: Iterable[dict]) -> List[Tuple[Delta, List[str]]]:
+        """Reemplaza el conjunto por una lectura completa y devuelve las diferencias"""
+        deltas = []
+        seen = set()
+        for row in rows:
+            seen.add(row['id'])
+            delta = self.apply(row)
+            if delta:
+                deltas.append(delta)
+        for event_id in [i for i in self.events if i not in seen]:
+            deltas.append(self._delta('remove', self._remove(event_id)))
+        self.loaded = True
+        return deltas
+
+    def snapshot(self, include: Callable[[List[str]], bool] = lambda topics: True) -> dict:
+        """Eventos pendientes en orden; include decide por los temas de cada uno"""
+        events = (self.events[key[2]] for key in self.order)
+        return {
+            'epoch': self.epoch,
+            'seq': self.seq,
+            'data': [event for event in events if include(self.topics_of(event))],
+        }
+
+    def since(self, seq: int) -> Optional[List[Tuple[Delta, List[str]]]]:
+        """Deltas posteriores a seq, o None si ya no están en el historial"""
+        if seq > self.seq:
+            return None
+        if seq == self.seq:
+            return []
+        if not self.log or self.log[0][0]['seq'] > seq + 1:
+            return None
+        # Los seq del historial son consecutivos: se indexa directo
+        return list(self.log)[seq + 1 - self.log[0][0]['seq']:]
+
+    def __len__(self) -> int:
+        return len(self.events)
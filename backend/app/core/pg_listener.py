@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from app.config.database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+NotifyHandler = Callable[[str], None]
+
+
+class PgListener:
+    """Escucha canales LISTEN/NOTIFY de Postgres sin bloquear el event loop.
+
+    Registra el socket de la conexión en el loop (add_reader) y despacha cada
+    notificación al handler de su canal. Si la conexión se cae, reintenta y
+    llama a on_connect para que los consumidores se resincronicen (las
+    notificaciones emitidas mientras no había conexión se pierden).
+    """
+
+    def __init__(self, retry_delay: float = 5.0):
+        self.handlers: Dict[str, NotifyHandler] = {}
+        self.on_connect: Optional[Callable[[], Awaitable[None]]] = None
+        self.retry_delay = retry_delay
+        self.connected = False
+        self.notifications = 0
+
+    def subscribe(self, channel: str, handler: NotifyHandler):
+        self.handlers[channel] = handler
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            conn = None
+            try:
+                conn = await loop.run_in_executor(None, get_db_connection)
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    for channel in self.handlers:
+                        cur.execute(f"LISTEN {channel}")
+
+                self.connected = True
+                if self.on_connect:
+                    await self.on_connect()
+
+                ready = asyncio.Event()
+                loop.add_reader(conn.fileno(), ready.set)
+                try:
+                    while True:
+                        await ready.wait()
+                        ready.clear()
+                        conn.poll()
+                        while conn.notifies:
+                            notify = conn.notifies.pop(0)
+                            self.notifications += 1
+                            handler = self.handlers.get(notify.channel)
+                            if handler:
+                                try:
+                                    handler(notify.payload)
+                                except Exception as e:
+                                    logger.error(f"Error procesando notificación de {notify.channel}: {e}")
+                finally:
+                    loop.remove_reader(conn.fileno())
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error en listener de Postgres: {e}")
+            finally:
+                self.connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+            await asyncio.sleep(self.retry_delay)
@@ -1,39 +1,260 @@
 # backend/app/core/websocket.py
-from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List
+"""Difusión de mensajes a las consolas conectadas por WebSocket.
+
+Cada mensaje se serializa una sola vez y se encola en cada conexión; una
+tarea escritora por socket lo envía. Así un navegador lento solo atrasa su
+propia cola y no al resto. Si la cola de una conexión se llena se aplica
+slow_policy:
+    'drop'        descarta los mensajes más viejos y, cuando la cola se vacía,
+                  envía {"type": "resync"} para que la consola recargue
+    'disconnect'  cierra la conexión (la consola reconecta y recarga)
+
+Las conexiones se suscriben a temas ('client:12', 'panel:40', 'priority:1',
+'technician:3', 'camera:7', o '*' para todo). Un índice tema -> conexiones
+permite que publish() solo toque los sockets interesados.
+"""
+from fastapi import WebSocket
+from typing import Dict, Iterable, List, Set, Tuple
 import json
 import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+RESYNC_MESSAGE = json.dumps({'type': 'resync'})
+ALL_TOPICS = '*'
+
+
+class _Connection:
+    def __init__(self, websocket: WebSocket, client_id: str, max_queue: int):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.queue: "asyncio.Queue[tuple]" = asyncio.Queue(max_queue)
+        self.topics: Set[str] = set()
+        self.lagged = False
+        self.sending_since = None
+        self.writer = None
+
 
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, max_queue: int = 256, send_timeout: float = 10.0, slow_policy: str = 'drop'):
+        if slow_policy not in ('drop', 'disconnect'):
+            raise ValueError(f"slow_policy inválida: {slow_policy}")
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.slow_policy = slow_policy
         self.active_connections: Dict[str, List[WebSocket]] = {}
-        self.broadcast_task = None
+        self.connections: Dict[WebSocket, _Connection] = {}
+        self.topics: Dict[str, Set[_Connection]] = {}
+        self.watchdog = None
+        self.loop = None
+        self.stats = {
+            'broadcasts': 0,
+            'published': 0,
+            'sent': 0,
+            'dropped': 0,
+            'slow_disconnects': 0,
+            'send_errors': 0,
+            'send_ms_total': 0.0,
+            'send_ms_max': 0.0,
+        }
 
     async def connect(self, websocket: WebSocket, client_id: str):
         await websocket.accept()
+        self.loop = asyncio.get_running_loop()
         if client_id not in self.active_connections:
             self.active_connections[client_id] = []
         self.active_connections[client_id].append(websocket)
+        connection = _Connection(websocket, client_id, self.max_queue)
+        connection.writer = asyncio.create_task(self._writer(connection))
+        self.connections[websocket] = connection
+        if self.watchdog is None or self.watchdog.done():
+            self.watchdog = asyncio.create_task(self._watch_slow())
 
     def disconnect(self, websocket: WebSocket, client_id: str):
-        if client_id in self.active_connections:
+        if websocket in self.active_connections.get(client_id, []):
             self.active_connections[client_id].remove(websocket)
             if not self.active_connections[client_id]:
                 del self.active_connections[client_id]
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+        self._unsubscribe(connection, list(connection.topics))
+        if connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str]):
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return
+        for topic in topics:
+            connection.topics.add(topic)
+            self.topics.setdefault(topic, set()).add(connection)
+
+    def unsubscribe(self, websocket: WebSocket, topics: Iterable[str]):
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            self._unsubscribe(connection, topics)
+
+    def _unsubscribe(self, connection: _Connection, topics: Iterable[str]):
+        for topic in topics:
+            connection.topics.discard(topic)
+            subscribers = self.topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(connection)
+                if not subscribers:
+                    del self.topics[topic]
+
+    def wants(self, websocket: WebSocket, topics: Iterable[str]) -> bool:
+        """Indica si la conexión está suscrita a alguno de los temas"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return False
+        return ALL_TOPICS in connection.topics or not connection.topics.isdisjoint(topics)
+
+    def _subscribers(self, topics: Iterable[str]) -> Set[_Connection]:
+        subscribers = set(self.topics.get(ALL_TOPICS, ()))
+        for topic in topics:
+            subscribers.update(self.topics.get(topic, ()))
+        return subscribers
+
+    async def _writer(self, connection: _Connection):
+        websocket = connection.websocket
+        try:
+            while True:
+                queued_at, text = await connection.queue.get()
+                connection.sending_since = time.monotonic()
+                await websocket.send_text(text)
+                connection.sending_since = None
+                # Latencia desde que se difundió hasta que salió por el socket
+                send_ms = (time.perf_counter() - queued_at) * 1000
+                self.stats['sent'] += 1
+                self.stats['send_ms_total'] += send_ms
+                self.stats['send_ms_max'] = max(self.stats['send_ms_max'], send_ms)
+                if connection.lagged and connection.queue.empty():
+                    connection.lagged = False
+                    await websocket.send_text(RESYNC_MESSAGE)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats['send_errors'] += 1
+            logger.info(f"Conexión WebSocket de {connection.client_id} cerrada: {e}")
+            await self._close(connection)
+
+    async def _watch_slow(self):
+        """Cierra las conexiones con un envío trabado más de send_timeout.
+
+        Un único vigía en lugar de un timeout por mensaje: wait_for crea una
+        tarea por envío y con miles de sockets ese costo domina la difusión.
+        """
+        while self.connections:
+            await asyncio.sleep(self.send_timeout / 2)
+            now = time.monotonic()
+            for connection in list(self.connections.values()):
+                since = connection.sending_since
+                if since is not None and now - since > self.send_timeout:
+                    self.stats['slow_disconnects'] += 1
+                    logger.warning(f"Consola {connection.client_id} no recibe mensajes en "
+                                   f"{self.send_timeout} s, se desconecta")
+                    self.disconnect(connection.websocket, connection.client_id)
+                    asyncio.ensure_future(self._close(connection))
+
+    async def _close(self, connection: _Connection):
+        self.disconnect(connection.websocket, connection.client_id)
+        try:
+            await connection.websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def _enqueue(self, connection: _Connection, item: tuple):
+        try:
+            connection.queue.put_nowait(item)
+            return
+        except asyncio.QueueFull:
+            pass
+        if self.slow_policy == 'disconnect':
+            self.stats['slow_disconnects'] += 1
+            logger.warning(f"Cola llena para la consola {connection.client_id}, se desconecta")
+            self.disconnect(connection.websocket, connection.client_id)
+            asyncio.ensure_future(connection.websocket.close(code=1013))
+            return
+        # 'drop': se pierde lo más viejo y la consola recarga al ponerse al día
+        connection.queue.get_nowait()
+        connection.queue.put_nowait(item)
+        connection.lagged = True
+        self.stats['dropped'] += 1
 
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         await websocket.send_json(message)
 
+    def send(self, websocket: WebSocket, message: dict):
+        """Encola un mensaje para una conexión, en orden con las difusiones"""
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            self._enqueue(connection, (time.perf_counter(), json.dumps(message, default=str)))
+
     async def broadcast_to_client(self, message: dict, client_id: str):
-        if client_id in self.active_connections:
-            for connection in self.active_connections[client_id]:
-                try:
-                    await connection.send_json(message)
-                except WebSocketDisconnect:
-                    await self.disconnect(connection, client_id)
+        item = (time.perf_counter(), json.dumps(message, default=str))
+        for websocket in list(self.active_connections.get(client_id, [])):
+            self._enqueue(self.connections[websocket], item)
 
     async def broadcast(self, message: dict):
-        for client_id in self.active_connections:
-            await self.broadcast_to_client(message, client_id)
+        """Encola el mensaje en todas las conexiones sin esperar los envíos"""
+        item = (time.perf_counter(), json.dumps(message, default=str))
+        self.stats['broadcasts'] += 1
+        for connection in list(self.connections.values()):
+            self._enqueue(connection, item)
+
+    async def publish(self, message: dict, topics: Iterable[str]):
+        """Encola el mensaje solo en las conexiones suscritas a alguno de los temas"""
+        subscribers = self._subscribers(topics)
+        self.stats['published'] += 1
+        if not subscribers:
+            return
+        item = (time.perf_counter(), json.dumps(message, default=str))
+        for connection in subscribers:
+            self._enqueue(connection, item)
+
+    def publish_threadsafe(self, message: dict, topics: Iterable[str]):
+        """publish() desde un endpoint síncrono (hilo del threadpool)"""
+        if self.loop is None or not self.connections:
+            return
+        topics = list(topics)
+        self.loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self.publish(message, topics)))
+
+    async def publish_batch(self, message_type: str, items: List[Tuple[dict, Iterable[str]]]):
+        """Publica un lote: cada conexión recibe un mensaje con solo sus elementos.
+
+        Las conexiones que reciben el mismo subconjunto comparten la serialización.
+        """
+        slices: Dict[_Connection, List[int]] = {}
+        for index, (_, topics) in enumerate(items):
+            for connection in self._subscribers(topics):
+                slices.setdefault(connection, []).append(index)
+        self.stats['published'] += len(items)
+
+        encoded: Dict[tuple, tuple] = {}
+        now = time.perf_counter()
+        for connection, indexes in slices.items():
+            key = tuple(indexes)
+            item = encoded.get(key)
+            if item is None:
+                data = [items[i][0] for i in indexes]
+                item = encoded[key] = (now, json.dumps({'type': message_type, 'data': data}, default=str))
+            self._enqueue(connection, item)
+
+    def metrics(self) -> dict:
+        depths = [c.queue.qsize() for c in self.connections.values()]
+        sent = self.stats['sent']
+        return {
+            'connections': len(self.connections),
+            'topics': len(self.topics),
+            'queued': sum(depths),
+            'max_queue_depth': max(depths, default=0),
+            'lagged': sum(1 for c in self.connections.values() if c.lagged),
+            'avg_send_ms': self.stats['send_ms_total'] / sent if sent else 0.0,
+            **self.stats,
+        }
 
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager()
@@ -1,20 +1,30 @@
 import load_env  # Esto cargará las variables de entorno
-from fastapi import FastAPI, HTTPException, Request, Depends
+from fastapi import FastAPI, HTTPException, Request, Depends, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from app.auth.permissions import Permission, check_permission
-from app.auth.jwt import create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
-from app.config.database import get_db_connection
+from app.auth.permissions import Permission, check_permission, has_permission
+from app.auth.jwt import create_access_token, decode_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.config.database import db_pool, get_db, notify, PoolTimeout, PANELS_CHANNEL, EVENTS_CHANNEL
+from app.core.event_push import EventPublisher, fetch_pending_events
+from app.core.pg_listener import PgListener
+from app.core.websocket import manager
 from app.core.config import settings
+from app.core.monitoring import LoopLagProbe
+from app.core.pagination import Keyset, fetch_page
+from app.core.export import stream_export
+from anyio import from_thread, to_thread
+from alarm_server.event_codes import default_sia_priority
 from pydantic import BaseModel, EmailStr, Field
 import bcrypt
 import psycopg2
 from psycopg2.extras import DictCursor
-import os
 from dotenv import load_dotenv
 from datetime import datetime, timezone, timedelta
 from typing import List, Optional
 import logging
+import asyncio
+import json
 
 logging.basicConfig(
     level=logging.INFO,
@@ -68,15 +78,6 @@ async def log_requests(request: Request, call_next):
             content={"detail": str(e)}
         )
 
-# Configuración DB directa para pruebas
-DB_CONFIG = {
-    'dbname': 'monitoring_db',
-    'user': 'postgres',
-    'password': 'veoveo77',
-    'host': 'localhost',
-    'port': '5432'
-}
-
 # Modelo para los datos de login
 class LoginData(BaseModel):
     username: str
@@ -162,6 +163,7 @@ class PanelBase(BaseModel):
     ip_address: Optional[str]
     port: Optional[int]
     notes: Optional[str]
+    supervision_interval: Optional[int] = None  # segundos entre reportes; None = sin supervisión
 
 class ZoneBase(BaseModel):
     zone_number: int
@@ -170,36 +172,37 @@ class ZoneBase(BaseModel):
     bypass_allowed: bool = True
 
 # Endpoints de Clientes
+CLIENTS_ORDER = Keyset("name", "id")
+
+CLIENTS_QUERY = f"""
+            SELECT {CLIENTS_ORDER.columns}, * FROM clients
+            WHERE 1=1
+"""
+
 @app.get("/clients")
-async def get_clients():
+def get_clients(cursor: str = None, limit: int = None, conn=Depends(get_db)):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
         cur = conn.cursor(cursor_factory=DictCursor)
         
-        cur.execute("""
-            SELECT * FROM clients 
-            ORDER BY name
-        """)
-        clients = cur.fetchall()
+        page = fetch_page(cur, CLIENTS_ORDER, CLIENTS_QUERY, [], cursor, limit)
         
         return {
             "status": "success",
-            "data": [dict(client) for client in clients]
+            **page
         }
         
+    except HTTPException as e:
+        raise e
     except Exception as e:
         print(f"Error: {str(e)}")
         return {"status": "error", "detail": str(e)}
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.post("/clients")
-async def create_client(client: Client):
+def create_client(client: Client, conn=Depends(get_db)):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Generar número de cliente si no existe
@@ -240,13 +243,10 @@ async def create_client(client: Client):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.put("/clients/{client_id}")
-async def update_client(client_id: int, client: Client):
+def update_client(client_id: int, client: Client, conn=Depends(get_db)):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
         cur = conn.cursor(cursor_factory=DictCursor)
         
         cur.execute("""
@@ -281,13 +281,10 @@ async def update_client(client_id: int, client: Client):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.delete("/clients/{client_id}")
-async def delete_client(client_id: int):
+def delete_client(client_id: int, conn=Depends(get_db)):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
         cur = conn.cursor()
         
         cur.execute("DELETE FROM clients WHERE id = %s RETURNING id", (client_id,))
@@ -311,18 +308,14 @@ async def delete_client(client_id: int):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.get("/health")
-async def health_check():
+def health_check(conn=Depends(get_db)):
     try:
         # Probar conexión a BD
-        conn = get_db_connection()
         cur = conn.cursor()
         cur.execute('SELECT 1')
         cur.close()
-        conn.close()
         return {"status": "healthy", "database": "connected"}
     except Exception as e:
         return {"status": "error", "detail": str(e)}
@@ -340,9 +333,8 @@ async def login_options():
 
 # Endpoints de Roles y Usuarios
 @app.get("/roles")
-async def get_roles():
+def get_roles(conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         cur.execute("""
@@ -362,8 +354,6 @@ async def get_roles():
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 # Configuración de timeouts más largos
 @app.middleware("http")
@@ -372,20 +362,17 @@ async def add_timeout_header(request: Request, call_next):
     response.headers["Keep-Alive"] = "timeout=75"
     return response
 
-async def get_total_clients():
+def get_total_clients(conn):
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
         cur.execute("SELECT COUNT(*) FROM clients")
         total = cur.fetchone()[0]
         return total
     finally:
         cur.close()
-        conn.close()
 
-async def get_active_devices():
+def get_active_devices(conn):
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
         cur.execute("SELECT COUNT(*) FROM devices WHERE status = 'active'")
         total = cur.fetchone()[0]
@@ -394,11 +381,9 @@ async def get_active_devices():
         return 0  # Si la tabla no existe aún
     finally:
         cur.close()
-        conn.close()
 
-async def get_pending_alerts():
+def get_pending_alerts(conn):
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
         cur.execute("SELECT COUNT(*) FROM alerts WHERE status = 'pending'")
         total = cur.fetchone()[0]
@@ -407,11 +392,9 @@ async def get_pending_alerts():
         return 0  # Si la tabla no existe aún
     finally:
         cur.close()
-        conn.close()
 
-async def get_monthly_revenue():
+def get_monthly_revenue(conn):
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
         cur.execute("""
             SELECT COALESCE(SUM(amount), 0)
@@ -424,23 +407,23 @@ async def get_monthly_revenue():
         return 0.0  # Si la tabla no existe aún
     finally:
         cur.close()
-        conn.close()
+
+DASHBOARD_STATS_QUERY = """
+                SELECT 
+                    COALESCE((SELECT COUNT(*) FROM clients), 0) as total_clients,
+                    COALESCE((SELECT COUNT(*) FROM alarm_panels WHERE last_connection > NOW() - INTERVAL '24 hours'), 0) as active_devices,
+                    COALESCE((SELECT COUNT(*) FROM events WHERE processed = FALSE), 0) as pending_alerts,
+                    COALESCE((SELECT COUNT(*) FROM events WHERE timestamp >= CURRENT_DATE AND timestamp < CURRENT_DATE + 1), 0) as events_today
+"""
 
 @app.get("/dashboard/stats", dependencies=[Depends(check_permission(Permission.ALARMS_READ))])
-async def get_dashboard_stats():
+def get_dashboard_stats(conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Obtener estadísticas de forma segura
         try:
-            cur.execute("""
-                SELECT 
-                    COALESCE((SELECT COUNT(*) FROM clients), 0) as total_clients,
-                    COALESCE((SELECT COUNT(*) FROM alarm_panels WHERE last_connection > NOW() - INTERVAL '24 hours'), 0) as active_devices,
-                    COALESCE((SELECT COUNT(*) FROM events WHERE processed = FALSE), 0) as pending_alerts,
-                    COALESCE((SELECT COUNT(*) FROM events WHERE DATE(timestamp) = CURRENT_DATE), 0) as events_today
-            """)
+            cur.execute(DASHBOARD_STATS_QUERY)
             
             stats = cur.fetchone()
             
@@ -473,69 +456,144 @@ async def get_dashboard_stats():
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
+
+# Eventos pendientes en memoria y envío de cambios a las consolas por /ws/events
+event_publisher = EventPublisher(manager)
+event_listener = PgListener()
+event_listener.subscribe(EVENTS_CHANNEL, event_publisher.handle_notification)
+event_listener.on_connect = event_publisher.resync
+background_tasks: List[asyncio.Task] = []
+
+# Los endpoints con consultas son def: FastAPI los corre en su threadpool y el
+# event loop queda libre para WebSockets y push de eventos. Por petición,
+# get_db (dependencia con yield) y el endpoint corren uno detrás del otro en
+# el threadpool, nunca a la vez: cada paso toma un hilo y lo suelta antes del
+# siguiente. Quien tiene una conexión necesita volver a tomar un hilo para el
+# endpoint y para el cierre de get_db, que es el que la devuelve. Si hubiera
+# tantos hilos como conexiones, las peticiones bloqueadas esperando el pool
+# podrían ocuparlos todos y las que tienen conexión no conseguirían hilo para
+# liberarla (hasta el acquire_timeout). Con el doble, maxconn hilos pueden
+# quedar esperando conexión y siempre quedan maxconn para las que la tienen.
+loop_lag = LoopLagProbe()
+
+@app.on_event("startup")
+async def open_db_pool():
+    to_thread.current_default_thread_limiter().total_tokens = settings.API_THREADS or db_pool.maxconn * 2
+    background_tasks.append(asyncio.create_task(loop_lag.run()))
+    await asyncio.get_running_loop().run_in_executor(None, db_pool.open)
+
+@app.on_event("shutdown")
+async def close_db_pool():
+    db_pool.close()
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    logger.error(f"Pool de conexiones agotado en {request.url.path}: {exc}")
+    return JSONResponse(status_code=503, content={"detail": "Base de datos ocupada, reintente"})
+
+@app.get("/db/metrics", dependencies=[Depends(check_permission(Permission.ADMIN_ALL))])
+async def db_metrics():
+    limiter = to_thread.current_default_thread_limiter()
+    return {
+        "status": "success",
+        "data": {
+            **db_pool.metrics(),
+            "threads": {
+                "total": limiter.total_tokens,
+                "busy": limiter.borrowed_tokens,
+                "waiting": limiter.statistics().tasks_waiting
+            },
+            "event_loop": loop_lag.metrics()
+        }
+    }
 
 # Endpoints para eventos
 @app.get("/events/pending", dependencies=[Depends(check_permission(Permission.ALARMS_READ))])
 async def get_pending_events():
+    # Con el conjunto en memoria cargado no hace falta ir a la base. Se lee en
+    # el event loop: el publicador lo modifica ahí mismo.
+    if event_publisher.pending_events.loaded:
+        return {
+            "status": "success",
+            **event_publisher.pending_events.snapshot()
+        }
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        # Obtener eventos pendientes con información del cliente
-        cur.execute("""
-            SELECT 
-                e.*,
-                c.name as client_name,
-                c.company as client_company,
-                c.address as client_address,
-                c.phone as client_phone,
-                ap.verification_code
-            FROM events e
-            JOIN alarm_panels ap ON e.panel_id = ap.id
-            JOIN clients c ON ap.client_id = c.id
-            WHERE e.processed = FALSE
-            ORDER BY e.priority ASC, e.timestamp DESC
-        """)
-        
-        events = cur.fetchall()
-        
-        # Formatear eventos
-        formatted_events = []
-        for event in events:
-            event_dict = dict(event)
-            event_dict['client_info'] = {
-                'name': event_dict.pop('client_name'),
-                'company': event_dict.pop('client_company'),
-                'address': event_dict.pop('client_address'),
-                'phone': event_dict.pop('client_phone'),
-                'verification_code': event_dict.pop('verification_code')
-            }
-            formatted_events.append(event_dict)
-        
         return {
             "status": "success",
-            "data": formatted_events
+            "data": await run_in_threadpool(fetch_pending_events)
         }
-        
+    except PoolTimeout:
+        raise
     except Exception as e:
         print(f"Error getting pending events: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
 
-@app.get("/events/{event_id}/details", dependencies=[Depends(check_permission(Permission.ALARMS_READ))])
-async def get_event_details(event_id: int):
+@app.on_event("startup")
+async def start_event_push():
+    background_tasks.append(asyncio.create_task(event_listener.run()))
+    background_tasks.append(asyncio.create_task(event_publisher.run()))
+
+@app.on_event("shutdown")
+async def stop_event_push():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
+@app.websocket("/ws/events")
+async def events_websocket(websocket: WebSocket, token: str, topics: str = "*",
+                           epoch: Optional[str] = None, since: Optional[int] = None):
+    # El navegador no puede mandar Authorization en un WebSocket: el JWT va en ?token=
+    payload = decode_token(token)
+    if not payload or not has_permission(payload.get("role", ""), Permission.ALARMS_READ):
+        await websocket.close(code=1008)
+        return
+
+    client_id = str(payload.get("sub"))
+    await manager.connect(websocket, client_id)
+    # Temas iniciales en ?topics=client:12,priority:1 ("*" = todos los eventos)
+    manager.subscribe(websocket, [t for t in topics.split(",") if t])
+    # Snapshot de pendientes, o solo los deltas perdidos si la consola reanuda
+    event_publisher.catch_up(websocket, since, epoch)
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        # Obtener detalles del evento
-        cur.execute("""
+        # {"action": "subscribe" | "unsubscribe", "topics": ["panel:40", ...]}
+        # {"action": "resume", "epoch": "...", "since": 1234}
+        while True:
+            try:
+                command = json.loads(await websocket.receive_text())
+                action = command["action"]
+                if action == "resume":
+                    event_publisher.catch_up(websocket, int(command["since"]), command.get("epoch"))
+                    continue
+                requested = [str(t) for t in command["topics"]]
+            except (ValueError, KeyError, TypeError):
+                continue
+            if action == "subscribe":
+                manager.subscribe(websocket, requested)
+            elif action == "unsubscribe":
+                manager.unsubscribe(websocket, requested)
+            # Con otros temas cambia el conjunto visible: nuevo snapshot
+            event_publisher.catch_up(websocket)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(websocket, client_id)
+
+@app.get("/ws/metrics", dependencies=[Depends(check_permission(Permission.ADMIN_ALL))])
+async def websocket_metrics():
+    return {
+        "status": "success",
+        "data": {
+            "connections": manager.metrics(),
+            "publisher": event_publisher.metrics(),
+            "listener": {
+                "connected": event_listener.connected,
+                "notifications": event_listener.notifications
+            }
+        }
+    }
+
+EVENT_DETAILS_QUERY = """
             SELECT 
                 e.*,
                 c.name as client_name,
@@ -551,14 +609,10 @@ async def get_event_details(event_id: int):
             JOIN clients c ON ap.client_id = c.id
             LEFT JOIN panel_zones pz ON ap.id = pz.panel_id AND e.zone_user = CAST(pz.zone_number AS TEXT)
             WHERE e.id = %s
-        """, (event_id,))
-        
-        event = cur.fetchone()
-        if not event:
-            raise HTTPException(status_code=404, detail="Evento no encontrado")
-        
-        # Obtener historial de acciones
-        cur.execute("""
+"""
+
+# Usa idx_event_logs_event_created (migrations/08_query_plan_indexes.sql)
+EVENT_LOGS_QUERY = """
             SELECT 
                 el.*,
                 u.username as operator_name
@@ -566,7 +620,22 @@ async def get_event_details(event_id: int):
             JOIN users u ON el.operator_id = u.id
             WHERE el.event_id = %s
             ORDER BY el.created_at DESC
-        """, (event_id,))
+"""
+
+@app.get("/events/{event_id}/details", dependencies=[Depends(check_permission(Permission.ALARMS_READ))])
+def get_event_details(event_id: int, conn=Depends(get_db)):
+    try:
+        cur = conn.cursor(cursor_factory=DictCursor)
+        
+        # Obtener detalles del evento
+        cur.execute(EVENT_DETAILS_QUERY, (event_id,))
+        
+        event = cur.fetchone()
+        if not event:
+            raise HTTPException(status_code=404, detail="Evento no encontrado")
+        
+        # Obtener historial de acciones
+        cur.execute(EVENT_LOGS_QUERY, (event_id,))
         
         logs = cur.fetchall()
         
@@ -599,13 +668,10 @@ async def get_event_details(event_id: int):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.post("/events/{event_id}/process", dependencies=[Depends(check_permission(Permission.ALARMS_WRITE))])
-async def process_event(event_id: int, data: dict):
+def process_event(event_id: int, data: dict, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Verificar que el evento existe y no está procesado
@@ -660,13 +726,10 @@ async def process_event(event_id: int, data: dict):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.post("/login")
-async def login(login_data: LoginData):
+def login(login_data: LoginData, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         cur.execute("""
@@ -734,14 +797,11 @@ async def login(login_data: LoginData):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 # Agregar endpoint para cambiar contraseña
 @app.post("/change-password")
-async def change_password(data: dict):
+def change_password(data: dict, conn=Depends(get_db)):
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Verificar usuario y contraseña actual
@@ -799,18 +859,14 @@ async def change_password(data: dict):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.get("/check-db")
-async def check_db():
+def check_db(conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         # Realizar una consulta simple para verificar la conexión
         cursor = conn.cursor()
         cursor.execute('SELECT 1')
         cursor.close()
-        conn.close()
         return {"status": "success", "message": "Conexión a la base de datos exitosa"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -820,9 +876,8 @@ async def root():
     return {"message": "API running"}
 
 @app.get("/users", dependencies=[Depends(check_permission(Permission.USERS_READ))])
-async def get_users():
+def get_users(conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         cur.execute("""
@@ -856,13 +911,10 @@ async def get_users():
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.post("/users", dependencies=[Depends(check_permission(Permission.USERS_WRITE))])
-async def create_user(user_data: dict):
+def create_user(user_data: dict, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Verificar si el usuario ya existe
@@ -906,13 +958,10 @@ async def create_user(user_data: dict):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.put("/users/{user_id}", dependencies=[Depends(check_permission(Permission.USERS_WRITE))])
-async def update_user(user_id: int, user_data: dict):
+def update_user(user_id: int, user_data: dict, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Verificar si el usuario existe
@@ -971,13 +1020,10 @@ async def update_user(user_id: int, user_data: dict):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.delete("/users/{user_id}", dependencies=[Depends(check_permission(Permission.ADMIN_ALL))])
-async def delete_user(user_id: int):
+def delete_user(user_id: int, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
         
         # Verificar si el usuario existe
@@ -1001,14 +1047,11 @@ async def delete_user(user_id: int):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 # Endpoints para paneles de alarma
 @app.get("/alarm-panels", dependencies=[Depends(check_permission(Permission.ALARMS_READ))])
-async def get_alarm_panels():
+def get_alarm_panels(conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         try:
@@ -1041,13 +1084,10 @@ async def get_alarm_panels():
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.get("/alarm-panels/{panel_id}", dependencies=[Depends(check_permission(Permission.ALARMS_READ))])
-async def get_alarm_panel(panel_id: int):
+def get_alarm_panel(panel_id: int, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         cur.execute("""
@@ -1077,13 +1117,10 @@ async def get_alarm_panel(panel_id: int):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.post("/alarm-panels", dependencies=[Depends(check_permission(Permission.ALARMS_WRITE))])
-async def create_alarm_panel(panel: PanelBase):
+def create_alarm_panel(panel: PanelBase, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Verificar si el cliente existe
@@ -1100,16 +1137,22 @@ async def create_alarm_panel(panel: PanelBase):
             INSERT INTO alarm_panels (
                 client_id, account_number, verification_code,
                 panel_type, model, phone_line1, phone_line2,
-                ip_address, port, notes
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ip_address, port, notes, supervision_interval
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             RETURNING *
         """, (
             panel.client_id, panel.account_number, panel.verification_code,
             panel.panel_type, panel.model, panel.phone_line1, panel.phone_line2,
-            panel.ip_address, panel.port, panel.notes
+            panel.ip_address, panel.port, panel.notes, panel.supervision_interval
         ))
         
         new_panel = cur.fetchone()
+        
+        # Avisar a la receptora para que actualice su registro de paneles
+        notify(cur, PANELS_CHANNEL, {
+            'op': 'upsert', 'id': new_panel['id'],
+            'account_number': new_panel['account_number']
+        })
         conn.commit()
         
         return {
@@ -1127,13 +1170,10 @@ async def create_alarm_panel(panel: PanelBase):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.put("/alarm-panels/{panel_id}", dependencies=[Depends(check_permission(Permission.ALARMS_WRITE))])
-async def update_alarm_panel(panel_id: int, panel: PanelBase):
+def update_alarm_panel(panel_id: int, panel: PanelBase, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Verificar si el panel existe
@@ -1165,16 +1205,23 @@ async def update_alarm_panel(panel_id: int, panel: PanelBase):
                 phone_line2 = %s,
                 ip_address = %s,
                 port = %s,
-                notes = %s
+                notes = %s,
+                supervision_interval = %s
             WHERE id = %s
             RETURNING *
         """, (
             panel.client_id, panel.account_number, panel.verification_code,
             panel.panel_type, panel.model, panel.phone_line1, panel.phone_line2,
-            panel.ip_address, panel.port, panel.notes, panel_id
+            panel.ip_address, panel.port, panel.notes, panel.supervision_interval, panel_id
         ))
         
         updated_panel = cur.fetchone()
+        
+        # Avisar a la receptora para que actualice su registro de paneles
+        notify(cur, PANELS_CHANNEL, {
+            'op': 'upsert', 'id': panel_id,
+            'account_number': updated_panel['account_number']
+        })
         conn.commit()
         
         return {
@@ -1192,14 +1239,11 @@ async def update_alarm_panel(panel_id: int, panel: PanelBase):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 # Endpoints para zonas
 @app.get("/alarm-panels/{panel_id}/zones", dependencies=[Depends(check_permission(Permission.ALARMS_READ))])
-async def get_panel_zones(panel_id: int):
+def get_panel_zones(panel_id: int, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         cur.execute("""
@@ -1220,13 +1264,10 @@ async def get_panel_zones(panel_id: int):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.post("/alarm-panels/{panel_id}/zones", dependencies=[Depends(check_permission(Permission.ALARMS_WRITE))])
-async def create_panel_zone(panel_id: int, zone: ZoneBase):
+def create_panel_zone(panel_id: int, zone: ZoneBase, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Verificar si el panel existe
@@ -1254,6 +1295,7 @@ async def create_panel_zone(panel_id: int, zone: ZoneBase):
         ))
         
         new_zone = cur.fetchone()
+        notify(cur, PANELS_CHANNEL, {'op': 'upsert', 'id': panel_id})
         conn.commit()
         
         return {
@@ -1271,13 +1313,10 @@ async def create_panel_zone(panel_id: int, zone: ZoneBase):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.put("/alarm-panels/{panel_id}/zones/{zone_id}", dependencies=[Depends(check_permission(Permission.ALARMS_WRITE))])
-async def update_panel_zone(panel_id: int, zone_id: int, zone: ZoneBase):
+def update_panel_zone(panel_id: int, zone_id: int, zone: ZoneBase, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Verificar si la zona existe y pertenece al panel
@@ -1311,6 +1350,7 @@ async def update_panel_zone(panel_id: int, zone_id: int, zone: ZoneBase):
         ))
         
         updated_zone = cur.fetchone()
+        notify(cur, PANELS_CHANNEL, {'op': 'upsert', 'id': panel_id})
         conn.commit()
         
         return {
@@ -1328,13 +1368,10 @@ async def update_panel_zone(panel_id: int, zone_id: int, zone: ZoneBase):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.delete("/alarm-panels/{panel_id}/zones/{zone_id}", dependencies=[Depends(check_permission(Permission.ALARMS_WRITE))])
-async def delete_panel_zone(panel_id: int, zone_id: int):
+def delete_panel_zone(panel_id: int, zone_id: int, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
         
         # Verificar si la zona existe y pertenece al panel
@@ -1351,6 +1388,7 @@ async def delete_panel_zone(panel_id: int, zone_id: int):
             WHERE id = %s AND panel_id = %s
         """, (zone_id, panel_id))
         
+        notify(cur, PANELS_CHANNEL, {'op': 'upsert', 'id': panel_id})
         conn.commit()
         
         return {
@@ -1365,13 +1403,10 @@ async def delete_panel_zone(panel_id: int, zone_id: int):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.delete("/alarm-panels/{panel_id}", dependencies=[Depends(check_permission(Permission.ALARMS_WRITE))])
-async def delete_alarm_panel(panel_id: int):
+def delete_alarm_panel(panel_id: int, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
         
         # Verificar si el panel existe
@@ -1388,6 +1423,7 @@ async def delete_alarm_panel(panel_id: int):
         # Eliminar el panel
         cur.execute("DELETE FROM alarm_panels WHERE id = %s", (panel_id,))
         
+        notify(cur, PANELS_CHANNEL, {'op': 'delete', 'id': panel_id})
         conn.commit()
         
         return {
@@ -1402,8 +1438,6 @@ async def delete_alarm_panel(panel_id: int):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.get("/alarm-panels/zone-types", dependencies=[Depends(check_permission(Permission.ALARMS_READ))])
 async def get_zone_types():
@@ -1425,9 +1459,8 @@ async def get_zone_types():
     }
 
 @app.post("/test/send-event", dependencies=[Depends(check_permission(Permission.ALARMS_WRITE))])
-async def send_test_event(event_data: dict):
+def send_test_event(event_data: dict, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Verificar si el panel existe
@@ -1445,17 +1478,23 @@ async def send_test_event(event_data: dict):
         timestamp = datetime.now(timezone.utc)
         message = f'["{event_data["account_number"]}"] {timestamp.strftime("%H%M%S,%m%d%y")}|{event_data["event_code"]}|{event_data["zone"]}'
         
+        # Prioridad y descripción desde event_codes, igual que la receptora
         cur.execute("""
             INSERT INTO events (
                 panel_id, event_type, raw_message,
                 code, qualifier, zone_user,
-                timestamp, priority
-            ) VALUES (%s, 'SIA', %s, %s, %s, %s, %s, %s)
+                timestamp, priority, description
+            ) VALUES (
+                %s, 'SIA', %s, %s, %s, %s, %s,
+                COALESCE((SELECT priority FROM event_codes WHERE protocol = 'SIA' AND code = %s), %s),
+                (SELECT description FROM event_codes WHERE protocol = 'SIA' AND code = %s)
+            )
             RETURNING id
         """, (
             panel['id'], message, event_data['event_code'],
-            event_data['event_code'][0], event_data['zone'],
-            timestamp, 1 if event_data['event_code'] in ['BA', 'FA', 'PA'] else 2
+            event_data['event_code'][0], event_data['zone'], timestamp,
+            event_data['event_code'], default_sia_priority(event_data['event_code']),
+            event_data['event_code']
         ))
         
         event_id = cur.fetchone()['id']
@@ -1476,80 +1515,124 @@ async def send_test_event(event_data: dict):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
+
+# Primero los pendientes de prioridad 1, luego el resto de pendientes y al
+# final los procesados; dentro de cada grupo, los más recientes primero.
+# Todas las claves descendentes para que la comparación de filas use
+# idx_events_history_keyset.
+EVENTS_HISTORY_ORDER = Keyset(
+    """CASE WHEN e.processed = FALSE AND e.priority = 1 THEN 3
+                     WHEN e.processed = FALSE THEN 2
+                     ELSE 1 END""",
+    "COALESCE(e.timestamp, 'infinity')",
+    "e.id",
+    descending=True
+)
+
+EVENTS_HISTORY_FROM = """
+            FROM events e
+            JOIN alarm_panels ap ON e.panel_id = ap.id
+            JOIN clients c ON ap.client_id = c.id
+            WHERE 1=1
+"""
+
+def events_history_filters(status: str, priority: str, date_range: str):
+    """Condiciones de /events/history, compartidas con /events/export"""
+    query = ""
+    params = []
+
+    if status != 'all':
+        query += " AND e.processed = %s"
+        params.append(status == 'processed')
+
+    if priority != 'all':
+        query += " AND e.priority = %s"
+        params.append(int(priority))
+
+    if date_range != 'all':
+        if date_range == 'today':
+            query += " AND e.timestamp >= CURRENT_DATE AND e.timestamp < CURRENT_DATE + 1"
+        elif date_range == 'week':
+            query += " AND e.timestamp >= CURRENT_DATE - INTERVAL '7 days'"
+        elif date_range == 'month':
+            query += " AND e.timestamp >= CURRENT_DATE - INTERVAL '30 days'"
+
+    return query, params
+
+def events_history_query(status: str = 'all', priority: str = 'all', date_range: str = 'all'):
+    """Consulta de /events/history (sin orden ni límite, los agrega fetch_page)"""
+    query = f"""
+            SELECT 
+                {EVENTS_HISTORY_ORDER.columns},
+                e.*,
+                c.name as client_name,
+                ap.account_number as panel_account,
+                e.description as event_description
+            {EVENTS_HISTORY_FROM}
+        """
+    filters, params = events_history_filters(status, priority, date_range)
+    return query + filters, params
 
 @app.get("/events/history", dependencies=[Depends(check_permission(Permission.ALARMS_READ))])
-async def get_events_history(
+def get_events_history(
     status: str = 'all',
     priority: str = 'all',
-    date_range: str = 'all'
+    date_range: str = 'all',
+    cursor: str = None,
+    limit: int = None,
+    conn=Depends(get_db)
 ):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
-        query = """
-            SELECT 
-                e.*,
-                c.name as client_name,
-                ap.account_number as panel_account,
-                ec.description as event_description
-            FROM events e
-            JOIN alarm_panels ap ON e.panel_id = ap.id
-            JOIN clients c ON ap.client_id = c.id
-            LEFT JOIN event_codes ec ON e.code = ec.code 
-                AND e.event_type = ec.protocol
-            WHERE 1=1
-        """
-        params = []
-
-        if status != 'all':
-            query += " AND e.processed = %s"
-            params.append(status == 'processed')
-
-        if priority != 'all':
-            query += " AND e.priority = %s"
-            params.append(int(priority))
-
-        if date_range != 'all':
-            if date_range == 'today':
-                query += " AND DATE(e.timestamp) = CURRENT_DATE"
-            elif date_range == 'week':
-                query += " AND e.timestamp >= CURRENT_DATE - INTERVAL '7 days'"
-            elif date_range == 'month':
-                query += " AND e.timestamp >= CURRENT_DATE - INTERVAL '30 days'"
-
-        query += """
-            ORDER BY 
-                CASE WHEN e.processed = FALSE AND e.priority = 1 THEN 1
-                     WHEN e.processed = FALSE THEN 2
-                     ELSE 3 END,
-                e.timestamp DESC
-        """
-
-        cur.execute(query, params)
-        events = cur.fetchall()
+        query, params = events_history_query(status, priority, date_range)
+        page = fetch_page(cur, EVENTS_HISTORY_ORDER, query, params, cursor, limit)
         
         return {
             "status": "success",
-            "data": [dict(event) for event in events]
+            **page
         }
         
+    except HTTPException as e:
+        raise e
     except Exception as e:
         print(f"Error getting events history: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
+
+@app.get("/events/export", dependencies=[Depends(check_permission(Permission.ALARMS_READ))])
+def export_events(
+    format: str = 'ndjson',
+    status: str = 'all',
+    priority: str = 'all',
+    date_range: str = 'all'
+):
+    try:
+        filters, params = events_history_filters(status, priority, date_range)
+        query = f"""
+            SELECT 
+                e.*,
+                c.name as client_name,
+                ap.account_number as panel_account,
+                e.description as event_description
+            {EVENTS_HISTORY_FROM}
+            {filters}
+            {EVENTS_HISTORY_ORDER.order_by()}
+        """
+        return stream_export(query, params, format, 'eventos')
+        
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"Error exporting events: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 # Endpoints para CCTV
-@app.get("/cameras", dependencies=[Depends(check_permission(Permission.CCTV_READ))])
-async def get_cameras():
+@app.get("/cameras", dependencies=[Depends(check_permission(Permission.CAMERAS_READ))])
+def get_cameras(conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         cur.execute("""
@@ -1575,13 +1658,10 @@ async def get_cameras():
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
-@app.post("/camera-events", dependencies=[Depends(check_permission(Permission.CCTV_WRITE))])
-async def create_camera_event(event: dict):
+@app.post("/camera-events", dependencies=[Depends(check_permission(Permission.CAMERAS_WRITE))])
+def create_camera_event(event: dict, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         cur.execute("""
@@ -1599,6 +1679,11 @@ async def create_camera_event(event: dict):
         event_id = cur.fetchone()['id']
         conn.commit()
         
+        manager.publish_threadsafe({
+            "type": "camera_event",
+            "data": {"id": event_id, **event}
+        }, [f"camera:{event['camera_id']}"])
+        
         return {
             "status": "success",
             "event_id": event_id
@@ -1611,23 +1696,25 @@ async def create_camera_event(event: dict):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 # Endpoints para servicios técnicos
-@app.get("/technical-services", dependencies=[Depends(check_permission(Permission.SERVICES_READ))])
-async def get_technical_services(
-    status: str = None,
-    from_date: str = None,
-    to_date: str = None,
-    client_id: int = None
-):
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        query = """
+# Prioridad y fecha sin valor van al final, como en el ORDER BY original. Un
+# servicio con varias asignaciones sale una vez por asignación: sa.id desempata
+# (0 si no tiene) y el índice cubre las tres primeras claves
+SERVICES_ORDER = Keyset(
+    "COALESCE(ts.priority, 32767)",
+    "COALESCE(ts.scheduled_date, 'infinity')",
+    "ts.id",
+    "COALESCE(sa.id, 0)",
+    indexed=3
+)
+
+def technical_services_query(status: str = None, from_date: str = None, to_date: str = None,
+                             client_id: int = None):
+    """Consulta de /technical-services (sin orden ni límite, los agrega fetch_page)"""
+    query = f"""
             SELECT 
+                {SERVICES_ORDER.columns},
                 ts.*,
                 c.name as client_name,
                 c.phone as client_phone,
@@ -1640,47 +1727,59 @@ async def get_technical_services(
             LEFT JOIN users u ON t.user_id = u.id
             WHERE 1=1
         """
-        params = []
+    params = []
+    
+    if status:
+        query += " AND ts.status = %s"
+        params.append(status)
         
-        if status:
-            query += " AND ts.status = %s"
-            params.append(status)
-            
-        if from_date:
-            query += " AND ts.scheduled_date >= %s"
-            params.append(from_date)
-            
-        if to_date:
-            query += " AND ts.scheduled_date <= %s"
-            params.append(to_date)
-            
-        if client_id:
-            query += " AND ts.client_id = %s"
-            params.append(client_id)
-            
-        query += " ORDER BY ts.priority ASC, ts.scheduled_date ASC"
+    if from_date:
+        query += " AND ts.scheduled_date >= %s"
+        params.append(from_date)
         
-        cur.execute(query, params)
-        services = cur.fetchall()
+    if to_date:
+        query += " AND ts.scheduled_date <= %s"
+        params.append(to_date)
+        
+    if client_id:
+        query += " AND ts.client_id = %s"
+        params.append(client_id)
+
+    return query, params
+
+@app.get("/technical-services", dependencies=[Depends(check_permission(Permission.SERVICES_READ))])
+def get_technical_services(
+    status: str = None,
+    from_date: str = None,
+    to_date: str = None,
+    client_id: int = None,
+    cursor: str = None,
+    limit: int = None,
+    conn=Depends(get_db)
+):
+    try:
+        cur = conn.cursor(cursor_factory=DictCursor)
+        
+        query, params = technical_services_query(status, from_date, to_date, client_id)
+        page = fetch_page(cur, SERVICES_ORDER, query, params, cursor, limit)
         
         return {
             "status": "success",
-            "data": [dict(service) for service in services]
+            **page
         }
         
+    except HTTPException as e:
+        raise e
     except Exception as e:
         print(f"Error getting technical services: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.post("/technical-services", dependencies=[Depends(check_permission(Permission.SERVICES_WRITE))])
-async def create_technical_service(service_data: dict):
+def create_technical_service(service_data: dict, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Insertar el servicio técnico
@@ -1731,13 +1830,10 @@ async def create_technical_service(service_data: dict):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.post("/technical-services/{service_id}/assign", dependencies=[Depends(check_permission(Permission.SERVICES_ASSIGN))])
-async def assign_technician(service_id: int, assignment_data: dict):
+def assign_technician(service_id: int, assignment_data: dict, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Verificar si el servicio existe y está pendiente
@@ -1789,14 +1885,11 @@ async def assign_technician(service_id: int, assignment_data: dict):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 # Endpoints para técnicos
 @app.get("/technicians", dependencies=[Depends(check_permission(Permission.TECHNICIANS_READ))])
-async def get_technicians(available_only: bool = False):
+def get_technicians(available_only: bool = False, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         query = """
@@ -1830,22 +1923,22 @@ async def get_technicians(available_only: bool = False):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 # Endpoints para inventario
-@app.get("/inventory", dependencies=[Depends(check_permission(Permission.INVENTORY_READ))])
-async def get_inventory_items(
-    category: str = None,
-    low_stock: bool = False,
-    supplier_id: int = None
-):
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        query = """
+# Categoría y nombre sin valor van al final, como en el ORDER BY original
+INVENTORY_ORDER = Keyset(
+    "i.category IS NULL",
+    "COALESCE(i.category, '')",
+    "i.name IS NULL",
+    "COALESCE(i.name, '')",
+    "i.id"
+)
+
+def inventory_query(category: str = None, low_stock: bool = False, supplier_id: int = None):
+    """Consulta de /inventory (sin orden ni límite, los agrega fetch_page)"""
+    query = f"""
             SELECT 
+                {INVENTORY_ORDER.columns},
                 i.*,
                 s.name as supplier_name,
                 s.contact_person as supplier_contact
@@ -1853,47 +1946,53 @@ async def get_inventory_items(
             LEFT JOIN suppliers s ON i.supplier_id = s.id
             WHERE 1=1
         """
-        params = []
+    params = []
+    
+    if category:
+        query += " AND i.category = %s"
+        params.append(category)
         
-        if category:
-            query += " AND i.category = %s"
-            params.append(category)
-            
-        if low_stock:
-            query += " AND i.stock <= i.min_stock"
-            
-        if supplier_id:
-            query += " AND i.supplier_id = %s"
-            params.append(supplier_id)
-            
-        query += " ORDER BY i.category, i.name"
+    if low_stock:
+        query += " AND i.stock <= i.min_stock"
         
-        cur.execute(query, params)
-        items = cur.fetchall()
+    if supplier_id:
+        query += " AND i.supplier_id = %s"
+        params.append(supplier_id)
+
+    return query, params
+
+@app.get("/inventory", dependencies=[Depends(check_permission(Permission.INVENTORY_READ))])
+def get_inventory_items(
+    category: str = None,
+    low_stock: bool = False,
+    supplier_id: int = None,
+    cursor: str = None,
+    limit: int = None,
+    conn=Depends(get_db)
+):
+    try:
+        cur = conn.cursor(cursor_factory=DictCursor)
+        
+        query, params = inventory_query(category, low_stock, supplier_id)
+        page = fetch_page(cur, INVENTORY_ORDER, query, params, cursor, limit)
         
         return {
             "status": "success",
-            "data": [dict(item) for item in items]
+            **page
         }
         
+    except HTTPException as e:
+        raise e
     except Exception as e:
         print(f"Error getting inventory: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 # Endpoints para rutas de técnicos
-@app.post("/technician-routes/optimize", dependencies=[Depends(check_permission(Permission.TECHNICIANS_WRITE))])
-async def optimize_technician_route(route_data: dict):
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        # Obtener servicios pendientes para el técnico
-        cur.execute("""
+# Servicios asignados a un técnico en un día (técnico, fecha, fecha)
+ROUTE_SERVICES_QUERY = """
             SELECT 
                 ts.*,
                 c.name as client_name,
@@ -1904,10 +2003,18 @@ async def optimize_technician_route(route_data: dict):
             JOIN clients c ON ts.client_id = c.id
             JOIN service_assignments sa ON ts.id = sa.service_id
             WHERE sa.technician_id = %s 
-            AND ts.scheduled_date::date = %s
+            AND ts.scheduled_date >= %s::date AND ts.scheduled_date < %s::date + 1
             AND ts.status = 'assigned'
             ORDER BY ts.priority, ts.scheduled_date
-        """, (route_data['technician_id'], route_data['date']))
+"""
+
+@app.post("/technician-routes/optimize", dependencies=[Depends(check_permission(Permission.TECHNICIANS_WRITE))])
+def optimize_technician_route(route_data: dict, conn=Depends(get_db)):
+    try:
+        cur = conn.cursor(cursor_factory=DictCursor)
+        
+        # Obtener servicios pendientes para el técnico
+        cur.execute(ROUTE_SERVICES_QUERY, (route_data['technician_id'], route_data['date'], route_data['date']))
         
         services = cur.fetchall()
         
@@ -1974,13 +2081,10 @@ async def optimize_technician_route(route_data: dict):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.get("/technician-routes/{technician_id}/today", dependencies=[Depends(check_permission(Permission.TECHNICIANS_READ))])
-async def get_technician_route(technician_id: int):
+def get_technician_route(technician_id: int, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Obtener la ruta actual
@@ -2038,13 +2142,10 @@ async def get_technician_route(technician_id: int):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.post("/technician-routes/stops/{stop_id}/complete", dependencies=[Depends(check_permission(Permission.TECHNICIANS_WRITE))])
-async def complete_route_stop(stop_id: int, completion_data: dict):
+def complete_route_stop(stop_id: int, completion_data: dict, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Actualizar la parada
@@ -2114,14 +2215,11 @@ async def complete_route_stop(stop_id: int, completion_data: dict):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 # Endpoints para materiales usados en servicios
 @app.post("/technical-services/{service_id}/materials", dependencies=[Depends(check_permission(Permission.SERVICES_WRITE))])
-async def add_service_materials(service_id: int, materials: List[dict]):
+def add_service_materials(service_id: int, materials: List[dict], conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Verificar si el servicio existe
@@ -2191,21 +2289,10 @@ async def add_service_materials(service_id: int, materials: List[dict]):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 # Endpoints para reportes
-@app.get("/reports/technician-performance", dependencies=[Depends(check_permission(Permission.REPORTS_READ))])
-async def get_technician_performance(
-    from_date: str = None,
-    to_date: str = None,
-    technician_id: int = None
-):
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        query = """
+def technician_performance_query(from_date: str, to_date: str, technician_id: int):
+    query = """
             WITH service_stats AS (
                 SELECT 
                     t.id as technician_id,
@@ -2221,33 +2308,44 @@ async def get_technician_performance(
                 LEFT JOIN service_feedback sf ON ts.id = sf.service_id
                 WHERE 1=1
         """
-        params = []
+    params = []
+    
+    if from_date:
+        query += " AND ts.scheduled_date >= %s"
+        params.append(from_date)
         
-        if from_date:
-            query += " AND ts.scheduled_date >= %s"
-            params.append(from_date)
-            
-        if to_date:
-            query += " AND ts.scheduled_date <= %s"
-            params.append(to_date)
-            
-        if technician_id:
-            query += " AND t.id = %s"
-            params.append(technician_id)
-            
-        query += """
-                GROUP BY t.id, u.username
-            )
-            SELECT 
-                s.*,
-                ROUND((s.completed_services::float / NULLIF(s.total_services, 0) * 100)::numeric, 2) as completion_rate,
-                ROUND(s.avg_service_duration::numeric, 2) as avg_duration_minutes,
-                ROUND(s.avg_rating::numeric, 2) as satisfaction_rating
-            FROM service_stats s
-            ORDER BY s.completion_rate DESC
-        """
+    if to_date:
+        query += " AND ts.scheduled_date <= %s"
+        params.append(to_date)
         
-        cur.execute(query, params)
+    if technician_id:
+        query += " AND t.id = %s"
+        params.append(technician_id)
+        
+    query += """
+            GROUP BY t.id, u.username
+        )
+        SELECT 
+            s.*,
+            ROUND((s.completed_services::float / NULLIF(s.total_services, 0) * 100)::numeric, 2) as completion_rate,
+            ROUND(s.avg_service_duration::numeric, 2) as avg_duration_minutes,
+            ROUND(s.avg_rating::numeric, 2) as satisfaction_rating
+        FROM service_stats s
+        ORDER BY s.completion_rate DESC
+    """
+    return query, params
+
+@app.get("/reports/technician-performance", dependencies=[Depends(check_permission(Permission.REPORTS_READ))])
+def get_technician_performance(
+    from_date: str = None,
+    to_date: str = None,
+    technician_id: int = None,
+    conn=Depends(get_db)
+):
+    try:
+        cur = conn.cursor(cursor_factory=DictCursor)
+        
+        cur.execute(*technician_performance_query(from_date, to_date, technician_id))
         performance_data = cur.fetchall()
         
         return {
@@ -2261,68 +2359,69 @@ async def get_technician_performance(
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
+
+def service_statistics_query(period: str, from_date: str, to_date: str):
+    # Determinar el intervalo de agrupación
+    interval = {
+        'day': "DATE_TRUNC('hour', ts.scheduled_date)",
+        'week': "DATE_TRUNC('day', ts.scheduled_date)",
+        'month': "DATE_TRUNC('day', ts.scheduled_date)",
+        'year': "DATE_TRUNC('month', ts.scheduled_date)"
+    }.get(period, "DATE_TRUNC('day', ts.scheduled_date)")
+    
+    query = f"""
+        SELECT 
+            {interval} as period,
+            COUNT(*) as total_services,
+            COUNT(*) FILTER (WHERE ts.status = 'completed') as completed_services,
+            COUNT(*) FILTER (WHERE ts.status = 'cancelled') as cancelled_services,
+            AVG(EXTRACT(EPOCH FROM (ts.completed_at - sa.actual_arrival_time))/60) 
+                FILTER (WHERE ts.status = 'completed') as avg_duration,
+            COUNT(DISTINCT ts.client_id) as unique_clients,
+            COUNT(DISTINCT sa.technician_id) as technicians_involved
+        FROM technical_services ts
+        LEFT JOIN service_assignments sa ON ts.id = sa.service_id
+        WHERE 1=1
+    """
+    params = []
+    
+    if from_date:
+        query += " AND ts.scheduled_date >= %s"
+        params.append(from_date)
+        
+    if to_date:
+        query += " AND ts.scheduled_date <= %s"
+        params.append(to_date)
+        
+    query += f" GROUP BY {interval} ORDER BY period"
+    return query, params
+
+def service_statistics_row(stat: dict) -> dict:
+    # Calcular métricas adicionales
+    stat['completion_rate'] = round(
+        (stat['completed_services'] / stat['total_services'] * 100)
+        if stat['total_services'] > 0 else 0,
+        2
+    )
+    stat['avg_duration'] = round(stat['avg_duration'] or 0, 2)
+    return stat
 
 @app.get("/reports/service-statistics", dependencies=[Depends(check_permission(Permission.REPORTS_READ))])
-async def get_service_statistics(
+def get_service_statistics(
     period: str = 'month',  # day, week, month, year
     from_date: str = None,
-    to_date: str = None
+    to_date: str = None,
+    conn=Depends(get_db)
 ):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
-        # Determinar el intervalo de agrupación
-        interval = {
-            'day': "DATE_TRUNC('hour', ts.scheduled_date)",
-            'week': "DATE_TRUNC('day', ts.scheduled_date)",
-            'month': "DATE_TRUNC('day', ts.scheduled_date)",
-            'year': "DATE_TRUNC('month', ts.scheduled_date)"
-        }.get(period, "DATE_TRUNC('day', ts.scheduled_date)")
-        
-        query = f"""
-            SELECT 
-                {interval} as period,
-                COUNT(*) as total_services,
-                COUNT(*) FILTER (WHERE ts.status = 'completed') as completed_services,
-                COUNT(*) FILTER (WHERE ts.status = 'cancelled') as cancelled_services,
-                AVG(EXTRACT(EPOCH FROM (ts.completed_at - sa.actual_arrival_time))/60) 
-                    FILTER (WHERE ts.status = 'completed') as avg_duration,
-                COUNT(DISTINCT ts.client_id) as unique_clients,
-                COUNT(DISTINCT sa.technician_id) as technicians_involved
-            FROM technical_services ts
-            LEFT JOIN service_assignments sa ON ts.id = sa.service_id
-            WHERE 1=1
-        """
-        params = []
-        
-        if from_date:
-            query += " AND ts.scheduled_date >= %s"
-            params.append(from_date)
-            
-        if to_date:
-            query += " AND ts.scheduled_date <= %s"
-            params.append(to_date)
-            
-        query += f" GROUP BY {interval} ORDER BY period"
-        
-        cur.execute(query, params)
+        cur.execute(*service_statistics_query(period, from_date, to_date))
         statistics = cur.fetchall()
-        
-        # Calcular métricas adicionales
-        for stat in statistics:
-            stat['completion_rate'] = round(
-                (stat['completed_services'] / stat['total_services'] * 100)
-                if stat['total_services'] > 0 else 0,
-                2
-            )
-            stat['avg_duration'] = round(stat['avg_duration'] or 0, 2)
             
         return {
             "status": "success",
-            "data": [dict(stat) for stat in statistics]
+            "data": [service_statistics_row(dict(stat)) for stat in statistics]
         }
         
     except Exception as e:
@@ -2331,32 +2430,59 @@ async def get_service_statistics(
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
-# Endpoints para notificaciones
-@app.get("/notifications", dependencies=[Depends(check_permission(Permission.USERS_READ))])
-async def get_user_notifications(
-    user_id: int,
-    unread_only: bool = False,
-    limit: int = 50
+@app.get("/reports/{report}/export", dependencies=[Depends(check_permission(Permission.REPORTS_READ))])
+def export_report(
+    report: str,
+    format: str = 'csv',
+    period: str = 'month',
+    from_date: str = None,
+    to_date: str = None,
+    technician_id: int = None
 ):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=DictCursor)
+        if report == 'technician-performance':
+            query, params = technician_performance_query(from_date, to_date, technician_id)
+            return stream_export(query, params, format, 'desempeno_tecnicos')
+        if report == 'service-statistics':
+            query, params = service_statistics_query(period, from_date, to_date)
+            return stream_export(query, params, format, 'estadisticas_servicios',
+                                 transform=service_statistics_row, extra_columns=['completion_rate'])
+        raise HTTPException(status_code=404, detail="Reporte no encontrado")
         
-        query = """
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"Error exporting report: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Endpoints para notificaciones
+def notifications_query(user_id: int, unread_only: bool = False, limit: int = 50):
+    """Consulta de /notifications (usa idx_notifications_user_created o el parcial de no leídas)"""
+    query = """
             SELECT * FROM notifications
             WHERE user_id = %s
         """
-        params = [user_id]
+    params = [user_id]
+    
+    if unread_only:
+        query += " AND read = FALSE"
         
-        if unread_only:
-            query += " AND read = FALSE"
-            
-        query += " ORDER BY created_at DESC LIMIT %s"
-        params.append(limit)
+    query += " ORDER BY created_at DESC LIMIT %s"
+    params.append(limit)
+    return query, params
+
+@app.get("/notifications", dependencies=[Depends(check_permission(Permission.USERS_READ))])
+def get_user_notifications(
+    user_id: int,
+    unread_only: bool = False,
+    limit: int = 50,
+    conn=Depends(get_db)
+):
+    try:
+        cur = conn.cursor(cursor_factory=DictCursor)
         
+        query, params = notifications_query(user_id, unread_only, limit)
         cur.execute(query, params)
         notifications = cur.fetchall()
         
@@ -2371,13 +2497,10 @@ async def get_user_notifications(
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.post("/notifications/mark-read", dependencies=[Depends(check_permission(Permission.USERS_WRITE))])
-async def mark_notifications_read(notification_ids: List[int]):
+def mark_notifications_read(notification_ids: List[int], conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
         
         cur.execute("""
@@ -2400,14 +2523,11 @@ async def mark_notifications_read(notification_ids: List[int]):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 # Endpoints para integración con mapas
 @app.get("/map/technicians", dependencies=[Depends(check_permission(Permission.TECHNICIANS_TRACK))])
-async def get_technicians_locations():
+def get_technicians_locations(conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         cur.execute("""
@@ -2439,13 +2559,10 @@ async def get_technicians_locations():
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.post("/map/update-location", dependencies=[Depends(check_permission(Permission.TECHNICIANS_TRACK))])
-async def update_technician_location(technician_id: int, location_data: dict):
+def update_technician_location(technician_id: int, location_data: dict, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor()
         
         cur.execute("""
@@ -2462,6 +2579,15 @@ async def update_technician_location(technician_id: int, location_data: dict):
         
         conn.commit()
         
+        manager.publish_threadsafe({
+            "type": "technician_location",
+            "data": {
+                "technician_id": technician_id,
+                "latitude": location_data['latitude'],
+                "longitude": location_data['longitude']
+            }
+        }, [f"technician:{technician_id}"])
+        
         return {
             "status": "success",
             "message": "Ubicación actualizada"
@@ -2474,21 +2600,12 @@ async def update_technician_location(technician_id: int, location_data: dict):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
-@app.get("/map/service-locations", dependencies=[Depends(check_permission(Permission.SERVICES_READ))])
-async def get_service_locations(
-    date: str = None,
-    status: str = None,
-    technician_id: int = None
-):
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=DictCursor)
-        
-        query = """
+def service_locations_query(date: str = None, status: str = None, technician_id: int = None):
+    """Consulta de /map/service-locations (sin orden ni límite, los agrega fetch_page)"""
+    query = f"""
             SELECT 
+                {SERVICES_ORDER.columns},
                 ts.id,
                 ts.service_type,
                 ts.status,
@@ -2506,44 +2623,55 @@ async def get_service_locations(
             LEFT JOIN users u ON t.user_id = u.id
             WHERE ts.location_lat IS NOT NULL
         """
-        params = []
+    params = []
+    
+    if date:
+        query += " AND ts.scheduled_date >= %s::date AND ts.scheduled_date < %s::date + 1"
+        params.extend([date, date])
         
-        if date:
-            query += " AND DATE(ts.scheduled_date) = %s"
-            params.append(date)
-            
-        if status:
-            query += " AND ts.status = %s"
-            params.append(status)
-            
-        if technician_id:
-            query += " AND sa.technician_id = %s"
-            params.append(technician_id)
-            
-        query += " ORDER BY ts.priority, ts.scheduled_date"
+    if status:
+        query += " AND ts.status = %s"
+        params.append(status)
         
-        cur.execute(query, params)
-        locations = cur.fetchall()
+    if technician_id:
+        query += " AND sa.technician_id = %s"
+        params.append(technician_id)
+
+    return query, params
+
+@app.get("/map/service-locations", dependencies=[Depends(check_permission(Permission.SERVICES_READ))])
+def get_service_locations(
+    date: str = None,
+    status: str = None,
+    technician_id: int = None,
+    cursor: str = None,
+    limit: int = None,
+    conn=Depends(get_db)
+):
+    try:
+        cur = conn.cursor(cursor_factory=DictCursor)
+        
+        query, params = service_locations_query(date, status, technician_id)
+        page = fetch_page(cur, SERVICES_ORDER, query, params, cursor, limit)
         
         return {
             "status": "success",
-            "data": [dict(loc) for loc in locations]
+            **page
         }
         
+    except HTTPException as e:
+        raise e
     except Exception as e:
         print(f"Error getting service locations: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 # Endpoints para tickets de servicio
 @app.post("/service-tickets", dependencies=[Depends(check_permission(Permission.SERVICES_WRITE))])
-async def create_service_ticket(ticket_data: dict):
+def create_service_ticket(ticket_data: dict, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Crear el ticket
@@ -2566,7 +2694,7 @@ async def create_service_ticket(ticket_data: dict):
         ticket_id = cur.fetchone()['id']
         
         # Procesar con IA para sugerencias
-        suggestions = await process_ticket_with_ai(ticket_data['description'])
+        suggestions = from_thread.run(process_ticket_with_ai, ticket_data['description'])
         
         # Guardar sugerencias
         if suggestions:
@@ -2598,8 +2726,6 @@ async def create_service_ticket(ticket_data: dict):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 async def process_ticket_with_ai(description: str):
     """
@@ -2619,9 +2745,8 @@ async def process_ticket_with_ai(description: str):
         return None
 
 @app.get("/service-tickets/{ticket_id}/suggestions", dependencies=[Depends(check_permission(Permission.SERVICES_READ))])
-async def get_ticket_suggestions(ticket_id: int):
+def get_ticket_suggestions(ticket_id: int, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Obtener sugerencias existentes
@@ -2642,7 +2767,7 @@ async def get_ticket_suggestions(ticket_id: int):
             
             ticket = cur.fetchone()
             if ticket:
-                new_suggestions = await process_ticket_with_ai(ticket['description'])
+                new_suggestions = from_thread.run(process_ticket_with_ai, ticket['description'])
                 if new_suggestions:
                     cur.execute("""
                         INSERT INTO ticket_suggestions (
@@ -2672,13 +2797,10 @@ async def get_ticket_suggestions(ticket_id: int):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 @app.post("/service-tickets/{ticket_id}/ai-analysis", dependencies=[Depends(check_permission(Permission.SERVICES_WRITE))])
-async def analyze_ticket_with_ai(ticket_id: int, analysis_type: str):
+def analyze_ticket_with_ai(ticket_id: int, analysis_type: str, conn=Depends(get_db)):
     try:
-        conn = get_db_connection()
         cur = conn.cursor(cursor_factory=DictCursor)
         
         # Obtener información del ticket
@@ -2705,11 +2827,11 @@ async def analyze_ticket_with_ai(ticket_id: int, analysis_type: str):
         # Realizar análisis según el tipo
         analysis_result = None
         if analysis_type == 'solution_prediction':
-            analysis_result = await predict_solution(dict(ticket_info))
+            analysis_result = from_thread.run(predict_solution, dict(ticket_info))
         elif analysis_type == 'time_estimation':
-            analysis_result = await estimate_resolution_time(dict(ticket_info))
+            analysis_result = from_thread.run(estimate_resolution_time, dict(ticket_info))
         elif analysis_type == 'technician_recommendation':
-            analysis_result = await recommend_technician(dict(ticket_info))
+            analysis_result = from_thread.run(recommend_technician, dict(ticket_info))
         
         if analysis_result:
             # Guardar resultado del análisis
@@ -2744,8 +2866,6 @@ async def analyze_ticket_with_ai(ticket_id: int, analysis_type: str):
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
 
 # Funciones de IA (mock por ahora)
 async def predict_solution(ticket_info: dict):
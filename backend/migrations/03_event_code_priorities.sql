@@ -0,0 +1,27 @@
+-- Prioridad y descripción de eventos asignadas al ingresar
+-- La receptora toma priority y description de event_codes (en memoria) y las
+-- guarda en cada evento; /events/history ya no necesita unir con event_codes.
+
+ALTER TABLE events ADD COLUMN IF NOT EXISTS description TEXT;
+
+-- Completar eventos existentes
+UPDATE events e
+SET description = ec.description,
+    priority = ec.priority
+FROM event_codes ec
+WHERE ec.protocol = e.event_type
+  AND ec.code = e.code
+  AND e.description IS NULL;
+
+-- Avisar a la receptora cuando cambia la tabla de códigos (EVENT_CODES_CHANNEL)
+CREATE OR REPLACE FUNCTION notify_event_codes_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('event_codes_changed', '{}');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS event_codes_changed ON event_codes;
+CREATE TRIGGER event_codes_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON event_codes
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_event_codes_changed();
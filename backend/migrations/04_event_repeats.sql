@@ -0,0 +1,6 @@
+-- Tormentas de eventos agrupadas por la receptora (alarm_server/coalesce.py)
+-- Un evento resumen representa repeat_count tramas iguales recibidas entre
+-- timestamp y last_timestamp.
+
+ALTER TABLE events ADD COLUMN IF NOT EXISTS repeat_count INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE events ADD COLUMN IF NOT EXISTS last_timestamp TIMESTAMP WITH TIME ZONE;
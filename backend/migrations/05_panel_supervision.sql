@@ -0,0 +1,10 @@
+-- Supervisión de paneles (alarm_server/supervision.py)
+-- supervision_interval: segundos máximos entre reportes del panel; NULL = sin
+-- supervisión. Si se excede, la receptora genera un evento YC.
+
+ALTER TABLE alarm_panels ADD COLUMN IF NOT EXISTS supervision_interval INTEGER;
+
+INSERT INTO event_codes (protocol, code, description, priority) VALUES
+('SIA', 'YC', 'Falla de comunicación (supervisión perdida)', 2),
+('SIA', 'YK', 'Comunicación restablecida', 3)
+ON CONFLICT (protocol, code) DO NOTHING;
@@ -0,0 +1,21 @@
+-- Aviso de eventos nuevos y procesados a las consolas (app/core/event_push.py)
+-- Cada alta o cambio de processed emite un NOTIFY en EVENTS_CHANNEL con el id
+-- del evento; la API lo lee con LISTEN y lo reenvía por /ws/events. Los NOTIFY
+-- se entregan al confirmar la transacción, así que un lote de la receptora
+-- llega entero o no llega.
+
+CREATE OR REPLACE FUNCTION notify_events_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('events_changed', json_build_object(
+        'op', lower(TG_OP),
+        'id', NEW.id,
+        'processed', NEW.processed
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS events_changed ON events;
+CREATE TRIGGER events_changed
+    AFTER INSERT OR UPDATE OF processed ON events
+    FOR EACH ROW EXECUTE FUNCTION notify_events_changed();
@@ -0,0 +1,31 @@
+-- Índices para la paginación por keyset de los listados (app/core/pagination.py)
+-- Cada índice repite exactamente las expresiones del Keyset del endpoint, en el
+-- mismo orden: así Postgres arranca el recorrido en la clave del cursor y lee
+-- solo las filas de la página, sin importar qué tan profunda sea.
+
+-- /events/history: pendientes de prioridad 1, resto de pendientes, procesados;
+-- dentro de cada grupo los más recientes primero
+CREATE INDEX IF NOT EXISTS idx_events_history_keyset ON events (
+    (CASE WHEN processed = FALSE AND priority = 1 THEN 3
+          WHEN processed = FALSE THEN 2
+          ELSE 1 END) DESC,
+    (COALESCE(timestamp, 'infinity')) DESC,
+    id DESC
+);
+
+-- /clients
+CREATE INDEX IF NOT EXISTS idx_clients_name_keyset ON clients (name, id);
+
+-- /inventory
+CREATE INDEX IF NOT EXISTS idx_inventory_items_keyset ON inventory_items (
+    (COALESCE(category, '')),
+    (COALESCE(name, '')),
+    id
+);
+
+-- /technical-services y /map/service-locations
+CREATE INDEX IF NOT EXISTS idx_technical_services_keyset ON technical_services (
+    (COALESCE(priority, 32767)),
+    (COALESCE(scheduled_date, 'infinity')),
+    id
+);
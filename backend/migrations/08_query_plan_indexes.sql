@@ -0,0 +1,39 @@
+-- Índices para las consultas frecuentes de main.py y app/core/event_push.py
+-- Cada uno indica la consulta que cubre. app/core/check_query_plans.py
+-- verifica con EXPLAIN que ninguna vuelva a recorrer completa una tabla grande.
+
+-- Eventos pendientes: /events/pending, la recarga del publicador y el conteo
+-- del dashboard. Parcial, así solo contiene los pocos eventos sin procesar y
+-- ya está en el orden de la consola (prioridad, más recientes primero).
+CREATE INDEX IF NOT EXISTS idx_events_pending ON events (priority, timestamp DESC)
+    WHERE processed = FALSE;
+
+-- idx_events_processed (booleano, casi todo TRUE) queda cubierto por el parcial
+DROP INDEX IF EXISTS idx_events_processed;
+
+-- Historial de acciones de un evento (/events/{id}/details), ya ordenado
+CREATE INDEX IF NOT EXISTS idx_event_logs_event_created ON event_logs (event_id, created_at DESC);
+DROP INDEX IF EXISTS idx_event_logs_event_id;
+
+-- Paneles activos en las últimas 24 h (/dashboard/stats)
+CREATE INDEX IF NOT EXISTS idx_alarm_panels_last_connection ON alarm_panels (last_connection);
+
+-- Servicios por fecha (/technician-routes/optimize, /map/service-locations,
+-- filtros from_date/to_date); las consultas usan rangos sobre la columna
+-- en lugar de scheduled_date::date para poder usarlo
+CREATE INDEX IF NOT EXISTS idx_technical_services_scheduled_date ON technical_services (scheduled_date);
+
+-- Los listados de servicios hacen LEFT JOIN por service_id
+CREATE INDEX IF NOT EXISTS idx_service_assignments_service ON service_assignments (service_id);
+
+-- Notificaciones de un usuario, más recientes primero (/notifications).
+-- La tabla no está en las migraciones base: solo se indexa si existe.
+DO $$
+BEGIN
+    IF to_regclass('notifications') IS NOT NULL THEN
+        CREATE INDEX IF NOT EXISTS idx_notifications_user_created
+            ON notifications (user_id, created_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_notifications_user_unread
+            ON notifications (user_id, created_at DESC) WHERE read = FALSE;
+    END IF;
+END $$;
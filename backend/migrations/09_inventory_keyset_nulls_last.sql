@@ -0,0 +1,12 @@
+-- /inventory: el keyset de 07 ordenaba categoría y nombre sin valor primero
+-- (COALESCE a ''); el listado original (ORDER BY i.category, i.name) los deja
+-- al final. El índice repite las expresiones del nuevo INVENTORY_ORDER de main.py
+DROP INDEX IF EXISTS idx_inventory_items_keyset;
+
+CREATE INDEX IF NOT EXISTS idx_inventory_items_keyset ON inventory_items (
+    (category IS NULL),
+    (COALESCE(category, '')),
+    (name IS NULL),
+    (COALESCE(name, '')),
+    id
+);
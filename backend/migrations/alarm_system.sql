@@ -24,7 +24,8 @@ CREATE TABLE IF NOT EXISTS alarm_panels (
     port INTEGER,
     notes TEXT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    last_connection TIMESTAMP WITH TIME ZONE
+    last_connection TIMESTAMP WITH TIME ZONE,
+    supervision_interval INTEGER
 );
 
 CREATE TABLE IF NOT EXISTS panel_zones (
@@ -52,7 +53,10 @@ CREATE TABLE IF NOT EXISTS events (
     processed BOOLEAN DEFAULT FALSE,
     processed_by INTEGER REFERENCES users(id),
     processed_at TIMESTAMP WITH TIME ZONE,
-    priority INTEGER DEFAULT 3
+    priority INTEGER DEFAULT 3,
+    description TEXT,
+    repeat_count INTEGER NOT NULL DEFAULT 1,
+    last_timestamp TIMESTAMP WITH TIME ZONE
 );
 
 CREATE TABLE IF NOT EXISTS event_logs (
@@ -100,5 +104,7 @@ INSERT INTO event_codes (protocol, code, description, priority) VALUES
 ('SIA', 'AT', 'Problema de AC', 2),
 ('SIA', 'AR', 'Restauración de AC', 3),
 ('SIA', 'YT', 'Problema de batería', 2),
-('SIA', 'YR', 'Restauración de batería', 3)
+('SIA', 'YR', 'Restauración de batería', 3),
+('SIA', 'YC', 'Falla de comunicación (supervisión perdida)', 2),
+('SIA', 'YK', 'Comunicación restablecida', 3)
 ON CONFLICT (protocol, code) DO NOTHING; 
\ No newline at end of file
@@ -0,0 +1,174 @@
+"""Pipeline de etapas asyncio con colas acotadas.
+
+Cada etapa tiene su propia cola y una cantidad configurable de workers, así
+una etapa lenta (por ejemplo la verificación con IA) solo acumula trabajo en
+su cola y no frena a las demás. Las colas son de prioridad: un elemento de
+prioridad 1 pasa adelante en cada etapa compartida y, si la etapa es
+opcional, directamente la saltea (carril rápido). Cuando una cola está llena
+el worker de la etapa anterior espera, de modo que la presión llega hasta
+submit().
+
+Las etapas opcionales que fallan o exceden su timeout no descartan el
+elemento: sigue a la siguiente etapa sin ese resultado.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[object], Awaitable[object]]
+
+
+class Stage:
+    def __init__(self, name: str, handler: Handler, workers: int = 1, max_queue: int = 1000,
+                 optional: bool = False, timeout: Optional[float] = None):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.optional = optional
+        self.timeout = timeout
+        self.queue: "asyncio.PriorityQueue[tuple]" = asyncio.PriorityQueue(max_queue)
+        self.busy = 0
+        self.stats = {
+            'processed': 0,
+            'errors': 0,
+            'timeouts': 0,
+            'max_queue_depth': 0,
+            'run_ms_total': 0.0,
+            'run_ms_max': 0.0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+        }
+
+    def metrics(self) -> dict:
+        processed = self.stats['processed']
+        return {
+            'workers': self.workers,
+            'busy': self.busy,
+            'queue_depth': self.queue.qsize(),
+            'avg_run_ms': self.stats['run_ms_total'] / processed if processed else 0.0,
+            'avg_wait_ms': self.stats['wait_ms_total'] / processed if processed else 0.0,
+            **self.stats,
+        }
+
+
+class _Job:
+    __slots__ = ('data', 'priority', 'future', 'queued_at')
+
+    def __init__(self, data, priority: int, future: asyncio.Future):
+        self.data = data
+        self.priority = priority
+        self.future = future
+        self.queued_at = 0.0
+
+
+class Pipeline:
+    def __init__(self, stages: List[Stage], priority_of: Callable[[object], Optional[int]] = lambda data: None,
+                 fast_lane_priority: int = 1):
+        self.stages = stages
+        self.priority_of = priority_of
+        self.fast_lane_priority = fast_lane_priority
+        self.tasks: List[asyncio.Task] = []
+        self._order = itertools.count()
+        self.stats = {'submitted': 0, 'completed': 0, 'dropped': 0, 'failed': 0, 'fast_lane': 0}
+
+    def start(self):
+        for index, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                self.tasks.append(asyncio.create_task(self._worker(index)))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks.clear()
+
+    async def submit(self, data, priority: int = 3) -> asyncio.Future:
+        """Encola un elemento en la primera etapa; el futuro se resuelve al salir del pipeline"""
+        job = _Job(data, priority, asyncio.get_running_loop().create_future())
+        self.stats['submitted'] += 1
+        if priority <= self.fast_lane_priority:
+            self.stats['fast_lane'] += 1
+        await self._put(0, job)
+        return job.future
+
+    async def _put(self, index: int, job: _Job):
+        stage = self.stages[index]
+        job.queued_at = time.perf_counter()
+        await stage.queue.put((job.priority, next(self._order), job))
+        stage.stats['max_queue_depth'] = max(stage.stats['max_queue_depth'], stage.queue.qsize())
+
+    def _next_stage(self, index: int, job: _Job) -> Optional[int]:
+        fast = job.priority <= self.fast_lane_priority
+        for next_index in range(index + 1, len(self.stages)):
+            if not (fast and self.stages[next_index].optional):
+                return next_index
+        return None
+
+    async def _run(self, stage: Stage, job: _Job):
+        if stage.timeout is None:
+            return await stage.handler(job.data)
+        return await asyncio.wait_for(stage.handler(job.data), stage.timeout)
+
+    async def _worker(self, index: int):
+        stage = self.stages[index]
+        while True:
+            _, _, job = await stage.queue.get()
+            start = time.perf_counter()
+            wait_ms = (start - job.queued_at) * 1000
+            stage.stats['wait_ms_total'] += wait_ms
+            stage.stats['wait_ms_max'] = max(stage.stats['wait_ms_max'], wait_ms)
+            stage.busy += 1
+            try:
+                result = await self._run(stage, job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    stage.stats['timeouts'] += 1
+                else:
+                    stage.stats['errors'] += 1
+                if not stage.optional:
+                    self.stats['failed'] += 1
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                    continue
+                # Etapa opcional: se sigue sin su resultado
+                logger.warning(f"Etapa {stage.name} omitida: {e!r}")
+                result = job.data
+            finally:
+                stage.busy -= 1
+                run_ms = (time.perf_counter() - start) * 1000
+                stage.stats['processed'] += 1
+                stage.stats['run_ms_total'] += run_ms
+                stage.stats['run_ms_max'] = max(stage.stats['run_ms_max'], run_ms)
+
+            if result is None:
+                # La etapa descartó el elemento
+                self.stats['dropped'] += 1
+                if not job.future.done():
+                    job.future.set_result(None)
+                continue
+
+            job.data = result
+            priority = self.priority_of(result)
+            if priority is not None and priority != job.priority:
+                job.priority = priority
+                if priority <= self.fast_lane_priority:
+                    self.stats['fast_lane'] += 1
+            next_index = self._next_stage(index, job)
+            if next_index is None:
+                self.stats['completed'] += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+            else:
+                await self._put(next_index, job)
+
+    def metrics(self) -> dict:
+        return {
+            **self.stats,
+            'stages': {stage.name: stage.metrics() for stage in self.stages},
+        }
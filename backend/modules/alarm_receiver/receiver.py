@@ -1,51 +1,157 @@
 from fastapi import WebSocket
 import asyncio
-from typing import Dict, List
+from typing import Dict, List, Optional
 from datetime import datetime
 import json
 
+from alarm_server import cid
+from alarm_server.db import AsyncDBPool
+from alarm_server.event_codes import EventCodeTable
+from alarm_server.framing import parse_line
+from modules.alarm_receiver.pipeline import Pipeline, Stage
+
 class AlarmReceiver:
-    def __init__(self):
+    """Recepción de alarmas en etapas: parseo -> enriquecimiento -> verificación IA -> difusión.
+
+    Cada etapa corre con sus propios workers y cola acotada (ver pipeline.py).
+    Las alarmas de prioridad 1 van por el carril rápido: saltean
+    enriquecimiento e IA y se difunden apenas se parsean.
+
+    La prioridad y la descripción salen de la tabla event_codes (la misma que
+    usa alarm_server); los códigos que no están en la tabla usan las
+    prioridades por defecto. El pipeline arranca con la primera alarma si no
+    se llamó antes a start().
+    """
+
+    def __init__(self, parse_workers: int = 2, enrich_workers: int = 4, ai_workers: int = 2,
+                 broadcast_workers: int = 1, max_queue: int = 1000, ai_timeout: float = 5.0,
+                 event_codes: Optional[EventCodeTable] = None):
         self.active_connections: List[WebSocket] = []
         self.alarm_buffer: Dict = {}
-        
+        # Sin tabla inyectada se carga una propia al arrancar, con un pool chico
+        self._owns_event_codes = event_codes is None
+        self.event_codes = event_codes or EventCodeTable(AsyncDBPool(1, 2))
+        self._start_lock = asyncio.Lock()
+        self.pipeline = Pipeline([
+            Stage('parse', self.parse_alarm, parse_workers, max_queue),
+            Stage('enrich', self.enrich_alarm_data, enrich_workers, max_queue, optional=True),
+            Stage('ai_verification', self.verify_stage, ai_workers, max_queue, optional=True,
+                  timeout=ai_timeout),
+            Stage('broadcast', self.broadcast_stage, broadcast_workers, max_queue),
+        ], priority_of=lambda alarm: alarm.get("priority"))
+
+    async def start(self):
+        async with self._start_lock:
+            if self.pipeline.tasks:
+                return
+            if self._owns_event_codes:
+                try:
+                    await self.event_codes.load()
+                except Exception as e:
+                    print(f"Error cargando la tabla de códigos de evento, se usan las prioridades por defecto: {e}")
+            self.pipeline.start()
+
+    async def stop(self):
+        await self.pipeline.stop()
+        if self._owns_event_codes:
+            self.event_codes.db.close()
+
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
         self.active_connections.append(websocket)
-        
+
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        
+        if websocket in self.active_connections:
+            self.active_connections.remove(websocket)
+
     async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            await connection.send_text(json.dumps(message))
-            
+        # Se serializa una vez y se envía a todos a la vez
+        text = json.dumps(message, default=str)
+        connections = list(self.active_connections)
+        results = await asyncio.gather(*(c.send_text(text) for c in connections), return_exceptions=True)
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                self.disconnect(connection)
+
     async def process_alarm(self, data: str, protocol: str):
         """Procesa las alarmas entrantes CID o SIA"""
         try:
-            if protocol == "CID":
-                parsed_data = self.parse_contact_id(data)
-            elif protocol == "SIA":
-                parsed_data = self.parse_sia(data)
-            else:
-                raise ValueError(f"Protocolo no soportado: {protocol}")
-            
-            # Enriquece los datos con información adicional
-            enriched_data = await self.enrich_alarm_data(parsed_data)
-            
-            # Verifica con IA si hay cámaras disponibles
-            if enriched_data.get("has_cameras"):
-                ai_verification = await self.verify_with_ai(enriched_data)
-                enriched_data["ai_verification"] = ai_verification
-            
-            # Notifica a todos los clientes conectados
-            await self.broadcast({
-                "type": "new_alarm",
-                "data": enriched_data
-            })
-            
-            return enriched_data
-            
+            if not self.pipeline.tasks:
+                await self.start()
+            future = await self.pipeline.submit((data, protocol))
+            return await future
         except Exception as e:
             print(f"Error procesando alarma: {e}")
-            return None 
\ No newline at end of file
+            return None
+
+    async def parse_alarm(self, item) -> dict:
+        data, protocol = item
+        if protocol == "CID":
+            parsed_data = self.parse_contact_id(data)
+        elif protocol == "SIA":
+            parsed_data = self.parse_sia(data)
+        else:
+            raise ValueError(f"Protocolo no soportado: {protocol}")
+        parsed_data["received_at"] = datetime.now().isoformat()
+        return parsed_data
+
+    def parse_contact_id(self, data: str) -> dict:
+        event = cid.decode(data)
+        priority, description = self.event_codes.classify_cid(event.qualifier, event.event_code)
+        return {
+            "protocol": "CID",
+            "account": event.account,
+            "code": event.code,
+            "qualifier": event.qualifier,
+            "event_code": event.event_code,
+            "partition": event.partition,
+            "zone_user": event.zone_user,
+            "priority": priority,
+            "description": description,
+            "raw_message": data
+        }
+
+    def parse_sia(self, data: str) -> dict:
+        frame = parse_line(data.encode())
+        if frame.protocol != "SIA" or not frame.valid:
+            raise ValueError(f"Mensaje SIA inválido: {data!r}")
+        priority, description = self.event_codes.classify_sia(frame.code)
+        return {
+            "protocol": "SIA",
+            "account": frame.account,
+            "code": frame.code,
+            "qualifier": frame.code[0],
+            "zone_user": frame.zone,
+            "priority": priority,
+            "description": description,
+            "raw_message": data
+        }
+
+    async def enrich_alarm_data(self, alarm: dict) -> dict:
+        """Enriquece los datos con información adicional (se redefine por instalación)"""
+        alarm.setdefault("has_cameras", False)
+        return alarm
+
+    async def verify_with_ai(self, alarm: dict) -> Optional[dict]:
+        """Verificación con IA de las cámaras asociadas (se redefine por instalación)"""
+        return None
+
+    async def verify_stage(self, alarm: dict) -> dict:
+        # Verifica con IA si hay cámaras disponibles
+        if alarm.get("has_cameras"):
+            alarm["ai_verification"] = await self.verify_with_ai(alarm)
+        return alarm
+
+    async def broadcast_stage(self, alarm: dict) -> dict:
+        # Notifica a todos los clientes conectados
+        await self.broadcast({
+            "type": "new_alarm",
+            "data": alarm
+        })
+        return alarm
+
+    def metrics(self) -> dict:
+        return {
+            "connections": len(self.active_connections),
+            **self.pipeline.metrics()
+        }
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import uvicorn
 import multiprocessing
@@ -6,11 +7,13 @@ import os
 import logging
 import time
 import socket
+from typing import Optional
 
 # Agregar el directorio actual al PYTHONPATH
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from alarm_server.receiver import AlarmReceiver
+from alarm_server.supervisor import ReceiverSupervisor, default_workers, reuse_port_supported
 
 # Configurar logging
 logging.basicConfig(
@@ -19,10 +22,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def run_alarm_server():
+def run_alarm_server(workers: int = 1, capture_dir: Optional[str] = None):
     try:
+        if workers > 1:
+            logger.info(f"Iniciando servidor de alarmas en puerto 9999 con {workers} workers (SO_REUSEPORT)...")
+            ReceiverSupervisor(host='127.0.0.1', port=9999, workers=workers, capture_dir=capture_dir).run()
+            return
+
         logger.info("Iniciando servidor de alarmas en puerto 9999...")
-        receiver = AlarmReceiver(host='127.0.0.1', port=9999)
+        receiver = AlarmReceiver(host='127.0.0.1', port=9999, capture_dir=capture_dir)
         logger.info("Servidor de alarmas creado, iniciando...")
         asyncio.run(receiver.start())
     except Exception as e:
@@ -91,6 +99,22 @@ def check_services():
         logger.error(f"Error verificando servicios: {e}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inicia la receptora de alarmas y la API")
+    parser.add_argument(
+        "--alarm-workers", type=int, default=default_workers(),
+        help="Procesos de la receptora compartiendo el puerto (por defecto, uno por núcleo)"
+    )
+    parser.add_argument(
+        "--alarm-capture-dir",
+        help="Capturar el tráfico crudo de los paneles en este directorio (ver alarm_server.replay)"
+    )
+    args = parser.parse_args()
+
+    alarm_workers = args.alarm_workers
+    if alarm_workers > 1 and not reuse_port_supported():
+        logger.warning("SO_REUSEPORT no disponible en esta plataforma, se usa un único worker")
+        alarm_workers = 1
+
     # Verificar que los puertos estén disponibles
     if not check_port(9999):
         logger.error("Puerto 9999 no disponible. Intentando liberar...")
@@ -104,7 +128,7 @@ if __name__ == "__main__":
     logger.info("Iniciando servicios...")
     
     # Iniciar el servidor de alarmas
-    alarm_process = multiprocessing.Process(target=run_alarm_server)
+    alarm_process = multiprocessing.Process(target=run_alarm_server, args=(alarm_workers, args.alarm_capture_dir))
     alarm_process.start()
     logger.info(f"Proceso de servidor de alarmas iniciado con PID: {alarm_process.pid}")
 
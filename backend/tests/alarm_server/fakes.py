@@ -0,0 +1,48 @@
+"""Dobles de prueba para la receptora: ingesta y registro en memoria, sin base"""
+from alarm_server.registry import PanelInfo
+
+
+class FakeIngest:
+    def __init__(self):
+        self.events = []
+
+    async def submit(self, event):
+        self.events.append(event)
+
+    def backlog(self) -> int:
+        return 0
+
+    async def run(self):
+        pass
+
+    def metrics(self) -> dict:
+        return {'events': len(self.events)}
+
+
+class FakeRegistry:
+    def __init__(self, *panels: PanelInfo, error: Exception = None):
+        self.by_account = {panel.account_number: panel for panel in panels}
+        self.by_id = {panel.panel_id: panel for panel in panels}
+        self.error = error
+        self.lookups = 0
+
+    async def get(self, account):
+        self.lookups += 1
+        if self.error:
+            raise self.error
+        return self.by_account.get(account)
+
+
+def make_receiver(*panels: PanelInfo, error: Exception = None, **kwargs):
+    from alarm_server.receiver import AlarmReceiver
+
+    ingest = FakeIngest()
+    receiver = AlarmReceiver(ingest=ingest, udp=False, spool_dir=None, **kwargs)
+    receiver.registry = receiver.supervision.registry = FakeRegistry(*panels, error=error)
+    receiver.loaded.set()
+    return receiver, ingest
+
+
+def panel(panel_id: int = 1, account: str = '1234', supervision_interval=None) -> PanelInfo:
+    return PanelInfo(panel_id=panel_id, client_id=1, account_number=account,
+                     verification_code='0000', supervision_interval=supervision_interval)
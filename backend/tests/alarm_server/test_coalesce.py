@@ -0,0 +1,91 @@
+import asyncio
+from datetime import datetime
+
+from alarm_server.coalesce import EventCoalescer
+from alarm_server.framing import parse_line
+from alarm_server.ingest import IngestEvent
+from alarm_server.supervision import PanelSupervisor
+
+from fakes import FakeIngest, FakeRegistry, make_receiver, panel
+
+
+def event(priority: int, code: str = 'E301') -> IngestEvent:
+    return IngestEvent(panel_id=1, event_type='CID', raw_message='x', code=code,
+                       zone_user='001', timestamp=datetime.now(), priority=priority)
+
+
+def test_priority_one_bypasses_groups():
+    ingest = FakeIngest()
+    coalescer = EventCoalescer(ingest)
+
+    async def run():
+        for _ in range(3):
+            await coalescer.submit(event(1, 'E130'))
+
+    asyncio.run(run())
+
+    assert len(ingest.events) == 3
+    assert not coalescer.groups
+    assert coalescer.stats['priority'] == 3
+
+
+def test_identical_burglary_frames_stored_with_coalescing():
+    receiver, ingest = make_receiver(panel())
+
+    async def run():
+        for port in (5000, 5001):
+            assert await receiver.process_frame(parse_line(b'1234 18 1130 01 003'), ('10.0.0.1', port))
+
+    asyncio.run(run())
+    assert [e.event_code for e in ingest.events] == ['130', '130']
+
+
+def test_repeats_update_first_event_instead_of_new_rows():
+    ingest = FakeIngest()
+    coalescer = EventCoalescer(ingest)
+
+    async def run():
+        for _ in range(3):
+            await coalescer.submit(event(3))
+        await coalescer.close()
+
+    asyncio.run(run())
+
+    assert [(e.repeat, e.repeat_count) for e in ingest.events] == [(False, 1), (True, 2), (True, 3)]
+    first = ingest.events[0]
+    assert all(e.timestamp == first.timestamp for e in ingest.events)
+    assert coalescer.stats['storms'] == 1 and coalescer.stats['coalesced'] == 2
+    assert not coalescer.groups
+
+
+def test_repeat_naked_when_first_event_not_stored():
+    class FailingIngest(FakeIngest):
+        async def submit(self, event):
+            await asyncio.sleep(0)
+            raise RuntimeError('journal sin espacio')
+
+    coalescer = EventCoalescer(FailingIngest())
+
+    async def run():
+        return await asyncio.gather(coalescer.submit(event(3)), coalescer.submit(event(3)),
+                                    return_exceptions=True)
+
+    first, repeat = asyncio.run(run())
+    assert isinstance(first, RuntimeError) and isinstance(repeat, RuntimeError)
+    assert not coalescer.groups and coalescer.stats['coalesced'] == 0
+
+
+def test_supervision_close_awaits_events():
+    ingest = FakeIngest()
+    supervised = panel(supervision_interval=60)
+    supervisor = PanelSupervisor(None, FakeRegistry(supervised), ingest, lambda code: (1, None))
+
+    async def run():
+        supervisor._emit(supervised, 'YC', 'Sin comunicación')
+        assert len(supervisor.tasks) == 1
+        await supervisor.close()
+
+    asyncio.run(run())
+
+    assert not supervisor.tasks
+    assert [e.code for e in ingest.events] == ['YC']
@@ -0,0 +1,34 @@
+import asyncio
+
+from alarm_server.event_codes import EventCodeTable
+
+
+class CodesDB:
+    def __init__(self):
+        self.loads = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def run(self, fn):
+        self.loads += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return [('SIA', 'BA', 'Robo', 1, True)]
+
+
+def test_notification_burst_coalesced_into_one_follow_up_reload():
+    db = CodesDB()
+    table = EventCodeTable(db)
+
+    async def run():
+        for _ in range(10):
+            table.handle_notification('{}')
+            await asyncio.sleep(0)
+        await table._reload
+
+    asyncio.run(run())
+    # La primera recarga y una sola más por las notificaciones que llegaron durante ella
+    assert db.loads == 2 and db.max_active == 1
+    assert table.classify_sia('BA') == (1, 'Robo')
@@ -0,0 +1,149 @@
+import asyncio
+
+from alarm_server.bench_udp import dc09_frame
+from alarm_server.framing import FrameDecoder, build_ack, parse_line
+
+from fakes import make_receiver, panel
+
+CID_FRAME = b'1234 18 1130 01 003'
+
+
+def test_registry_error_naks_frame():
+    receiver, ingest = make_receiver(error=RuntimeError('sin base'))
+    frame = parse_line(CID_FRAME)
+
+    accepted = asyncio.run(receiver.process_frame(frame, ('10.0.0.1', 5000)))
+
+    assert accepted is False
+    assert ingest.events == []
+    assert build_ack(frame, accepted) != build_ack(frame, True)
+
+
+def test_receiver_serves_while_database_down_and_naks_until_loaded():
+    receiver, ingest = make_receiver(panel(), port=0)
+    receiver.loaded.clear()
+    attempts = []
+
+    async def load():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError('sin base')
+
+    async def noop():
+        pass
+
+    receiver.registry.load = load
+    receiver.event_codes.load = noop
+    receiver.listener.run = noop
+    receiver.supervision.flush = noop
+
+    async def run():
+        task = asyncio.create_task(receiver.start())
+        while receiver.server is None:
+            await asyncio.sleep(0.01)
+        assert receiver.server.is_serving() and not receiver.loaded.is_set()
+        assert await receiver.process_frame(parse_line(CID_FRAME), ('10.0.0.1', 5000)) is False
+        await asyncio.wait_for(receiver.loaded.wait(), 5)
+        assert await receiver.process_frame(parse_line(CID_FRAME), ('10.0.0.1', 5000)) is True
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert len(attempts) == 3
+    assert len(ingest.events) == 1
+
+
+def test_account_resolved_once_per_frame():
+    receiver, ingest = make_receiver(panel())
+
+    accepted = asyncio.run(receiver.process_frame(parse_line(CID_FRAME), ('10.0.0.1', 5000)))
+
+    assert accepted is True
+    assert receiver.registry.lookups == 1
+    assert [e.event_code for e in ingest.events] == ['130']
+
+
+def test_identical_cid_frames_on_separate_connections_both_stored():
+    receiver, ingest = make_receiver(panel(), coalesce_window=0)
+
+    async def run():
+        first = await receiver.process_frame(parse_line(CID_FRAME), ('10.0.0.1', 5000))
+        second = await receiver.process_frame(parse_line(CID_FRAME), ('10.0.0.2', 5001))
+        return first, second
+
+    assert asyncio.run(run()) == (True, True)
+    assert len(ingest.events) == 2
+
+
+def test_retransmission_on_same_connection_dropped():
+    receiver, ingest = make_receiver(panel(), coalesce_window=0)
+
+    async def run():
+        for _ in range(2):
+            assert await receiver.process_frame(parse_line(CID_FRAME), ('10.0.0.1', 5000))
+
+    asyncio.run(run())
+    assert len(ingest.events) == 1
+
+
+def test_sequenced_retransmission_dropped_across_connections():
+    receiver, ingest = make_receiver(panel(), coalesce_window=0)
+    raw = dc09_frame('1234', 17, 3)
+
+    async def run():
+        for port in (5000, 5001):
+            (frame,) = FrameDecoder().feed(raw)
+            assert await receiver.process_frame(frame, ('10.0.0.1', port))
+
+    asyncio.run(run())
+    assert len(ingest.events) == 1
+
+
+def test_udp_close_awaits_inflight_datagrams():
+    from alarm_server.udp import AlarmDatagramProtocol
+
+    receiver, ingest = make_receiver(panel())
+    protocol = AlarmDatagramProtocol(receiver)
+    sent = []
+
+    class Transport:
+        def sendto(self, data, addr):
+            sent.append(data)
+
+    async def run():
+        protocol.connection_made(Transport())
+        protocol.datagram_received(dc09_frame('1234', 1, 3), ('10.0.0.1', 5000))
+        assert len(protocol.tasks) == 1
+        await protocol.close()
+
+    asyncio.run(run())
+
+    assert not protocol.tasks
+    assert len(ingest.events) == 1 and len(sent) == 1
+
+
+def test_batcher_flush_inserts_queued_events_before_stop():
+    from alarm_server.ingest import EventBatcher, IngestEvent
+
+    class SlowDB:
+        def __init__(self):
+            self.rows = 0
+
+        async def run(self, fn, events):
+            await asyncio.sleep(0.01)
+            self.rows += len(events)
+
+    db = SlowDB()
+    batcher = EventBatcher(db, max_batch=2)
+
+    async def run():
+        writers = asyncio.create_task(batcher.run())
+        submits = [asyncio.create_task(batcher.submit(IngestEvent(1, 'CID', 'x', 'E130'))) for _ in range(5)]
+        await asyncio.sleep(0)
+        await batcher.flush()
+        writers.cancel()
+        await asyncio.gather(writers, return_exceptions=True)
+        return await asyncio.gather(*submits)
+
+    asyncio.run(run())
+    assert db.rows == 5
@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+from alarm_server.registry import PanelRegistry
+
+from fakes import panel
+
+
+class PanelDB:
+    def __init__(self, *panels, error: Exception = None):
+        self.panels = {p.panel_id: p for p in panels}
+        self.error = error
+
+    async def run(self, fn, where='', params=()):
+        await asyncio.sleep(0)
+        if self.error:
+            raise self.error
+        return {i: p for i, p in self.panels.items() if not params or params[0] == i}
+
+
+def test_notification_refresh_is_tracked_until_done():
+    registry = PanelRegistry(PanelDB(panel(7, '7777')))
+
+    async def run():
+        registry.handle_notification(json.dumps({'op': 'update', 'id': 7}))
+        assert len(registry.tasks) == 1
+        await asyncio.gather(*registry.tasks)
+
+    asyncio.run(run())
+    assert registry.by_account['7777'].panel_id == 7
+    assert not registry.tasks
+
+
+def test_failed_refresh_keeps_previous_panel(caplog):
+    registry = PanelRegistry(PanelDB(error=RuntimeError('sin base')))
+    registry._put(panel(7, '7777'))
+
+    async def run():
+        registry.handle_notification(json.dumps({'op': 'update', 'id': 7}))
+        await asyncio.gather(*registry.tasks)
+
+    asyncio.run(run())
+    assert registry.by_id[7].account_number == '7777'
+    assert 'Error recargando el panel 7' in caplog.text
@@ -0,0 +1,34 @@
+import asyncio
+import random
+
+import pytest
+
+from alarm_server.framing import FrameDecoder
+from alarm_server.simulator import LoadGenerator
+
+from fakes import make_receiver, panel
+
+
+def test_account_range_overflow_rejected():
+    with pytest.raises(ValueError):
+        LoadGenerator(panels=1000, account_start=9500)
+
+    assert LoadGenerator(panels=1000, account_start=9000).accounts[-1] == '9999'
+
+
+def test_load_frames_are_not_swallowed():
+    # Con la ventana de duplicados y la agrupación activas cada trama generada
+    # debe terminar como un evento
+    generator = LoadGenerator(panels=2, account_start=1000)
+    receiver, ingest = make_receiver(panel(1, '1000'), panel(2, '1001'))
+    rnd = random.Random(7)
+
+    async def run():
+        for _ in range(300):
+            (frame,) = FrameDecoder().feed(generator.build_frame(rnd))
+            assert await receiver.process_frame(frame, ('10.0.0.1', 5000))
+
+    asyncio.run(run())
+
+    assert len(ingest.events) == 300
+    assert receiver.coalescer.stats['coalesced'] == 0
@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime
+
+from alarm_server.ingest import IngestEvent, insert_events
+from alarm_server.spool import EventSpool, orphan_directories, worker_directory
+
+
+class RecordingDB:
+    def __init__(self):
+        self.inserted = []
+
+    async def run(self, fn, *args):
+        assert fn is insert_events
+        self.inserted.extend(args[0])
+
+
+def event(n: int) -> IngestEvent:
+    return IngestEvent(panel_id=1, event_type='CID', raw_message=f'evento {n}', code='E130',
+                       timestamp=datetime(2024, 1, 1))
+
+
+async def write_journal(directory: str, count: int):
+    spool = EventSpool(RecordingDB(), directory, fsync_delay=0)
+    spool.open()
+    fsync = asyncio.create_task(spool._fsync_loop())
+    for n in range(count):
+        await spool.submit(event(n))
+    fsync.cancel()
+    spool.close()
+
+
+def test_shrinking_workers_drains_stranded_journals(tmp_path):
+    root = str(tmp_path)
+
+    async def scenario():
+        # Corrida anterior: 4 workers y, antes, el modo de un solo proceso en la raíz
+        for index in range(4):
+            await write_journal(worker_directory(root, index), 5)
+        await write_journal(root, 3)
+
+        # Ahora 2 workers: lo de worker-2, worker-3 y la raíz no tiene dueño
+        orphans = orphan_directories(root, [worker_directory(root, i) for i in range(2)])
+        assert orphans == [root, worker_directory(root, 2), worker_directory(root, 3)]
+
+        db = RecordingDB()
+        for directory in orphans:
+            spool = EventSpool(db, directory)
+            spool.open()
+            await spool.drain(poll=0.01)
+        return db
+
+    db = asyncio.run(scenario())
+    assert len(db.inserted) == 13
+    # Los journals volcados se borran: el próximo arranque no encuentra huérfanos
+    assert orphan_directories(root, [worker_directory(root, i) for i in range(2)]) == []
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['worker-0', 'worker-1']
+    # Ya volcados (checkpoint al día): una nueva pasada no los vuelve a insertar
+    db_again = RecordingDB()
+
+    async def again():
+        spool = EventSpool(db_again, worker_directory(root, 3))
+        spool.open()
+        await spool.drain(poll=0.01)
+
+    asyncio.run(again())
+    assert db_again.inserted == []
+
+
+def test_single_process_adopts_worker_journals(tmp_path):
+    root = str(tmp_path)
+    asyncio.run(write_journal(worker_directory(root, 0), 2))
+
+    assert orphan_directories(root, [root]) == [worker_directory(root, 0)]
+
+
+def test_drain_waits_for_fsync(tmp_path):
+    async def scenario():
+        db = RecordingDB()
+        spool = EventSpool(db, str(tmp_path), fsync_delay=0)
+        spool.open()
+        drain = asyncio.create_task(spool._drain_loop())
+        for n in range(3):
+            spool._append(event(n))
+        spool._has_data.set()
+        await asyncio.sleep(0.05)
+        before_fsync = len(db.inserted)
+
+        fsync = asyncio.create_task(spool._fsync_loop())
+        spool._dirty.set()
+        await asyncio.sleep(0.05)
+        for task in (drain, fsync):
+            task.cancel()
+        spool.close()
+        return before_fsync, len(db.inserted)
+
+    assert asyncio.run(scenario()) == (0, 3)
+
+
+def test_drained_segments_are_removed(tmp_path):
+    async def scenario():
+        db = RecordingDB()
+        spool = EventSpool(db, str(tmp_path), segment_size=256, fsync_delay=0)
+        spool.open()
+        tasks = [asyncio.create_task(spool.run())]
+        for n in range(20):
+            await spool.submit(event(n))
+        await asyncio.sleep(0.05)
+        tasks[0].cancel()
+        spool.close()
+        return db, spool
+
+    db, spool = asyncio.run(scenario())
+    assert len(db.inserted) == 20
+    assert len(spool.segments) == 1
+    assert sorted(p.name for p in tmp_path.glob('*.seg')) == [f'{spool.segments[0]:020d}.seg']
+    assert spool.metrics()['journal_bytes'] == spool.segment_bytes[spool.segments[0]]
@@ -0,0 +1,137 @@
+import asyncio
+import time
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+
+from alarm_server.supervision import (PanelSupervisor, fetch_already_lost, fetch_last_connection,
+                                      update_last_connection)
+
+from fakes import FakeIngest, FakeRegistry, panel
+
+
+class FakeDB:
+    """Responde las consultas de supervisión desde diccionarios"""
+
+    def __init__(self, last_connection=None, already_lost=None):
+        self.last_connection = last_connection or {}
+        self.already_lost = already_lost or {}
+        self.calls = []
+
+    async def run(self, fn, *args):
+        self.calls.append(fn)
+        if fn is fetch_last_connection:
+            return {i: self.last_connection.get(i) for i in args[0]}
+        if fn is fetch_already_lost:
+            return {i: v for i, v in self.already_lost.items() if i in args[0]}
+        if fn is update_last_connection:
+            return None
+        raise AssertionError(fn)
+
+
+def ago(seconds: float) -> datetime:
+    return datetime.now(timezone.utc) - timedelta(seconds=seconds)
+
+
+def supervisor(*panels, db=None, **kwargs):
+    ingest = FakeIngest()
+    sup = PanelSupervisor(db or FakeDB(), FakeRegistry(*panels), ingest, lambda code: (2, None), **kwargs)
+    return sup, ingest
+
+
+def silent(panel_id=1, seconds=600):
+    return replace(panel(panel_id, f'{panel_id:04d}', supervision_interval=60), last_connection=ago(seconds))
+
+
+def codes(ingest):
+    return [e.code for e in ingest.events]
+
+
+def test_panel_silent_before_restart_is_reported():
+    sup, ingest = supervisor(silent())
+
+    async def run():
+        await sup.seed()
+        await sup.check(time.monotonic() + 1)
+        await sup.close()
+
+    asyncio.run(run())
+    assert codes(ingest) == ['YC']
+    assert 1 in sup.lost
+
+
+def test_loss_already_reported_before_restart_not_repeated():
+    last = ago(600)
+    sup, ingest = supervisor(silent(), db=FakeDB(already_lost={1: last}))
+
+    async def run():
+        await sup.seed()
+        await sup.check(time.monotonic() + 1)
+        await sup.close()
+
+    asyncio.run(run())
+    assert codes(ingest) == []
+    assert sup.lost == {1: last}
+
+
+def test_recent_panel_seeded_with_remaining_time():
+    recent = silent(seconds=10)
+    sup, ingest = supervisor(recent)
+
+    async def run():
+        await sup.seed()
+        await sup.check(time.monotonic() + 5)
+        await sup.close()
+
+    asyncio.run(run())
+    assert codes(ingest) == []
+    assert 1 in sup.wheel
+
+
+def test_non_supervising_worker_only_tracks_activity():
+    db = FakeDB()
+    sup, ingest = supervisor(silent(), db=db, supervise=False)
+
+    async def run():
+        await sup.seed()
+        sup.seen(sup.registry.by_id[1])
+        await sup.check(time.monotonic() + 3600)
+        await sup.close()
+
+    asyncio.run(run())
+    assert codes(ingest) == []
+    assert len(sup.wheel) == 0
+    assert db.calls == [update_last_connection]
+
+
+def test_shared_expiry_confirmed_against_database():
+    # El panel se reportó a otro worker hace 5 s: no se da por perdido
+    db = FakeDB(last_connection={1: ago(5)})
+    sup, ingest = supervisor(silent(), db=db, shared=True)
+
+    async def run():
+        await sup.seed()
+        await sup.check(time.monotonic() + 1)
+        await sup.close()
+
+    asyncio.run(run())
+    assert codes(ingest) == []
+    assert fetch_last_connection in db.calls
+    assert 1 in sup.wheel and 1 not in sup.lost
+
+
+def test_shared_restore_from_database():
+    last = ago(600)
+    db = FakeDB(last_connection={1: last}, already_lost={1: last})
+    sup, ingest = supervisor(silent(), db=db, shared=True)
+
+    async def run():
+        await sup.seed()
+        await sup.check_restored()
+        assert codes(ingest) == []
+        db.last_connection[1] = ago(1)
+        await sup.check_restored()
+        await sup.close()
+
+    asyncio.run(run())
+    assert codes(ingest) == ['YK']
+    assert not sup.lost and 1 in sup.wheel
@@ -0,0 +1,29 @@
+import os
+import socket
+import time
+
+import pytest
+
+from alarm_server.supervisor import ReceiverSupervisor, reuse_port_supported
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.skipif(not reuse_port_supported(), reason="sin SO_REUSEPORT")
+def test_stop_closes_workers_gracefully(tmp_path):
+    # Sin base: el worker arranca igual (el registro se carga en segundo plano)
+    spool = tmp_path / 'spool'
+    supervisor = ReceiverSupervisor(port=free_port(), workers=1, spool_dir=str(spool))
+    supervisor._spawn(0)
+    deadline = time.monotonic() + 10
+    while not os.path.isdir(spool / 'worker-0') and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    supervisor.stop(timeout=10)
+
+    # Terminó por su cuenta (código 0), no por la señal (-15) ni por kill (-9)
+    assert supervisor.processes[0].exitcode == 0
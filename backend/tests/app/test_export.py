@@ -0,0 +1,39 @@
+import asyncio
+
+from app.core import export
+from app.core.export import stream_export
+
+
+def fake_rows(columns, batches):
+    def iter_rows(query, params, batch_size=2000):
+        yield list(columns)
+        yield from batches
+    return iter_rows
+
+
+def body(response) -> str:
+    async def collect():
+        return "".join([chunk async for chunk in response.body_iterator])
+    return asyncio.run(collect())
+
+
+def test_empty_csv_export_still_has_header(monkeypatch):
+    monkeypatch.setattr(export, "iter_rows", fake_rows(["id", "name"], []))
+
+    assert body(stream_export("SELECT", [], "csv", "vacio")) == "id,name\r\n"
+    assert body(stream_export("SELECT", [], "ndjson", "vacio")) == ""
+
+
+def test_csv_header_includes_transform_columns(monkeypatch):
+    monkeypatch.setattr(export, "iter_rows", fake_rows(["id", "total"], [[{"id": 1, "total": 4}]]))
+
+    def double(row):
+        row["double"] = row["total"] * 2
+        return row
+
+    response = stream_export("SELECT", [], "csv", "stats", transform=double, extra_columns=["double"])
+    assert body(response) == "id,total,double\r\n1,4,8\r\n"
+
+    monkeypatch.setattr(export, "iter_rows", fake_rows(["id", "total"], []))
+    response = stream_export("SELECT", [], "csv", "stats", transform=double, extra_columns=["double"])
+    assert body(response) == "id,total,double\r\n"
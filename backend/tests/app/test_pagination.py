@@ -0,0 +1,48 @@
+from app.core.pagination import DEFAULT_PAGE_SIZE, Keyset, fetch_page
+
+KEYSET = Keyset("name", "id")
+
+
+class FakeCursor:
+    """Devuelve rows según el LIMIT de la consulta y guarda lo ejecutado"""
+
+    def __init__(self, count: int):
+        self.rows = [{"_page_key_0": f"c{i:04d}", "_page_key_1": str(i), "id": i} for i in range(count)]
+        self.executed = []
+
+    def execute(self, query, params):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        query, params = self.executed[-1]
+        return self.rows[:params[-1]] if "LIMIT" in query else self.rows
+
+
+def test_without_cursor_or_limit_returns_everything():
+    cur = FakeCursor(250)
+
+    page = fetch_page(cur, KEYSET, "SELECT * FROM clients WHERE 1=1", [])
+
+    assert len(page["data"]) == 250
+    assert page["next_cursor"] is None and page["limit"] is None
+    assert "LIMIT" not in cur.executed[-1][0]
+
+
+def test_limit_or_cursor_paginates():
+    cur = FakeCursor(250)
+
+    page = fetch_page(cur, KEYSET, "SELECT * FROM clients WHERE 1=1", [], limit=50)
+    assert len(page["data"]) == 50 and page["next_cursor"]
+
+    page = fetch_page(cur, KEYSET, "SELECT * FROM clients WHERE 1=1", [], cursor=page["next_cursor"])
+    assert page["limit"] == DEFAULT_PAGE_SIZE
+    assert cur.executed[-1][1] == ["c0049", "49", DEFAULT_PAGE_SIZE + 1]
+
+
+def test_tiebreak_keys_outside_index_keep_indexed_prefix():
+    keyset = Keyset("ts.priority", "ts.id", "COALESCE(sa.id, 0)", indexed=2)
+    cursor = keyset.encode(["1", "10", "3"])
+
+    assert keyset.condition() == ("(ts.priority, ts.id) >= (%s, %s) AND "
+                                  "(ts.priority, ts.id, COALESCE(sa.id, 0)) > (%s, %s, %s)")
+    assert keyset.bind(cursor) == ["1", "10", "1", "10", "3"]
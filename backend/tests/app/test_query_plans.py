@@ -0,0 +1,27 @@
+import psycopg2
+import pytest
+
+from app.config.database import DB_CONFIG
+from app.core import check_query_plans
+
+
+@pytest.fixture
+def cur():
+    try:
+        conn = psycopg2.connect(connect_timeout=3, **DB_CONFIG)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Base no disponible: {e}")
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('idx_events_pending') IS NOT NULL")
+            if not cur.fetchone()[0]:
+                pytest.skip("Migraciones de índices sin aplicar")
+            yield cur
+    finally:
+        # Los datos sintéticos nunca se confirman
+        conn.rollback()
+        conn.close()
+
+
+def test_frequent_queries_use_indexes(cur):
+    assert check_query_plans.run(cur, seed=50000) == []
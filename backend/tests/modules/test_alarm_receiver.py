@@ -0,0 +1,41 @@
+import asyncio
+
+from alarm_server.event_codes import EventCode, EventCodeTable
+from modules.alarm_receiver.receiver import AlarmReceiver
+
+
+def table(*codes: EventCode) -> EventCodeTable:
+    event_codes = EventCodeTable(None)
+    event_codes.codes = {(code.protocol, code.code): code for code in codes}
+    return event_codes
+
+
+def test_process_alarm_starts_pipeline():
+    receiver = AlarmReceiver(event_codes=table())
+
+    async def run():
+        try:
+            return await asyncio.wait_for(receiver.process_alarm('1234 18 1130 01 003', 'CID'), 2)
+        finally:
+            await receiver.stop()
+
+    alarm = asyncio.run(run())
+
+    assert alarm['account'] == '1234' and alarm['event_code'] == '130'
+    assert receiver.pipeline.stats['completed'] == 1
+
+
+def test_priority_from_event_codes_table():
+    receiver = AlarmReceiver(event_codes=table(
+        EventCode('CID', '1130', 'Robo', 2, True),
+        EventCode('SIA', 'BA', 'Alarma de robo', 1, True),
+    ))
+
+    cid_alarm = receiver.parse_contact_id('1234 18 1130 01 003')
+    sia_alarm = receiver.parse_sia('["1234"]120000,010124|BA|1')
+    unknown = receiver.parse_contact_id('1234 18 1110 01 003')
+
+    assert (cid_alarm['priority'], cid_alarm['description']) == (2, 'Robo')
+    assert (sia_alarm['priority'], sia_alarm['description']) == (1, 'Alarma de robo')
+    # Fuera de la tabla: prioridad por defecto
+    assert (unknown['priority'], unknown['description']) == (1, None)